@@ -0,0 +1,122 @@
+"""Benchmarks of the solve, batch, output and startup paths of pkmodel, in
+the format of airspeed velocity (asv): every method starting with time_ is
+timed, peakmem_ records the peak memory and timeraw_ times the returned code
+in a fresh interpreter. See the Benchmarks section of the README.
+"""
+
+import importlib.util
+import shutil
+import tempfile
+
+import numpy as np
+
+import pkmodel as pk
+from pkmodel import cache, plotting
+
+NR_COMPARTMENTS = [1, 2, 5, 10, 20, 50]
+INJECTION_TYPES = ['intravenous', 'subcutaneous']
+DOSE_MODES = ['normal', 'pulse']
+
+
+def make_model(nr_compartments=2, injection_type='intravenous',
+               dose_mode='normal', **parameters):
+    """Model with peripheral compartments of varying volume and transition
+    rate, so that the time scales of the system are spread out
+    """
+    parameters.update({
+        'name': 'benchmark', 'nr_compartments': nr_compartments,
+        'injection_type': injection_type, 'dose_mode': dose_mode,
+        'V_c': 2.0, 'CL': 5.0, 'X': 6.0, 'time': 1, 'run_mode': 'save'})
+    for i in range(1, nr_compartments + 1):
+        parameters[f'periph_{i}'] = (1.0 + i % 4, 0.5 + i % 3)
+    return pk.Protocol(parameters=parameters).generate_model()
+
+
+class Solve:
+    """Single solves of models of increasing size"""
+    params = (NR_COMPARTMENTS, INJECTION_TYPES, DOSE_MODES)
+    param_names = ['nr_compartments', 'injection_type', 'dose_mode']
+    timeout = 120
+
+    def setup(self, nr_compartments, injection_type, dose_mode):
+        self.model = make_model(nr_compartments, injection_type, dose_mode)
+
+    def time_numeric(self, nr_compartments, injection_type, dose_mode):
+        self.model.solve(solver='numeric')
+
+    def time_analytic(self, nr_compartments, injection_type, dose_mode):
+        self.model.solve(solver='analytic')
+
+    def time_rhs(self, nr_compartments, injection_type, dose_mode):
+        self.model.rhs(0.5, np.ones(self.model.rate_matrix.shape[0]))
+
+
+class SolveCached:
+    """Solves of a parameter set already in the solution cache"""
+    def setup(self):
+        self.model = make_model(10)
+        self.cache = cache.SolutionCache()
+        self.model.solve(cache=self.cache)
+
+    def time_cache_hit(self):
+        self.model.solve(cache=self.cache)
+
+
+class SolveBatch:
+    """Batch solves of a population of parameter sets"""
+    params = ([10, 100, 1000], ['analytic', 'numeric'])
+    param_names = ['batch_size', 'solver']
+    timeout = 300
+
+    def setup(self, batch_size, solver):
+        if solver == 'numeric' and batch_size > 100:
+            raise NotImplementedError('too slow to benchmark')
+        self.model = make_model(2, 'subcutaneous', 'pulse')
+        rng = np.random.default_rng(0)
+        theta = self.model.parameter_vector()
+        self.theta = theta * rng.uniform(0.5, 1.5, (batch_size, len(theta)))
+
+    def time_solve_batch(self, batch_size, solver):
+        self.model.solve_batch(self.theta, solver=solver)
+
+    def peakmem_solve_batch(self, batch_size, solver):
+        self.model.solve_batch(self.theta, solver=solver)
+
+
+class SaveSolution:
+    """Saving a solution of 1000 time points in each output format"""
+    params = ['csv', 'npz', 'parquet', 'hdf5']
+    param_names = ['output_format']
+
+    def setup(self, output_format):
+        module = {'parquet': 'pyarrow', 'hdf5': 'h5py'}.get(output_format)
+        if module and importlib.util.find_spec(module) is None:
+            raise NotImplementedError(f'{module} is not installed')
+        self.solution = make_model(5).solve()
+        self.dir_path = tempfile.mkdtemp() + '/'
+
+    def teardown(self, output_format):
+        shutil.rmtree(self.dir_path)
+
+    def time_save_solution(self, output_format):
+        self.solution.save_solution(self.dir_path, 'benchmark', output_format)
+
+
+class Plot:
+    """Rendering the plot of a solution off-screen"""
+    def setup(self):
+        self.y, self.t = make_model(5).solve().get_solution
+        self.dir_path = tempfile.mkdtemp() + '/'
+
+    def teardown(self):
+        shutil.rmtree(self.dir_path)
+
+    def time_save_plot(self):
+        plotting.save_plot(self.dir_path + 'benchmark_plot.png',
+                           self.y, self.t)
+
+
+class Import:
+    """Startup time of the package"""
+    def timeraw_import_pkmodel(self):
+        return 'import pkmodel'
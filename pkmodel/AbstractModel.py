@@ -8,6 +8,8 @@ from .AbstractSolution import AbstractSolution
 
 
 class AbstractModel(ABC):
+    __slots__ = ()
+
     @abstractmethod
     def solve(self) -> AbstractSolution:
         """ Abstract class for 1st Order Linear ODE for pharmokinetic model
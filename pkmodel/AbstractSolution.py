@@ -6,6 +6,8 @@ from abc import ABC, abstractmethod
 
 
 class AbstractSolution(ABC):
+    __slots__ = ()
+
     @property
     @abstractmethod
     def get_solution(self):
@@ -0,0 +1,223 @@
+"""_jit.py holds the kernels of the 'jit' solver, compiled to native code
+with numba when it is installed. The whole integration, over every segment
+of constant dose, runs inside a single compiled call without returning to
+Python between steps.
+
+The kernels are written in the subset of Python and NumPy that numba
+compiles, and still run uncompiled (slowly) without numba. Model solves
+only use them when HAS_NUMBA is True, and fall back to scipy solve_ivp
+otherwise. numba is imported and the kernels compiled on first use, by
+compile_kernels, so that importing pkmodel stays fast.
+
+| dormand_prince: explicit Runge-Kutta 5(4) with adaptive steps, the method
+    of solve_ivp RK45, with its error control and 4th order dense output,
+    built on the _stages, _error_norm, _step_factor and _interpolate kernels
+"""
+
+import importlib.util
+import types
+
+import numpy as np
+
+HAS_NUMBA = importlib.util.find_spec('numba') is not None
+# functions of this module compiled by compile_kernels
+KERNELS = ('_rms', '_initial_step', '_stages', '_error_norm', '_step_factor',
+           '_interpolate', 'dormand_prince')
+# compiled kernels by name, filled on first use
+_compiled = {}
+
+# Dormand-Prince tableau, error weights and dense output coefficients, as in
+# scipy.integrate.RK45
+RK_A = np.array([
+    [0., 0., 0., 0., 0.],
+    [1 / 5, 0., 0., 0., 0.],
+    [3 / 40, 9 / 40, 0., 0., 0.],
+    [44 / 45, -56 / 15, 32 / 9, 0., 0.],
+    [19372 / 6561, -25360 / 2187, 64448 / 6561, -212 / 729, 0.],
+    [9017 / 3168, -355 / 33, 46732 / 5247, 49 / 176, -5103 / 18656]])
+RK_B = np.array([35 / 384, 0., 500 / 1113, 125 / 192, -2187 / 6784, 11 / 84])
+RK_E = np.array([-71 / 57600, 0., 71 / 16695, -71 / 1920, 17253 / 339200,
+                 -22 / 525, 1 / 40])
+RK_P = np.array([
+    [1., -8048581381 / 2820520608, 8663915743 / 2820520608,
+     -12715105075 / 11282082432],
+    [0., 0., 0., 0.],
+    [0., 131558114200 / 32700410799, -68118460800 / 10900136933,
+     87487479700 / 32700410799],
+    [0., -1754552775 / 470086768, 14199869525 / 1410260304,
+     -10690763975 / 1880347072],
+    [0., 127303824393 / 49829197408, -318862633887 / 49829197408,
+     701980252875 / 199316789632],
+    [0., -282668133 / 205662961, 2019193451 / 616988883,
+     -1453857185 / 822651844],
+    [0., 40617522 / 29380423, -110615467 / 29380423,
+     69997945 / 29380423]])
+SAFETY = 0.9
+MIN_FACTOR = 0.2
+MAX_FACTOR = 10.
+EPS = np.finfo(float).eps
+
+
+def _rms(x):
+    return np.sqrt(np.mean(x ** 2))
+
+
+def _initial_step(A, b, u, q, f, interval, rtol, atol):
+    """First step size of a segment, as chosen by solve_ivp"""
+    scale = atol + np.abs(q) * rtol
+    d0 = _rms(q / scale)
+    d1 = _rms(f / scale)
+    if d0 < 1e-5 or d1 < 1e-5:
+        h0 = 1e-6
+    else:
+        h0 = 0.01 * d0 / d1
+    h0 = min(h0, interval)
+    f1 = A @ (q + h0 * f) + u * b
+    d2 = _rms((f1 - f) / scale) / h0
+    if d1 <= 1e-15 and d2 <= 1e-15:
+        h1 = max(1e-6, h0 * 1e-3)
+    else:
+        h1 = (0.01 / max(d1, d2)) ** (1 / 5)
+    return min(100 * h0, h1, interval)
+
+
+def _stages(A, b, u, q, f, h, K):
+    """Fills K with the 7 stages of a Dormand-Prince step of size h from q,
+    and returns the 5th order solution at the end of the step"""
+    n = q.shape[0]
+    K[0] = f
+    for i in range(1, 6):
+        dq = np.zeros(n)
+        for j in range(i):
+            dq += RK_A[i, j] * K[j]
+        K[i] = A @ (q + h * dq) + u * b
+    dq = np.zeros(n)
+    for j in range(6):
+        dq += RK_B[j] * K[j]
+    q_new = q + h * dq
+    K[6] = A @ q_new + u * b
+    return q_new
+
+
+def _error_norm(K, q, q_new, h, rtol, atol):
+    """Scaled RMS norm of the local error estimate of a step"""
+    err = np.zeros(q.shape[0])
+    for j in range(7):
+        err += RK_E[j] * K[j]
+    scale = atol + np.maximum(np.abs(q), np.abs(q_new)) * rtol
+    return _rms(h * err / scale)
+
+
+def _step_factor(error_norm, rejected):
+    """Factor of the next step size after an accepted step, not growing
+    right after a rejected step"""
+    if error_norm == 0:
+        factor = MAX_FACTOR
+    else:
+        factor = min(MAX_FACTOR, SAFETY * error_norm ** -0.2)
+    if rejected:
+        factor = min(1., factor)
+    return factor
+
+
+def _interpolate(K, q, h, x):
+    """4th order dense output at the fraction x of a step of size h from q"""
+    dq = np.zeros(q.shape[0])
+    for j in range(7):
+        dq += K[j] * (x * (RK_P[j, 0] + x * (RK_P[j, 1] + x * (
+            RK_P[j, 2] + x * RK_P[j, 3]))))
+    return q + h * dq
+
+
+def dormand_prince(A, b, bounds, inputs, t_eval, rtol=1e-3, atol=1e-6):
+    """Integrates dq/dt = A q + u b from q(0) = 0, where u is constant on
+    each segment [bounds[s], bounds[s + 1]), restarting the step size
+    control at every segment boundary like integrate_piecewise.
+
+    :param A: rate matrix with dimensions N x N
+    :type A: array of float
+    :param b: dose input vector with dimensions N
+    :type b: array of float
+    :param bounds: S + 1 sorted segment boundaries, starting at 0
+    :type bounds: array of float
+    :param inputs: S input values u, one for each segment
+    :type inputs: array of float
+    :param t_eval: T sorted time points within the segments
+    :type t_eval: array of float
+    :param rtol: relative tolerance, defaults to 1e-3 as in solve_ivp
+    :type rtol: float, optional
+    :param atol: absolute tolerance, defaults to 1e-6 as in solve_ivp
+    :type atol: float, optional
+    :return: amounts with dimensions N x T, number of evaluations of the
+        right hand side, and status: 0 on success or -1 if the step size
+        became too small, in which case the remaining amounts are NaN
+    :rtype: tuple
+    """
+    n = b.shape[0]
+    n_out = t_eval.shape[0]
+    y = np.full((n, n_out), np.nan)
+    K = np.empty((7, n))
+    q = np.zeros(n)
+    nfev = 0
+    k = 0
+    for s in range(inputs.shape[0]):
+        t = bounds[s]
+        t_end = bounds[s + 1]
+        u = inputs[s]
+        while k < n_out and t_eval[k] <= t:
+            y[:, k] = q
+            k += 1
+        if t_end <= t:
+            # zero-length segment, the state holds
+            continue
+        f = A @ q + u * b
+        h_abs = _initial_step(A, b, u, q, f, t_end - t, rtol, atol)
+        nfev += 2
+        rejected = False
+        while t < t_end:
+            if h_abs < 10 * EPS * abs(t):
+                return y, nfev, -1
+            h = min(h_abs, t_end - t)
+            q_new = _stages(A, b, u, q, f, h, K)
+            nfev += 6
+            error_norm = _error_norm(K, q, q_new, h, rtol, atol)
+            if error_norm >= 1:
+                h_abs = h * max(MIN_FACTOR, SAFETY * error_norm ** -0.2)
+                rejected = True
+                continue
+            t_new = t_end if h == t_end - t else t + h
+            # dense output at the time points within the step
+            while k < n_out and t_eval[k] <= t_new:
+                y[:, k] = _interpolate(K, q, h, (t_eval[k] - t) / h)
+                k += 1
+            h_abs = h * _step_factor(error_norm, rejected)
+            rejected = False
+            t = t_new
+            q = q_new
+            f = K[6].copy()
+    return y, nfev, 0
+
+
+def compile_kernels():
+    """Compiles the kernels with numba, on the first call only. The compiled
+    kernels are kept in _compiled, and the Python functions of this module
+    are left as they are.
+
+    :raises ImportError: If numba is not installed
+    :return: compiled dormand_prince
+    :rtype: numba dispatcher
+    """
+    if not _compiled:
+        import numba
+
+        jit = numba.njit(cache=True)
+        # copies of the kernels looking each other up in _compiled rather
+        # than in this module, so that they call the compiled kernels;
+        # numba reads these globals when the kernels are first called
+        namespace = dict(globals())
+        for name in KERNELS:
+            kernel = globals()[name]
+            namespace[name] = jit(types.FunctionType(
+                kernel.__code__, namespace, name, kernel.__defaults__))
+        _compiled.update((name, namespace[name]) for name in KERNELS)
+    return _compiled['dormand_prince']
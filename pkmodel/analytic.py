@@ -0,0 +1,128 @@
+"""analytic.py contains the closed form solution of the linear PK ODE model
+dq/dt = A q + u(t) b for dose inputs u(t) that are piecewise constant.
+
+Within a segment of constant input u, the solution starting from q(t_s) is
+
+| q(t) = exp(A tau) q(t_s) + (exp(A tau) - I) A^-1 b u,  tau = t - t_s
+
+which is evaluated for all time points at once in the eigenbasis of A.
+"""
+
+import numpy as np
+import scipy.linalg
+
+# condition number of the eigenvector matrix above which the rate matrix is
+# treated as not diagonalisable and the matrix exponential is used instead
+CONDITION_LIMIT = 1e8
+
+
+def segment_index(bounds, t_eval):
+    """Index of the constant input segment containing each time point.
+
+    :param bounds: S + 1 sorted segment boundaries
+    :type bounds: array of float
+    :param t_eval: time points
+    :type t_eval: array of float
+    :return: segment index in [0, S - 1] for each time point
+    :rtype: array of int
+    """
+    index = np.searchsorted(bounds, t_eval, side='right') - 1
+    return np.clip(index, 0, len(bounds) - 2)
+
+
+def linear_response(A, b, bounds, inputs, t_eval):
+    """Exact solution of dq/dt = A q + u(t) b from q(0) = 0, where u(t) is
+    constant on each segment [bounds[s], bounds[s + 1]).
+
+    A and b may carry leading batch dimensions, to solve a stack of systems
+    of the same size in a single call.
+
+    :param A: rate matrices with dimensions ... x N x N
+    :type A: array of float
+    :param b: dose input vectors with dimensions ... x N
+    :type b: array of float
+    :param bounds: S + 1 sorted segment boundaries, starting at 0
+    :type bounds: array of float
+    :param inputs: S input values u, one for each segment
+    :type inputs: array of float
+    :param t_eval: T sorted time points at which to evaluate the solution
+    :type t_eval: array of float
+    :return: amounts q with dimensions ... x N x T
+    :rtype: array of float
+    """
+    A = np.asarray(A, dtype=float)
+    b = np.asarray(b, dtype=float)
+    t_eval = np.asarray(t_eval, dtype=float)
+    lam, V = np.linalg.eig(A)
+    diagonalisable = np.linalg.cond(V) < CONDITION_LIMIT
+    if np.all(diagonalisable):
+        return _eigen_response(lam, V, b, bounds, inputs, t_eval)
+    # fall back to the matrix exponential for the defective systems only
+    y = np.empty(A.shape[:-1] + t_eval.shape)
+    for i in np.ndindex(A.shape[:-2]):
+        if diagonalisable[i]:
+            y[i] = _eigen_response(lam[i], V[i], b[i], bounds, inputs,
+                                   t_eval)
+        else:
+            y[i] = expm_response(A[i], b[i], bounds, inputs, t_eval)
+    return y
+
+
+def _eigen_response(lam, V, b, bounds, inputs, t_eval):
+    """linear_response in the eigenbasis A = V diag(lam) V^-1."""
+    z = np.zeros(lam.shape, dtype=lam.dtype)
+    w = np.linalg.solve(V, b[..., None])[..., 0]
+    segment = segment_index(bounds, t_eval)
+    out = np.empty(lam.shape + t_eval.shape, dtype=lam.dtype)
+    # propagator of the constant input, (exp(lam tau) - 1) / lam, with its
+    # limit tau where lam = 0
+    zero = lam == 0
+    safe_lam = np.where(zero, 1., lam)[..., None]
+    for s, u in enumerate(inputs):
+        index = np.nonzero(segment == s)[0]
+        # evaluate the segment end as well, to start the next segment
+        tau = np.append(t_eval[index], bounds[s + 1]) - bounds[s]
+        lam_tau = lam[..., None] * tau
+        growth = np.where(zero[..., None], tau, np.expm1(lam_tau) / safe_lam)
+        z_tau = np.exp(lam_tau) * z[..., None] + growth * (u * w)[..., None]
+        out[..., index] = z_tau[..., :-1]
+        z = z_tau[..., -1]
+    y = np.einsum('...ij,...jt->...it', V, out)
+    return np.real(y)
+
+
+def expm_response(A, b, bounds, inputs, t_eval):
+    """linear_response of a single system with the matrix exponential of
+    the augmented system d[q, u]/dt = [[A, b], [0, 0]] [q, u], which also
+    holds for rate matrices that are not diagonalisable.
+
+    :param A: rate matrix with dimensions N x N
+    :type A: array of float
+    :param b: dose input vector with dimensions N
+    :type b: array of float
+    :param bounds: S + 1 sorted segment boundaries, starting at 0
+    :type bounds: array of float
+    :param inputs: S input values u, one for each segment
+    :type inputs: array of float
+    :param t_eval: T sorted time points at which to evaluate the solution
+    :type t_eval: array of float
+    :return: amounts q with dimensions N x T
+    :rtype: array of float
+    """
+    n = A.shape[0]
+    augmented = np.zeros((n + 1, n + 1))
+    augmented[:n, :n] = A
+    augmented[:n, n] = b
+    q = np.zeros(n)
+    segment = segment_index(bounds, t_eval)
+    y = np.empty((n, len(t_eval)))
+    for s, u in enumerate(inputs):
+        index = np.nonzero(segment == s)[0]
+        tau = np.append(t_eval[index], bounds[s + 1]) - bounds[s]
+        state = np.append(q, u)
+        for j, dt in enumerate(tau):
+            q_tau = (scipy.linalg.expm(augmented * dt) @ state)[:n]
+            if j < len(index):
+                y[:, index[j]] = q_tau
+        q = q_tau
+    return y
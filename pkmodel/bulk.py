@@ -0,0 +1,322 @@
+"""bulk.py loads many protocols at once, from a single config file or stream,
+into stacked parameter arrays ready for Model.solve_batch.
+
+The records are read once (see config.iter_documents) and grouped by model
+structure: every parameter but the name and the values of the model
+parameters, i.e. the injection type, number of compartments, dosing, time,
+solve options, and the compartment names and flows of graph models. The
+defaults are applied once per group rather than copied into every record.
+
+Within a group, each model parameter is gathered across the records as a
+column, in the order of Model.parameter_names, with its default broadcast
+over the records that do not give it; the periph_<i> pairs are expanded
+into the V_p<i> and Q_p<i> columns on top of the periph_default pair. The
+columns are validated as a whole, and a record is only validated on its own
+to report the first invalid one.
+
+| config stream -> group by structure -> M x P parameter array per group
+"""
+
+import json
+
+import numpy as np
+
+from pkmodel import config
+from pkmodel.models import GraphModel, IntravenousModels, SubcutaneousModels
+
+MODELS = {'intravenous': IntravenousModels,
+          'subcutaneous': SubcutaneousModels, 'graph': GraphModel}
+# defaults of the model parameters that are not in config.DEFAULTS
+PARAMETER_DEFAULTS = {'k_a': config.DEFAULT_K_A}
+# parameters that set the model structure, completed with the defaults
+STRUCTURE_KEYS = ('injection_type', 'nr_compartments', 'dose_mode',
+                  'run_mode', 'time', 'periph_default')
+# the name and the model parameters of the mammillary models
+VALUE_KEYS = frozenset(('name', 'CL', 'V_c', 'X', 'k_a'))
+
+
+class ProtocolBatch:
+    """Protocols sharing a model structure, with their model parameters
+    stacked into a single array.
+
+    :param model: model of the first protocol, giving the structure
+    :type model: Model
+    :param names: name of each protocol
+    :type names: list of strings
+    :param theta: parameter vectors ordered as model.parameter_names(), with
+        dimensions M x P
+    :type theta: array of float
+    :param positions: position of each protocol in the config
+    :type positions: list of int
+    """
+    def __init__(self, model, names, theta, positions):
+        """Holds the stacked protocols"""
+        self.model = model
+        self.names = names
+        self.theta = theta
+        self.positions = positions
+
+    def __len__(self):
+        return len(self.names)
+
+    def parameter_names(self):
+        """Names of the columns of theta
+
+        :return: parameter names
+        :rtype: list of strings
+        """
+        return self.model.parameter_names()
+
+    def parameters(self, i):
+        """Completed parameters of a protocol of the batch
+
+        :param i: index of the protocol in the batch
+        :type i: int
+        :return: parameters and constants of its model
+        :rtype: dict
+        """
+        parameters = self.model.parameter_dict(self.theta[i])
+        parameters['name'] = self.names[i]
+        return parameters
+
+    def models(self):
+        """Builds the model of each protocol, on demand
+
+        :return: model of each protocol, in the order of the batch
+        :rtype: generator of Model
+        """
+        for i in range(len(self)):
+            yield type(self.model)(self.parameters(i))
+
+    def solve(self, solver='analytic', method='auto', output_grid=None):
+        """Solves every protocol of the batch in a single call, see
+        Model.solve_batch
+
+        :param solver: 'analytic' (default) or 'numeric'
+        :type solver: string, optional
+        :param method: solve_ivp method of the numeric solver, defaults to
+            'auto'
+        :type method: string, optional
+        :param output_grid: number of time points or sorted time points,
+            defaults to the output grid of the model
+        :type output_grid: int or sequence of float, optional
+        :return: amounts with dimensions M x N x T
+        :rtype: array of float
+        """
+        return self.model.solve_batch(self.theta, solver, method, output_grid)
+
+
+def _is_value(key):
+    """Whether a key holds the name or a model parameter of a protocol"""
+    return key in VALUE_KEYS or (
+        key.startswith('periph_') and key != 'periph_default')
+
+
+def structure_key(record, defaults=config.DEFAULTS):
+    """Key identifying the model structure of a protocol: its parameters
+    other than the name and the values of the model parameters, completed
+    with the defaults.
+
+    :param record: protocol parameters, as written in the config
+    :type record: dict
+    :param defaults: default parameters, defaults to config.DEFAULTS
+    :type defaults: dict, optional
+    :raises TypeError: If the record is not a dictionary
+    :return: key, equal for protocols that can be stacked together
+    :rtype: frozenset or string
+    """
+    if not isinstance(record, dict):
+        raise TypeError('data input should be a dictionary')
+    structure = {key: value for key, value in record.items()
+                 if not _is_value(key)}
+    for key in STRUCTURE_KEYS:
+        structure.setdefault(key, defaults[key])
+    if structure['injection_type'] == 'graph':
+        compartments = structure.get('compartments')
+        if isinstance(compartments, dict):
+            structure['compartments'] = list(compartments)
+        flows = structure.get('flows')
+        if isinstance(flows, list) and all(isinstance(flow, dict)
+                                           for flow in flows):
+            structure['flows'] = [{key: value for key, value in flow.items()
+                                   if key != 'value'} for flow in flows]
+    try:
+        # True == 1 == 1.0, so the values are keyed with their types
+        return frozenset((key, _typed(value))
+                         for key, value in structure.items())
+    except TypeError:
+        # lists or dicts, e.g. the output grid or the graph of the model
+        return json.dumps(structure, sort_keys=True, default=repr)
+
+
+def _typed(value):
+    """Hashable value paired with its type, and with the types of its items
+    for tuples"""
+    if isinstance(value, tuple):
+        return tuple, tuple(map(_typed, value))
+    return type(value), value
+
+
+def _reject(records, positions, defaults):
+    """Raises the error of the first invalid record, with its position"""
+    for record, position in zip(records, positions):
+        try:
+            config.validate(config.fill_defaults(dict(record), defaults))
+        except (TypeError, ValueError) as error:
+            raise type(error)(f'protocol {position}: {error}') from None
+    raise ValueError('protocols should share their model structure')
+
+
+def _column(values, records, positions, defaults, minimum=0., strict=False):
+    """Float array of the values of a parameter across records, validated
+    as a whole"""
+    if all(isinstance(value, float) for value in values):
+        column = np.array(values, dtype=float)
+        if not np.any(column <= minimum if strict else column < minimum):
+            return column
+    _reject(records, positions, defaults)
+
+
+def stack(records, positions=None, defaults=config.DEFAULTS):
+    """Stacks protocols of the same model structure (see structure_key)
+    into a batch.
+
+    :param records: protocol parameters, as written in the config
+    :type records: list of dicts
+    :param positions: position of each protocol in the config, for error
+        messages; defaults to the index of each record
+    :type positions: list of int, optional
+    :param defaults: default parameters, defaults to config.DEFAULTS
+    :type defaults: dict, optional
+    :raises TypeError: If a parameter has the wrong type
+    :raises ValueError: If a parameter is missing or out of its bounds
+    :return: stacked protocols
+    :rtype: ProtocolBatch
+    """
+    if positions is None:
+        positions = list(range(len(records)))
+    # the structure is completed and validated once, with the first record
+    parameters = config.fill_defaults(dict(records[0]), defaults)
+    try:
+        config.validate(parameters)
+    except (TypeError, ValueError) as error:
+        raise type(error)(f'protocol {positions[0]}: {error}') from None
+    model = MODELS[parameters['injection_type']](parameters)
+    names = [record.get('name', defaults['name']) for record in records]
+    if not all(isinstance(name, str) for name in names):
+        _reject(records, positions, defaults)
+    if isinstance(model, GraphModel):
+        columns = _graph_columns(model, records, positions, defaults)
+    else:
+        columns = _mammillary_columns(model, parameters['periph_default'],
+                                      records, positions, defaults)
+    return ProtocolBatch(model, names, np.column_stack(columns), positions)
+
+
+def _graph_columns(model, records, positions, defaults):
+    """Columns of the dose amount, the compartment volumes and the flow
+    values of graph protocols, in the order of model.parameter_names()"""
+    def column(values, **bounds):
+        return _column(values, records, positions, defaults, **bounds)
+
+    columns = [column([record.get('X', defaults['X'])
+                       for record in records])]
+    columns += [column([record['compartments'][name]
+                        for record in records], strict=True)
+                for name in model.compartments]
+    columns += [column([record['flows'][f]['value'] for record in records])
+                for f in range(len(model.flows))]
+    return columns
+
+
+def _mammillary_columns(model, periph_default, records, positions,
+                        defaults):
+    """Columns of the base parameters of intravenous and subcutaneous
+    protocols, and the V_p<i> and Q_p<i> columns of their peripheral
+    compartments, in the order of model.parameter_names()"""
+    columns = []
+    for key in model.base_parameters:
+        default = defaults.get(key, PARAMETER_DEFAULTS.get(key))
+        columns.append(_column([record.get(key, default)
+                                for record in records],
+                               records, positions, defaults))
+    # the pairs given override the broadcast default pair
+    periph = np.empty((len(records), model.nr_compartments, 2))
+    periph[:] = periph_default
+    for i in range(1, model.nr_compartments + 1):
+        key = f'periph_{i}'
+        given = [j for j, record in enumerate(records) if key in record]
+        pairs = [records[j][key] for j in given]
+        if not all(isinstance(pair, tuple) and len(pair) == 2
+                   for pair in pairs):
+            _reject(records, positions, defaults)
+        if given:
+            periph[given, i - 1] = _column(
+                [value for pair in pairs for value in pair],
+                records, positions, defaults).reshape(-1, 2)
+    columns.append(periph.reshape(len(records), -1))
+    return columns
+
+
+def group(records, defaults=config.DEFAULTS):
+    """Groups protocols by model structure and stacks each group.
+
+    :param records: protocol parameters, as written in the config
+    :type records: iterable of dicts
+    :param defaults: default parameters, defaults to config.DEFAULTS
+    :type defaults: dict, optional
+    :raises TypeError: If a parameter has the wrong type
+    :raises ValueError: If a parameter is missing or out of its bounds
+    :return: a batch for each model structure, in the order of their first
+        protocol
+    :rtype: list of ProtocolBatch
+    """
+    groups = {}
+    for position, record in enumerate(records):
+        try:
+            key = structure_key(record, defaults)
+        except TypeError as error:
+            raise TypeError(f'protocol {position}: {error}') from None
+        records_positions = groups.setdefault(key, ([], []))
+        records_positions[0].append(record)
+        records_positions[1].append(position)
+    return [stack(records, positions, defaults)
+            for records, positions in groups.values()]
+
+
+def load_batches(source, format=None, defaults=config.DEFAULTS):
+    """Reads every protocol of a config file or stream into a batch for each
+    model structure.
+
+    :param source: path of the config file, or text or binary stream
+    :type source: string or file object
+    :param format: format of the config, e.g. 'jsonl'; defaults to the
+        extension of the path, or of the name of the stream
+    :type format: string, optional
+    :param defaults: default parameters, defaults to config.DEFAULTS
+    :type defaults: dict, optional
+    :raises TypeError: If a parameter has the wrong type
+    :raises ValueError: If a parameter is missing or out of its bounds
+    :return: a batch for each model structure
+    :rtype: list of ProtocolBatch
+    """
+    return group(config.iter_documents(source, format), defaults)
+
+
+def load_models(source, format=None, defaults=config.DEFAULTS):
+    """Reads every protocol of a config file or stream into a model, ready
+    to solve, grouped by model structure.
+
+    :param source: path of the config file, or text or binary stream
+    :type source: string or file object
+    :param format: format of the config, defaults to the extension
+    :type format: string, optional
+    :param defaults: default parameters, defaults to config.DEFAULTS
+    :type defaults: dict, optional
+    :raises TypeError: If a parameter has the wrong type
+    :raises ValueError: If a parameter is missing or out of its bounds
+    :return: model of each protocol, batch after batch
+    :rtype: generator of Model
+    """
+    for batch in load_batches(source, format, defaults):
+        yield from batch.models()
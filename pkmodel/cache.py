@@ -0,0 +1,259 @@
+"""cache.py memoizes the solutions of PK models, keyed by a hash of their
+canonical parameters, so that repeated parameter sets are solved only once.
+
+Solutions are kept in memory in least recently used order, up to a bound on
+the bytes of their arrays, and optionally written to a cache directory on
+disk so that they survive across runs and are shared between the worker
+processes of a sweep.
+
+| canonical parameters: keys sorted, ints and floats normalized to 12
+    significant digits, tuples as lists, with the periph entries unused by
+    the model and the parameters that only affect output (name, run_mode,
+    ...) dropped
+"""
+
+import collections
+import collections.abc
+import hashlib
+import json
+import os
+
+import numpy as np
+import scipy.optimize
+
+# default bound on the bytes held in memory by a cache
+DEFAULT_MAX_BYTES = 256 * 2 ** 20
+# directory of the on-disk tier used by the 'disk' cache option
+CACHE_DIR = './Output/cache/'
+# parameters that do not change the computed trajectory; the solve options
+# are added to the key with their resolved values instead
+IGNORED_PARAMETERS = ('name', 'run_mode', 'plot', 'output_format', 'cache',
+                      'metrics_only', 'threshold', 'method', 'solver',
+                      'output_grid', 'dense_output', 'sensitivities')
+# fields of a solve result other than its arrays that are saved to disk
+RESULT_FIELDS = ('nfev', 'njev', 'nlu', 'status', 'message', 'success',
+                 'sens_names')
+# array fields of a solve result
+ARRAY_FIELDS = ('t', 'y', 'sens')
+
+_default_caches = {}
+
+
+def canonical(value):
+    """Canonical form of a parameter value, with numbers normalized to 12
+    significant digits so that e.g. 1, 1.0 and 1.0000000000001 hash alike.
+
+    :param value: parameter value
+    :type value: number, string, bool, None, sequence, array or mapping
+    :return: value with floats for numbers and lists for sequences
+    :rtype: float, string, bool, None, list or dict
+    """
+    if isinstance(value, (bool, str)) or value is None:
+        return value
+    if isinstance(value, collections.abc.Mapping):
+        return {key: canonical(item) for key, item in value.items()}
+    if isinstance(value, (tuple, list, np.ndarray)):
+        return [canonical(item) for item in value]
+    return float('{0:.12g}'.format(value))
+
+
+def solution_key(parameters, **options):
+    """Hash of the canonical parameters of a model and its solve options.
+
+    :param parameters: model parameters
+    :type parameters: dict
+    :param options: resolved solve options, e.g. method, solver, t_eval
+    :return: hex digest identifying the solution
+    :rtype: string
+    """
+    periph = {f'periph_{i + 1}'
+              for i in range(parameters.get('nr_compartments', 0))}
+    canonical_parameters = {}
+    for key, value in parameters.items():
+        if key in IGNORED_PARAMETERS:
+            continue
+        if key.startswith('periph_') and key not in periph:
+            continue
+        canonical_parameters[key] = canonical(value)
+    for key, value in options.items():
+        canonical_parameters['solve_' + key] = canonical(value)
+    text = json.dumps(canonical_parameters, sort_keys=True)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def result_nbytes(result):
+    """Bytes held by the arrays of a solve result
+
+    :param result: result of Model.integrate or Model.analytic_solution
+    :type result: OptimizeResult
+    :return: number of bytes
+    :rtype: int
+    """
+    return sum(result[field].nbytes for field in ARRAY_FIELDS
+               if result.get(field) is not None)
+
+
+class SolutionCache:
+    """Least recently used cache of solve results, bounded by the bytes of
+    their arrays, with an optional on-disk tier.
+
+    The cached arrays are made read-only, as they are shared by every
+    Solution returned for the same key.
+
+    :param max_bytes: bound on the bytes held in memory, defaults to
+        DEFAULT_MAX_BYTES
+    :type max_bytes: int, optional
+    :param cache_dir: directory of the on-disk tier, created if it does not
+        exist, defaults to None for a memory only cache
+    :type cache_dir: string, optional
+    """
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, cache_dir=None):
+        """Creates an empty cache
+
+        :param max_bytes: bound on the bytes held in memory, defaults to
+            DEFAULT_MAX_BYTES
+        :type max_bytes: int, optional
+        :param cache_dir: directory of the on-disk tier, defaults to None
+        :type cache_dir: string, optional
+        """
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+        self.__entries = collections.OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        """Number of solutions held in memory"""
+        return len(self.__entries)
+
+    def __contains__(self, key):
+        return key in self.__entries or (
+            self.cache_dir is not None and os.path.isfile(self._path(key)))
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + '.npz')
+
+    def get(self, key):
+        """Looks up a solve result, in memory first and then on disk
+
+        :param key: key from solution_key
+        :type key: string
+        :return: copy of the cached result, or None if it is not cached
+        :rtype: OptimizeResult
+        """
+        if key in self.__entries:
+            self.__entries.move_to_end(key)
+            self.hits += 1
+            return scipy.optimize.OptimizeResult(self.__entries[key])
+        result = self._load(key)
+        if result is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._remember(key, result)
+        return scipy.optimize.OptimizeResult(result)
+
+    def put(self, key, result):
+        """Caches a solve result, evicting the least recently used results
+        beyond max_bytes, and saves it to disk if the cache has a directory.
+        Results with dense output are kept in memory only.
+
+        :param key: key from solution_key
+        :type key: string
+        :param result: result of Model.integrate or Model.analytic_solution
+        :type result: OptimizeResult
+        :return: None
+        """
+        result = scipy.optimize.OptimizeResult(result)
+        for field in ARRAY_FIELDS:
+            if result.get(field) is not None:
+                result[field] = np.array(result[field])
+                result[field].flags.writeable = False
+        self._remember(key, result)
+        if self.cache_dir is not None and result.get('sol') is None:
+            self._save(key, result)
+
+    def clear(self):
+        """Empties the memory tier, leaving the files on disk
+
+        :return: None
+        """
+        self.__entries.clear()
+        self.nbytes = 0
+
+    def _remember(self, key, result):
+        if key in self.__entries:
+            self.nbytes -= result_nbytes(self.__entries.pop(key))
+        nbytes = result_nbytes(result)
+        if nbytes > self.max_bytes:
+            return
+        self.__entries[key] = result
+        self.nbytes += nbytes
+        while self.nbytes > self.max_bytes:
+            _, evicted = self.__entries.popitem(last=False)
+            self.nbytes -= result_nbytes(evicted)
+
+    def _save(self, key, result):
+        info = {field: result.get(field) for field in RESULT_FIELDS}
+        # write to a temporary file first, as other processes may be
+        # reading the cache
+        path = self._path(key)
+        temporary = '{0}.{1}.tmp'.format(path, os.getpid())
+        arrays = {field: result[field] for field in ARRAY_FIELDS
+                  if result.get(field) is not None}
+        with open(temporary, 'wb') as file:
+            np.savez(file, **arrays,
+                     info=json.dumps(info, default=lambda value: value.item()))
+        os.replace(temporary, path)
+
+    def _load(self, key):
+        if self.cache_dir is None or not os.path.isfile(self._path(key)):
+            return None
+        with np.load(self._path(key)) as archive:
+            result = scipy.optimize.OptimizeResult(
+                sol=None, **json.loads(str(archive['info'])),
+                **{field: archive[field] for field in ARRAY_FIELDS
+                   if field in archive})
+        for field in ARRAY_FIELDS:
+            if field in result:
+                result[field].flags.writeable = False
+        return result
+
+
+def default_cache(cache_dir=None):
+    """Cache shared by all models of the process with the given directory
+
+    :param cache_dir: directory of the on-disk tier, defaults to None for a
+        memory only cache
+    :type cache_dir: string, optional
+    :return: cache
+    :rtype: SolutionCache
+    """
+    if cache_dir not in _default_caches:
+        _default_caches[cache_dir] = SolutionCache(cache_dir=cache_dir)
+    return _default_caches[cache_dir]
+
+
+def resolve_cache(option):
+    """Cache to use for the 'cache' parameter of a model
+
+    :param option: False or None for no cache, True for the default memory
+        cache, 'disk' for the default cache backed by CACHE_DIR, or a
+        SolutionCache
+    :type option: bool, string or SolutionCache
+    :raises ValueError: If the option is none of the above
+    :return: cache, or None
+    :rtype: SolutionCache
+    """
+    if isinstance(option, SolutionCache):
+        return option
+    if option is None or option is False:
+        return None
+    if option is True:
+        return default_cache()
+    if option == 'disk':
+        return default_cache(CACHE_DIR)
+    raise ValueError("cache should be True, False, 'disk' or a SolutionCache")
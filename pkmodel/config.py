@@ -0,0 +1,448 @@
+"""config.py reads protocol config files and validates their parameters.
+
+Config files are read according to their extension, and may hold a single
+protocol or many of them:
+
+| .json: an object, or a list of objects
+| .jsonl: one object per line
+| .toml: a table, or an array of tables named protocols ([[protocols]])
+| .yaml, .yml: a mapping, a list of mappings, or several documents separated
+    by --- (needs PyYAML)
+| any other extension: a Python dictionary literal, or a list of them
+
+Formats without tuples give the periph_* pairs as lists, which are turned
+into tuples on reading. Configs may also be read from streams, e.g. a pipe,
+with their format given explicitly, and JSON lines are parsed one line at a
+time.
+
+The parameters are validated against SCHEMA, which is compiled once on
+import into one check function per parameter, so that validating a protocol
+is a single pass over its fields. load returns the validated parameters of
+every protocol of a file as immutable Parameters objects (see
+parameters.py).
+"""
+
+import ast
+import collections.abc
+import functools
+import json
+import os
+
+from pkmodel.models import FLOW_TYPES
+from pkmodel.parameters import Parameters
+from pkmodel.store import FORMATS
+
+# default parameters of a protocol; periph_default is used for the
+# peripheral compartments that are not given
+DEFAULTS = {
+    'name': 'model1',
+    'V_c': 1.0,
+    'periph_default': (1.0, 1.0),      # (V_p1, Q_p1)
+    'CL': 1.0,
+    'X': 1.0,
+    'dose_mode': 'normal',
+    'nr_compartments': 1,          # nr of peripheral compartments
+    'injection_type': 'intravenous',    # 'subcutaneous'
+    'run_mode': 'save',
+    'time': 1
+}
+# absorption rate added to subcutaneous protocols that do not give one
+DEFAULT_K_A = 1.0
+# longest time period of a protocol, in hours
+MAX_TIME = 5
+
+# type, bounds and allowed values of each parameter, in the order they are
+# checked; the periph_<i> pairs are checked after nr_compartments
+SCHEMA = {
+    'nr_compartments': {'type': int, 'minimum': 0},
+    'time': {'type': int, 'minimum': 0, 'maximum': MAX_TIME},
+    'periph_default': {'type': 'pair'},
+    'CL': {'type': float, 'minimum': 0},
+    'X': {'type': float, 'minimum': 0},
+    'V_c': {'type': float, 'minimum': 0},
+    'k_a': {'type': float, 'minimum': 0, 'required': False},
+    'name': {'type': str},
+    'injection_type': {'type': str, 'choices': ('intravenous',
+                                                'subcutaneous', 'graph')},
+    'dose_mode': {'choices': ('normal', 'pulse', 'zero')},
+    'run_mode': {'choices': ('save', 'test')},
+    'compartments': {'type': 'compartments', 'required': False},
+    'flows': {'type': 'flows', 'required': False},
+    'dose_compartment': {'type': str, 'required': False},
+    'solver': {'choices': ('numeric', 'analytic', 'jit'), 'required': False},
+    'method': {'type': str, 'required': False},
+    'output_grid': {'type': 'output_grid', 'required': False},
+    'dense_output': {'type': bool, 'required': False},
+    'metrics_only': {'type': bool, 'required': False},
+    'sensitivities': {'type': bool, 'required': False},
+    'threshold': {'type': float, 'required': False},
+    'output_format': {'type': 'output_format', 'required': False},
+    'plot': {'choices': (True, False, 'deferred'), 'required': False},
+    'sparse': {'choices': (True, False, 'auto'), 'required': False},
+    'cache': {'choices': (True, False, 'disk'), 'required': False},
+}
+TYPE_NAMES = {int: 'a integer', float: 'a float', str: 'a string',
+              bool: 'a bool'}
+
+
+def _check_pair(key, value, label=None):
+    """Checks a (volume, rate) pair of a peripheral compartment"""
+    label = label or key
+    if not isinstance(value, tuple):
+        raise TypeError(f'{key} should be a tuple')
+    if len(value) != 2:
+        raise ValueError(f'{key} should hold a volume and a rate')
+    for item in value:
+        if not isinstance(item, float):
+            raise TypeError('values associated with the peripheral '
+                            f'compartment {label} should be float')
+        if item < 0:
+            raise ValueError('values associated with the peripheral '
+                             f'compartment {label} should be at least 0')
+
+
+def _check_compartments(key, compartments):
+    """Checks that compartments map names to float volumes larger than 0,
+    as a dict or the read-only mapping of frozen Parameters"""
+    if (not isinstance(compartments, collections.abc.Mapping)
+            or not compartments):
+        raise TypeError('compartments should be a non-empty dictionary')
+    for name, volume in compartments.items():
+        if not isinstance(volume, float):
+            raise TypeError(f'volume of compartment {name} should be a '
+                            'float')
+        if volume <= 0:
+            raise ValueError(f'volume of compartment {name} should be '
+                             'larger than 0')
+
+
+def _check_flows(key, flows):
+    """Checks that flows are dictionaries of a known type with a float value
+    of at least 0"""
+    if (not isinstance(flows, (list, tuple))
+            or not all(isinstance(flow, collections.abc.Mapping)
+                       for flow in flows)):
+        raise TypeError('flows should be a list of dictionaries')
+    for flow in flows:
+        if flow.get('type') not in FLOW_TYPES:
+            raise ValueError('flow type should be one of '
+                             + ', '.join(FLOW_TYPES))
+        if not isinstance(flow.get('value'), float):
+            raise TypeError('flow values should be float')
+        if flow['value'] < 0:
+            raise ValueError('flow values should be at least 0')
+
+
+def _check_output_grid(key, value):
+    """Checks that an output grid is a number of points, a list of times or
+    'steps'"""
+    if value == 'steps' or (isinstance(value, int)
+                            and not isinstance(value, bool)):
+        return
+    if (not isinstance(value, (list, tuple))
+            or not all(isinstance(t, (int, float)) for t in value)):
+        raise TypeError("output_grid should be a number of points, a list "
+                        "of times or 'steps'")
+
+
+def _check_output_format(key, value):
+    """Checks that the output format is one, or a list, of store.FORMATS"""
+    for output_format in [value] if isinstance(value, str) else value:
+        if output_format not in FORMATS:
+            raise ValueError('output_format should be one of '
+                             + ', '.join(FORMATS))
+
+
+CUSTOM_CHECKS = {'pair': _check_pair, 'compartments': _check_compartments,
+                 'flows': _check_flows, 'output_grid': _check_output_grid,
+                 'output_format': _check_output_format}
+
+
+def _type_check(key, type):
+    """Check function of the Python type of a value"""
+    # bools are ints, but not valid ints or floats
+    exclude = () if type is bool else bool
+
+    def check(value):
+        if not isinstance(value, type) or isinstance(value, exclude):
+            raise TypeError(f'{key} should be {TYPE_NAMES[type]}')
+    return check
+
+
+def _choices_check(key, choices):
+    """Check function of the allowed values of a value"""
+    names = ', '.join(map(str, choices))
+
+    def check(value):
+        # 1 == True, so the type is matched as well
+        if not any(type(value) is type(choice) and value == choice
+                   for choice in choices):
+            raise ValueError(f'{key} should be one of {names}')
+    return check
+
+
+def _bounds_check(key, minimum, maximum):
+    """Check function of the bounds of a value"""
+    def check(value):
+        if minimum is not None and value < minimum:
+            raise ValueError(f'{key} should be at least {minimum}')
+        if maximum is not None and value > maximum:
+            if key == 'time':
+                raise ValueError('Time should not exceed a value of '
+                                 f'{maximum} hours')
+            raise ValueError(f'{key} should be at most {maximum}')
+    return check
+
+
+def compile_field(key, type=None, choices=None, minimum=None, maximum=None,
+                  required=True):
+    """Compiles the schema of a parameter into a check function, composed of
+    the type, choices and bounds checks of the value that apply
+
+    :param key: parameter name
+    :type key: string
+    :param type: Python type of the value, or the name of a check in
+        CUSTOM_CHECKS; defaults to None for no type check
+    :type type: type or string, optional
+    :param choices: allowed values, defaults to None for any value
+    :type choices: tuple, optional
+    :param minimum: smallest allowed value, defaults to None
+    :type minimum: float, optional
+    :param maximum: largest allowed value, defaults to None
+    :type maximum: float, optional
+    :param required: whether the parameter must be given, defaults to True
+    :type required: bool, optional
+    :return: function of the parameters raising TypeError or ValueError if
+        the parameter is not valid
+    :rtype: function
+    """
+    if isinstance(type, str):
+        checks = [functools.partial(CUSTOM_CHECKS[type], key)]
+    else:
+        checks = []
+        if type is not None:
+            checks.append(_type_check(key, type))
+        if choices is not None:
+            checks.append(_choices_check(key, choices))
+        if minimum is not None or maximum is not None:
+            checks.append(_bounds_check(key, minimum, maximum))
+
+    def check(parameters):
+        if key not in parameters:
+            if required:
+                raise ValueError(f'{key} is missing')
+            return
+        value = parameters[key]
+        for value_check in checks:
+            value_check(value)
+    return check
+
+
+def compile_schema(schema):
+    """Compiles a schema into the check function of each parameter
+
+    :param schema: keyword arguments of compile_field for each parameter
+    :type schema: dict
+    :return: check function of each parameter
+    :rtype: dict
+    """
+    return {key: compile_field(key, **spec) for key, spec in schema.items()}
+
+
+CHECKS = compile_schema(SCHEMA)
+
+
+def validate(parameters, keys=None):
+    """Validates protocol parameters in a single pass over the compiled
+    checks, including both values of every periph_<i> pair used and the
+    graph fields of graph models.
+
+    :param parameters: protocol parameters
+    :type parameters: dict
+    :param keys: parameters to check, defaults to all of them
+    :type keys: iterable of strings, optional
+    :raises TypeError: If the parameters are not a dictionary, or a
+        parameter has the wrong type
+    :raises ValueError: If a parameter is missing or out of its bounds
+    :return: None
+    """
+    if not isinstance(parameters, collections.abc.Mapping):
+        raise TypeError('data input should be a dictionary')
+    if keys is not None:
+        for key in keys:
+            if key.startswith('periph_') and key != 'periph_default':
+                _check_pair(key, parameters[key], key[len('periph_'):])
+            else:
+                CHECKS[key](parameters)
+        return
+    for check in CHECKS.values():
+        check(parameters)
+    # nr_compartments is valid by now
+    for i in range(1, parameters['nr_compartments'] + 1):
+        _check_pair(f'periph_{i}', parameters[f'periph_{i}'], i)
+    if parameters['injection_type'] == 'graph':
+        for key in 'compartments', 'flows':
+            if key not in parameters:
+                raise TypeError(f'{key} should be given for graph models')
+
+
+def fill_defaults(parameters, defaults=DEFAULTS):
+    """Completes protocol parameters in place with the defaults, the default
+    pair for the peripheral compartments not given, and the default
+    absorption rate of subcutaneous models
+
+    :param parameters: protocol parameters
+    :type parameters: dict
+    :param defaults: default parameters, defaults to DEFAULTS
+    :type defaults: dict, optional
+    :return: the completed parameters
+    :rtype: dict
+    """
+    for key, value in defaults.items():
+        parameters.setdefault(key, value)
+    for i in range(1, parameters['nr_compartments'] + 1):
+        parameters.setdefault(f'periph_{i}', defaults['periph_default'])
+    if parameters['injection_type'] == 'subcutaneous':
+        parameters.setdefault('k_a', DEFAULT_K_A)
+    return parameters
+
+
+def periph_tuples(document):
+    """Turns the periph_* lists of a document into tuples, in place
+
+    :param document: protocol parameters, e.g. read from JSON
+    :type document: dict
+    :raises TypeError: If the document is not a dictionary
+    :return: the document
+    :rtype: dict
+    """
+    if not isinstance(document, dict):
+        raise TypeError('data input should be a dictionary')
+    for key, value in document.items():
+        if key.startswith('periph_') and isinstance(value, list):
+            document[key] = tuple(value)
+    return document
+
+
+def _extension(source, format=None):
+    """Lower case extension giving the format of a config path or stream"""
+    if format is not None:
+        return '.' + format.lower().lstrip('.')
+    name = source if isinstance(source, str) else getattr(source, 'name', '')
+    return os.path.splitext(str(name))[1].lower()
+
+
+def _lines(source):
+    """Lines of a config path or stream, decoded and read one at a time"""
+    if isinstance(source, str):
+        with open(source, 'rb') as file:
+            for line in file:
+                yield line.decode()
+    else:
+        for line in source:
+            yield line.decode() if isinstance(line, bytes) else line
+
+
+def _documents(value):
+    """Protocols of a config holding one protocol or a list of them"""
+    return value if isinstance(value, (list, tuple)) else [value]
+
+
+def _read_json_lines(lines):
+    """Protocols of a JSON lines config, parsed one line at a time"""
+    for line in lines:
+        if line.strip():
+            yield json.loads(line)
+
+
+def _read_json(lines):
+    """Protocols of a JSON config: an object, or a list of objects"""
+    return _documents(json.loads(''.join(lines)))
+
+
+def _read_toml(lines):
+    """Protocols of a TOML config: a table, or an array of tables named
+    protocols"""
+    try:
+        import tomllib
+    except ImportError:  # Python < 3.11
+        import tomli as tomllib
+    documents = tomllib.loads(''.join(lines))
+    return _documents(documents.get('protocols', documents))
+
+
+def _read_yaml(lines):
+    """Protocols of a YAML config: a mapping, a list of mappings, or several
+    documents"""
+    import yaml
+
+    documents = [document for document in yaml.safe_load_all(''.join(lines))
+                 if document is not None]
+    if len(documents) == 1:
+        return _documents(documents[0])
+    return documents
+
+
+# readers of the config formats without tuples, by extension; any other
+# extension is read as Python dictionary literals
+READERS = {'.jsonl': _read_json_lines, '.json': _read_json,
+           '.toml': _read_toml, '.yaml': _read_yaml, '.yml': _read_yaml}
+
+
+def iter_documents(source, format=None):
+    """Reads the protocols of a config file or stream one at a time. JSON
+    lines are parsed as they are read, so that large files or pipes are not
+    held in memory as text; the other formats are parsed whole.
+
+    :param source: path of the config file, or text or binary stream
+    :type source: string or file object
+    :param format: format of the config, e.g. 'json' or 'jsonl'; defaults to
+        the extension of the path, or of the name of the stream
+    :type format: string, optional
+    :raises ImportError: If the config is YAML and PyYAML is not installed
+    :return: parameters of each protocol, as written in the config
+    :rtype: generator of dicts
+    """
+    reader = READERS.get(_extension(source, format))
+    if reader is None:
+        yield from _documents(ast.literal_eval(''.join(_lines(source))))
+        return
+    for document in reader(_lines(source)):
+        yield periph_tuples(document)
+
+
+def read_documents(source, format=None):
+    """Reads every protocol of a config file or stream, in the format given
+    by its extension
+
+    :param source: path of the config file, or text or binary stream
+    :type source: string or file object
+    :param format: format of the config, defaults to the extension of the
+        path, or of the name of the stream
+    :type format: string, optional
+    :raises ImportError: If the config is YAML and PyYAML is not installed
+    :return: parameters of each protocol, as written in the config
+    :rtype: list of dicts
+    """
+    return list(iter_documents(source, format))
+
+
+def load(source, format=None):
+    """Reads, completes and validates every protocol of a config file or
+    stream
+
+    :param source: path of the config file, or text or binary stream
+    :type source: string or file object
+    :param format: format of the config, defaults to the extension of the
+        path, or of the name of the stream
+    :type format: string, optional
+    :raises TypeError: If a parameter has the wrong type
+    :raises ValueError: If a parameter is missing or out of its bounds
+    :return: parameters of each protocol
+    :rtype: list of Parameters
+    """
+    protocols = []
+    for document in iter_documents(source, format):
+        validate(fill_defaults(document))
+        protocols.append(Parameters(document))
+    return protocols
@@ -1,5 +1,10 @@
 """Dose functions defining the dosing regimens of pharmokinetic model.
 """
+import numpy as np
+
+# default time durations of the high and low pulses of pulse_series_dose
+PULSE_WIDTH = 0.1
+PULSE_INTERVAL = 0.1
 
 
 def select_dose(key):
@@ -22,6 +27,54 @@ def select_dose(key):
         raise Exception('Incorrect dose key provided')
 
 
+def switch_times(key, time, pulse_width=PULSE_WIDTH,
+                 interval=PULSE_INTERVAL):
+    """Times at which the dose function specified by key changes value.
+    All dose functions are constant in between these times.
+
+    :param key: ['normal', 'pulse', 'zero'] selection ID for function from
+        parameters
+    :type key: String
+    :param time: end of the dosing period
+    :type time: float
+    :param pulse_width: time duration of high pulse, defaults to PULSE_WIDTH
+    :type pulse_width: float, optional
+    :param interval: time duration of low pulse, defaults to PULSE_INTERVAL
+    :type interval: float, optional
+    :raises Exception: Dose key incorrect, does not point to a dose function
+    :return: sorted switch times strictly between 0 and time
+    :rtype: array of float
+    """
+    select_dose(key)
+    if key != 'pulse':
+        return np.array([])
+    starts = np.arange(0., time, pulse_width + interval)
+    times = np.unique(np.concatenate([starts, starts + pulse_width]))
+    return times[(times > 0.) & (times < time)]
+
+
+def dose_segments(key, X, time):
+    """Splits the dosing period into segments of constant dose, at the
+    switch times of the dose function specified by key.
+
+    :param key: ['normal', 'pulse', 'zero'] selection ID for function from
+        parameters
+    :type key: String
+    :param X: amount of dose administered
+    :type X: float
+    :param time: end of the dosing period
+    :type time: float
+    :raises Exception: Dose key incorrect, does not point to a dose function
+    :return: S + 1 segment boundaries from 0 to time, and the S dose values
+        administered within each segment
+    :rtype: tuple of arrays of float
+    """
+    dose = select_dose(key)
+    bounds = np.concatenate([[0.], switch_times(key, time), [time]])
+    values = np.array([dose(t, X) for t in (bounds[:-1] + bounds[1:]) / 2])
+    return bounds, values
+
+
 def unit_fn_dose(t, X):
     """Unit step function (Heaviside) for dosing regimen, with amount X of
         dose administered at every time step.
@@ -36,7 +89,8 @@ def unit_fn_dose(t, X):
     return X
 
 
-def pulse_series_dose(t, X1, X2=0., pulse_width=0.1, interval=0.1):
+def pulse_series_dose(t, X1, X2=0., pulse_width=PULSE_WIDTH,
+                      interval=PULSE_INTERVAL):
     """Pulse function for dose administration, with X1 and X2 amounts
         alternately administered.
 
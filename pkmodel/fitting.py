@@ -0,0 +1,255 @@
+"""fitting.py estimates the parameters of a PK model from concentrations
+observed in one of its compartments, by nonlinear least squares with scipy
+least_squares.
+
+The model is built once and only its parameter vector changes between
+evaluations. Each evaluation solves the model together with its forward
+sensitivities (see Model.sensitivity_solution) at the observation times
+only, which gives the residuals and their exact Jacobian in a single solve,
+and is memoized as least_squares asks for the residuals and the Jacobian at
+the same point separately.
+
+| residual_i = w_i (q_c(t_i) / V_c - c_i), for the observed compartment c
+| parameters are fitted in log space, theta = exp(phi), which keeps them
+    positive and evens out their scales
+
+Several starts, spread log-uniformly around the initial parameters, can be
+run across a pool of worker processes, the best fit being kept.
+"""
+
+import collections
+import concurrent.futures
+
+import numpy as np
+import scipy.optimize
+
+# number of evaluations memoized by an Objective
+EVALUATION_CACHE_SIZE = 8
+
+FitResult = collections.namedtuple('FitResult', [
+    'parameters', 'cost', 'success', 'message', 'nfev', 'njev', 'costs',
+    'solution'])
+FitResult.__doc__ = """Outcome of a fit: the fitted values of each fitted
+parameter, the cost (half the sum of the squared residuals), whether
+least_squares converged and its message, its number of residual and Jacobian
+evaluations summed over all starts, the final cost of each start, and the
+Solution of the model with the fitted parameters over its output grid."""
+
+
+class Objective:
+    """Residuals of a model against observed concentrations, and their
+    Jacobian with respect to the logarithm of the fitted parameters.
+
+    :param model: model giving the structure, dosing and the values of the
+        parameters that are not fitted
+    :type model: Model
+    :param times: observation times, within the time period of the model
+    :type times: array of float
+    :param concentrations: observed concentrations, one for each time
+    :type concentrations: array of float
+    :param parameters: names of the fitted parameters, from
+        model.parameter_names(); defaults to all parameters but the dose X
+    :type parameters: list of strings, optional
+    :param compartment: index of the observed compartment in the state
+        vector, or its name for graph models; defaults to the central
+        compartment
+    :type compartment: int or string, optional
+    :param weights: weight of each residual, defaults to 1
+    :type weights: array of float, optional
+    :param solver: 'analytic' (default) or 'numeric', see
+        Model.sensitivity_solution
+    :type solver: string, optional
+    :raises ValueError: If the times and concentrations do not match, a
+        parameter is unknown or the observed compartment has no volume
+    """
+    def __init__(self, model, times, concentrations, parameters=None,
+                 compartment=None, weights=None, solver='analytic'):
+        """Compiles the observations and fitted parameters of the model
+
+        :raises ValueError: If the times and concentrations do not match, a
+            parameter is unknown or the observed compartment has no volume
+        """
+        self.model = model
+        self.solver = solver
+        names = model.parameter_names()
+        if parameters is None:
+            parameters = [name for name in names if name != 'X']
+        unknown = set(parameters) - set(names)
+        if unknown:
+            raise ValueError('unknown parameters ' + ', '.join(sorted(unknown))
+                             + ', parameters are ' + ', '.join(names))
+        self.parameters = list(parameters)
+        self.indices = [names.index(name) for name in self.parameters]
+        self.theta0 = model.parameter_vector()
+
+        times = np.asarray(times, dtype=float)
+        self.concentrations = np.asarray(concentrations, dtype=float)
+        if times.ndim != 1 or times.shape != self.concentrations.shape:
+            raise ValueError('times and concentrations should be sequences '
+                             'of the same length')
+        # the model is solved once at each distinct observation time
+        self.t_eval, self.inverse = np.unique(times, return_inverse=True)
+        model.output_times(self.t_eval)
+        self.weights = np.ones_like(times) if weights is None else \
+            np.asarray(weights, dtype=float)
+
+        volumes = model.volume_names()
+        if compartment is None:
+            if 'V_c' not in volumes:
+                raise ValueError('compartment should be given for models '
+                                 'without a central compartment')
+            compartment = volumes.index('V_c')
+        elif isinstance(compartment, str):
+            compartment = model.compartment_index(compartment)
+        if volumes[compartment] is None:
+            raise ValueError('observed compartment should have a volume')
+        self.compartment = compartment
+        self.volume_index = names.index(volumes[compartment])
+        self.__evaluations = collections.OrderedDict()
+
+    def theta(self, phi):
+        """Parameter vector of the model for the log fitted parameters
+
+        :param phi: logarithm of the fitted parameters
+        :type phi: array of float
+        :return: parameter vector, ordered as model.parameter_names()
+        :rtype: array of float
+        """
+        theta = self.theta0.copy()
+        theta[self.indices] = np.exp(phi)
+        return theta
+
+    def evaluate(self, phi):
+        """Residuals and Jacobian at phi, memoized for the last
+        EVALUATION_CACHE_SIZE points
+
+        :param phi: logarithm of the fitted parameters
+        :type phi: array of float
+        :return: residuals with dimensions M, for M observations, and their
+            Jacobian with dimensions M x F, for F fitted parameters
+        :rtype: tuple of arrays of float
+        """
+        key = np.asarray(phi, dtype=float).tobytes()
+        if key in self.__evaluations:
+            self.__evaluations.move_to_end(key)
+            return self.__evaluations[key]
+        theta = self.theta(phi)
+        result = self.model.sensitivity_solution(
+            self.t_eval, self.solver, theta=theta, wrt=self.indices)
+        q = result.y[self.compartment]
+        dq = result.sens[:, self.compartment]
+        volume = theta[self.volume_index]
+        dc = dq / volume
+        if self.volume_index in self.indices:
+            dc[self.indices.index(self.volume_index)] -= q / volume ** 2
+        residuals = self.weights * (q[self.inverse] / volume
+                                    - self.concentrations)
+        # chain rule for theta = exp(phi)
+        jacobian = self.weights[:, None] * (
+            dc[:, self.inverse] * theta[self.indices, None]).T
+        self.__evaluations[key] = residuals, jacobian
+        if len(self.__evaluations) > EVALUATION_CACHE_SIZE:
+            self.__evaluations.popitem(last=False)
+        return residuals, jacobian
+
+    def residuals(self, phi):
+        """Weighted differences between the model and observed
+        concentrations
+
+        :param phi: logarithm of the fitted parameters
+        :type phi: array of float
+        :return: residuals with dimensions M
+        :rtype: array of float
+        """
+        return self.evaluate(phi)[0]
+
+    def jacobian(self, phi):
+        """Jacobian of the residuals with respect to phi
+
+        :param phi: logarithm of the fitted parameters
+        :type phi: array of float
+        :return: Jacobian with dimensions M x F
+        :rtype: array of float
+        """
+        return self.evaluate(phi)[1]
+
+
+def fit_start(objective, phi0, options=None):
+    """Runs least_squares from a single start
+
+    :param objective: residuals and Jacobian to minimise
+    :type objective: Objective
+    :param phi0: logarithm of the initial fitted parameters
+    :type phi0: array of float
+    :param options: keyword arguments of least_squares, defaults to None
+    :type options: dict, optional
+    :return: result of least_squares
+    :rtype: OptimizeResult
+    """
+    return scipy.optimize.least_squares(objective.residuals, phi0,
+                                        jac=objective.jacobian,
+                                        **(options or {}))
+
+
+def fit(model, times, concentrations, parameters=None, compartment=None,
+        weights=None, solver='analytic', starts=1, spread=10., seed=None,
+        workers=1, **options):
+    """Fits parameters of a model to observed concentrations.
+
+    :param model: model giving the structure, dosing, the initial values of
+        the fitted parameters and the values of the others
+    :type model: Model
+    :param times: observation times, within the time period of the model
+    :type times: array of float
+    :param concentrations: observed concentrations, one for each time
+    :type concentrations: array of float
+    :param parameters: names of the fitted parameters, see Objective;
+        defaults to all parameters but the dose X
+    :type parameters: list of strings, optional
+    :param compartment: observed compartment, see Objective; defaults to the
+        central compartment
+    :type compartment: int or string, optional
+    :param weights: weight of each residual, defaults to 1
+    :type weights: array of float, optional
+    :param solver: 'analytic' (default) or 'numeric'
+    :type solver: string, optional
+    :param starts: number of starts, the first one from the initial
+        parameters; defaults to 1
+    :type starts: int, optional
+    :param spread: factor within which the other starts are drawn
+        log-uniformly around the initial parameters, defaults to 10
+    :type spread: float, optional
+    :param seed: seed of the random starts, defaults to None
+    :type seed: int, optional
+    :param workers: number of worker processes running the starts, defaults
+        to 1 to run them in the current process; None for the number of CPUs
+    :type workers: int, optional
+    :param options: keyword arguments passed on to least_squares, e.g.
+        xtol or max_nfev
+    :raises ValueError: See Objective
+    :return: outcome of the fit, with the best start
+    :rtype: FitResult
+    """
+    objective = Objective(model, times, concentrations, parameters,
+                          compartment, weights, solver)
+    phi0 = np.log(objective.theta0[objective.indices])
+    rng = np.random.default_rng(seed)
+    phis = phi0 + rng.uniform(-np.log(spread), np.log(spread),
+                              (starts, len(phi0)))
+    phis[0] = phi0
+    if workers == 1:
+        results = [fit_start(objective, phi, options) for phi in phis]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+            results = list(executor.map(fit_start, [objective] * starts,
+                                        phis, [options] * starts))
+    best = min(results, key=lambda result: result.cost)
+    theta = objective.theta(best.x)
+    fitted = type(model)(model.parameter_dict(theta))
+    return FitResult(
+        parameters=dict(zip(objective.parameters, theta[objective.indices])),
+        cost=best.cost, success=best.success, message=best.message,
+        nfev=sum(result.nfev for result in results),
+        njev=sum(result.njev or 0 for result in results),
+        costs=[result.cost for result in results],
+        solution=fitted.solve())
@@ -0,0 +1,279 @@
+"""instrumentation.py records where the time of the Protocol -> Model ->
+Solution pipeline goes: wall time spans of each stage (reading the config,
+checks, solving, plotting, saving) and the counters of the solver (RHS
+evaluations nfev, Jacobian evaluations njev and LU decompositions nlu).
+
+Instrumentation is opt-in: the spans and counters of the library are only
+recorded while a Recorder is active, and cost a single check otherwise.
+
+| with instrumentation.Recorder([instrumentation.JsonLinesSink(path)]):
+|     protocol.generate_model().solve().output()
+
+Every span and count is passed on as an event to the sinks of the recorder:
+LogSink logs it, JsonLinesSink appends it to a file and ProfileSink runs
+cProfile over the whole recording. Recorder.summary totals the events, and
+merge adds up the summaries of many recorders, e.g. of the jobs of a sweep.
+"""
+
+import contextlib
+import functools
+import json
+import logging
+import os
+import time
+
+_recorder = None
+
+
+class Sink:
+    """Receives the events of a recording; the base sink ignores them"""
+    def start(self):
+        """Called when the recording starts
+
+        :return: None
+        """
+
+    def emit(self, event):
+        """Called for each span and count
+
+        :param event: 'event' ('span' or 'count'), 'pid' and either 'name'
+            and 'elapsed' seconds of a span, or the counter values
+        :type event: dict
+        :return: None
+        """
+
+    def close(self):
+        """Called when the recording stops
+
+        :return: None
+        """
+
+
+class LogSink(Sink):
+    """Logs every event with the 'pkmodel' logger
+
+    :param level: logging level, defaults to logging.INFO
+    :type level: int, optional
+    """
+    def __init__(self, level=logging.INFO):
+        self.logger = logging.getLogger('pkmodel')
+        self.level = level
+
+    def emit(self, event):
+        if event['event'] == 'span':
+            self.logger.log(self.level, '%s took %.6fs', event['name'],
+                            event['elapsed'])
+        else:
+            counts = {key: value for key, value in event.items()
+                      if key not in ('event', 'pid')}
+            self.logger.log(self.level, 'counters %s', counts)
+
+
+class JsonLinesSink(Sink):
+    """Appends every event to a file as a line of JSON
+
+    :param path: file path, created if it does not exist
+    :type path: string
+    """
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+
+    def start(self):
+        self.file = open(self.path, 'a')
+
+    def emit(self, event):
+        self.file.write(json.dumps(event) + '\n')
+
+    def close(self):
+        self.file.close()
+
+
+class ProfileSink(Sink):
+    """Profiles the whole recording with cProfile and dumps the statistics
+    to a file, to be read with pstats or snakeviz
+
+    :param path: file path of the statistics
+    :type path: string
+    """
+    def __init__(self, path):
+        import cProfile
+
+        self.path = path
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        self.profile.enable()
+
+    def close(self):
+        self.profile.disable()
+        self.profile.dump_stats(self.path)
+
+
+class Recorder:
+    """Records the spans and counters of the library while active, as a
+    context manager, and passes them on to its sinks.
+
+    :param sinks: sinks of the events, defaults to none
+    :type sinks: iterable of Sink, optional
+    """
+    def __init__(self, sinks=()):
+        """Creates an inactive recorder
+
+        :param sinks: sinks of the events, defaults to none
+        :type sinks: iterable of Sink, optional
+        """
+        self.sinks = list(sinks)
+        self.spans = {}
+        self.counters = {}
+        self.__previous = None
+
+    def __enter__(self):
+        global _recorder
+        self.__previous = _recorder
+        _recorder = self
+        for sink in self.sinks:
+            sink.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        global _recorder
+        _recorder = self.__previous
+        for sink in self.sinks:
+            sink.close()
+
+    @contextlib.contextmanager
+    def span(self, name):
+        """Times the enclosed block
+
+        :param name: name of the stage
+        :type name: string
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            count, total = self.spans.get(name, (0, 0.))
+            self.spans[name] = (count + 1, total + elapsed)
+            self.emit({'event': 'span', 'name': name, 'elapsed': elapsed})
+
+    def count(self, **counts):
+        """Adds to the counters
+
+        :param counts: value to add for each counter name
+        :return: None
+        """
+        for name, value in counts.items():
+            self.counters[name] = self.counters.get(name, 0) + int(value)
+        self.emit(dict({'event': 'count'}, **counts))
+
+    def emit(self, event):
+        """Passes an event on to the sinks
+
+        :param event: event, see Sink.emit
+        :type event: dict
+        :return: None
+        """
+        event['pid'] = os.getpid()
+        for sink in self.sinks:
+            sink.emit(event)
+
+    def summary(self):
+        """Totals of the recording
+
+        :return: 'spans' mapping each stage to its 'count' and 'total'
+            seconds, and 'counters' mapping each counter to its total
+        :rtype: dict
+        """
+        return {'spans': {name: {'count': count, 'total': total}
+                          for name, (count, total) in self.spans.items()},
+                'counters': dict(self.counters)}
+
+
+def active():
+    """Recorder currently recording, if any
+
+    :return: active recorder, or None
+    :rtype: Recorder
+    """
+    return _recorder
+
+
+def span(name):
+    """Times the enclosed block if a recorder is active
+
+    :param name: name of the stage
+    :type name: string
+    :return: context manager
+    """
+    if _recorder is None:
+        return contextlib.nullcontext()
+    return _recorder.span(name)
+
+
+def count(**counts):
+    """Adds to the counters if a recorder is active
+
+    :param counts: value to add for each counter name
+    :return: None
+    """
+    if _recorder is not None:
+        _recorder.count(**counts)
+
+
+def timed(name):
+    """Decorator timing each call of a function as a span
+
+    :param name: name of the stage
+    :type name: string
+    :return: decorator
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if _recorder is None:
+                return function(*args, **kwargs)
+            with _recorder.span(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def merge(summaries):
+    """Adds up the summaries of many recordings
+
+    :param summaries: summaries from Recorder.summary
+    :type summaries: iterable of dicts
+    :return: summary of the totals
+    :rtype: dict
+    """
+    merged = {'spans': {}, 'counters': {}}
+    for summary in summaries:
+        for name, span in summary['spans'].items():
+            total = merged['spans'].setdefault(name, {'count': 0,
+                                                      'total': 0.})
+            total['count'] += span['count']
+            total['total'] += span['total']
+        for name, value in summary['counters'].items():
+            merged['counters'][name] = merged['counters'].get(name, 0) + value
+    return merged
+
+
+def format_summary(summary):
+    """Table of a summary, with the stages by decreasing total time
+
+    :param summary: summary from Recorder.summary or merge
+    :type summary: dict
+    :return: text table
+    :rtype: string
+    """
+    lines = ['{0:<20} {1:>8} {2:>12}'.format('stage', 'calls', 'total (s)')]
+    spans = sorted(summary['spans'].items(),
+                   key=lambda item: item[1]['total'], reverse=True)
+    for name, span in spans:
+        lines.append('{0:<20} {1:>8} {2:>12.6f}'.format(
+            name, span['count'], span['total']))
+    for name, value in sorted(summary['counters'].items()):
+        lines.append('{0:<20} {1:>8}'.format(name, value))
+    return '\n'.join(lines)
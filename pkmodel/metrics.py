@@ -0,0 +1,141 @@
+"""metrics.py computes summary statistics of PK model solutions for each
+compartment in a single vectorised pass over the stored time points:
+
+| AUC = area under the quantity-time curve (trapezoidal rule)
+| Cmax, Tmax = maximum quantity and the time it is first reached
+| Cmin = minimum quantity
+| half_life = terminal half-life, ln(2) / k, where k is the elimination rate
+    of a log-linear fit over the terminal phase
+| time_above = time spent above a threshold quantity, with the crossings
+    interpolated linearly
+
+The statistics are only as accurate as the time grid they are computed on.
+
+Given the sensitivities dy / dtheta of the solution, the derivatives of AUC,
+Cmax and Cmin follow on the same grid: AUC is linear in y, and Cmax and Cmin
+move with y at the time point where they are reached.
+"""
+
+import numpy as np
+
+METRICS = ('AUC', 'Cmax', 'Tmax', 'Cmin', 'half_life', 'time_above')
+# metrics differentiated by metric_sensitivities
+SENSITIVITY_METRICS = ('AUC', 'Cmax', 'Cmin')
+
+
+def compute_metrics(y, t, threshold=None, terminal_fraction=0.25):
+    """Computes the summary statistics of one or a stack of solutions.
+
+    :param y: quantities with dimensions ... x T, for instance N x T for a
+        single solution or M x N x T for a batch of solutions
+    :type y: array of float
+    :param t: T sorted time points
+    :type t: array of float
+    :param threshold: quantity for time_above, defaults to None in which
+        case time_above is not computed (NaN)
+    :type threshold: float, optional
+    :param terminal_fraction: fraction of the time interval at its end
+        used to fit the terminal half-life, defaults to 0.25
+    :type terminal_fraction: float, optional
+    :return: arrays with dimensions ... of each statistic in METRICS
+    :rtype: dict
+    """
+    y = np.asarray(y, dtype=float)
+    t = np.asarray(t, dtype=float)
+    dt = np.diff(t)
+    peak = np.argmax(y, axis=-1)
+    metrics = {
+        'AUC': np.sum(dt * (y[..., 1:] + y[..., :-1]) / 2., axis=-1),
+        'Cmax': np.take_along_axis(y, peak[..., None], axis=-1)[..., 0],
+        'Tmax': t[peak],
+        'Cmin': np.min(y, axis=-1),
+        'half_life': terminal_half_life(y, t, terminal_fraction),
+        'time_above': np.full(y.shape[:-1], np.nan),
+    }
+    if threshold is not None:
+        metrics['time_above'] = time_above(y, t, threshold)
+    return metrics
+
+
+def metric_sensitivities(y, dy, t):
+    """Derivatives of the AUC, Cmax and Cmin of a solution with respect to
+    one or several parameters, from the sensitivities of the solution.
+
+    :param y: quantities with dimensions ... x T
+    :type y: array of float
+    :param dy: derivatives of the quantities with dimensions P x ... x T,
+        for P parameters
+    :type dy: array of float
+    :param t: T sorted time points
+    :type t: array of float
+    :return: arrays with dimensions P x ... of the derivative of each
+        statistic in SENSITIVITY_METRICS
+    :rtype: dict
+    """
+    y = np.asarray(y, dtype=float)
+    dy = np.asarray(dy, dtype=float)
+    t = np.asarray(t, dtype=float)
+    dt = np.diff(t)
+
+    def at(index):
+        index = np.broadcast_to(index[..., None], dy.shape[:-1] + (1,))
+        return np.take_along_axis(dy, index, axis=-1)[..., 0]
+
+    return {
+        'AUC': np.sum(dt * (dy[..., 1:] + dy[..., :-1]) / 2., axis=-1),
+        'Cmax': at(np.argmax(y, axis=-1)),
+        'Cmin': at(np.argmin(y, axis=-1)),
+    }
+
+
+def terminal_half_life(y, t, terminal_fraction=0.25):
+    """Terminal half-life from a least squares fit of ln(y) against t over
+    the positive quantities in the terminal phase.
+
+    :param y: quantities with dimensions ... x T
+    :type y: array of float
+    :param t: T sorted time points
+    :type t: array of float
+    :param terminal_fraction: fraction of the time interval at its end
+        used for the fit, defaults to 0.25
+    :type terminal_fraction: float, optional
+    :return: half-lives with dimensions ..., NaN where the quantity is not
+        declining or fewer than two points are available
+    :rtype: array of float
+    """
+    terminal = t >= t[-1] - terminal_fraction * (t[-1] - t[0])
+    y, t = y[..., terminal], t[terminal]
+    weight = (y > 0).astype(float)
+    log_y = np.log(np.where(y > 0, y, 1.))
+    n = np.sum(weight, axis=-1)
+    sum_t = np.sum(weight * t, axis=-1)
+    sum_log_y = np.sum(weight * log_y, axis=-1)
+    covariance = n * np.sum(weight * t * log_y, axis=-1) - sum_t * sum_log_y
+    variance = n * np.sum(weight * t ** 2, axis=-1) - sum_t ** 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = covariance / variance
+        half_life = np.log(2.) / -slope
+    return np.where((n >= 2) & (slope < 0), half_life, np.nan)
+
+
+def time_above(y, t, threshold):
+    """Time spent above a threshold quantity, interpolating the crossings of
+    the threshold linearly between time points.
+
+    :param y: quantities with dimensions ... x T
+    :type y: array of float
+    :param t: T sorted time points
+    :type t: array of float
+    :param threshold: threshold quantity
+    :type threshold: float
+    :return: time above the threshold with dimensions ...
+    :rtype: array of float
+    """
+    start = y[..., :-1] - threshold
+    end = y[..., 1:] - threshold
+    # fraction of each interval spent above the threshold
+    with np.errstate(divide='ignore', invalid='ignore'):
+        crossing = np.maximum(start, end) / np.abs(end - start)
+    fraction = np.where((start >= 0) & (end >= 0), 1.,
+                        np.where((start < 0) & (end < 0), 0., crossing))
+    return np.sum(np.diff(t) * fraction, axis=-1)
@@ -5,36 +5,263 @@ model subclasses.
 :rtype: Solution object
 """
 
+import time
 import numpy as np
 import scipy.integrate
+import scipy.optimize
+import scipy.sparse
 from pkmodel.solution import Solution
+from pkmodel import _jit
 from pkmodel.AbstractModel import AbstractModel
-from pkmodel.dose import select_dose
+from pkmodel.analytic import (expm_response, linear_response,
+                              segment_index)
+from pkmodel.cache import resolve_cache, solution_key
+from pkmodel import instrumentation
+from pkmodel.dose import dose_segments, select_dose
+from pkmodel.parameters import freeze
+
+# solve_ivp methods making use of the Jacobian
+IMPLICIT_METHODS = ('Radau', 'BDF', 'LSODA')
+# ratio between the slowest relevant and the fastest time scale of the
+# system above which it is treated as stiff
+STIFFNESS_THRESHOLD = 1e3
+# total number of compartments from which the rate matrix is stored sparse,
+# with the 'sparse' parameter left to 'auto'
+SPARSE_THRESHOLD = 100
+# flow types of GraphModel, and the symbols of their values in
+# parameter_names
+FLOW_TYPES = ('clearance', 'exchange', 'absorption')
+FLOW_SYMBOLS = {'clearance': 'CL', 'exchange': 'Q', 'absorption': 'k'}
+
+
+def integrate_piecewise(A, b, bounds, inputs, t_eval, method,
+                        dense_output=False):
+    """Integrates dq/dt = A q + u b from q(0) = 0 with scipy solve_ivp, where
+    u is constant on each segment [bounds[s], bounds[s + 1]). The integration
+    restarts at every segment boundary from the current state.
+
+    :param A: rate matrix with dimensions N x N, dense or sparse
+    :type A: array of float or sparse matrix
+    :param b: dose input vector with dimensions N
+    :type b: array of float
+    :param bounds: S + 1 sorted segment boundaries, starting at 0
+    :type bounds: array of float
+    :param inputs: S input values u, one for each segment
+    :type inputs: array of float
+    :param t_eval: T sorted time points at which to store the solution, or
+        None to store the steps taken by the solver
+    :type t_eval: array of float
+    :param method: solve_ivp method; implicit methods are given A as the
+        Jacobian
+    :type method: string
+    :param dense_output: whether to return the continuous solution over all
+        segments as sol, defaults to False
+    :type dense_output: bool, optional
+    :return: result with the t, y, sol, nfev, njev, nlu, status, message and
+        success fields of solve_ivp, accumulated over the segments
+    :rtype: OptimizeResult
+    """
+    options = _jacobian_options(A, method)
+    q = np.zeros(len(b))
+    result = scipy.optimize.OptimizeResult(
+        t=t_eval, y=None, sol=None, nfev=0, njev=0, nlu=0, status=0,
+        success=True,
+        message='The solver successfully reached the end of the '
+                'integration interval.')
+    segment = None
+    if t_eval is not None:
+        result.y = np.full((len(b), len(t_eval)), np.nan)
+        segment = segment_index(bounds, t_eval)
+    solutions = []
+    for s, u in enumerate(inputs):
+        index, t_segment = _segment_times(t_eval, segment, s, bounds[s + 1])
+        if bounds[s + 1] <= bounds[s]:
+            # zero-length segment, the state holds
+            _store_times(result, index, q[:, None])
+            continue
+        sol = scipy.integrate.solve_ivp(
+            fun=lambda t, q, u=u: A @ q + u * b,
+            t_span=[bounds[s], bounds[s + 1]],
+            y0=q,
+            t_eval=t_segment,
+            method=method,
+            dense_output=dense_output,
+            **options)
+        for counter in 'nfev', 'njev', 'nlu':
+            result[counter] += sol[counter]
+        if not sol.success:
+            result.update(status=sol.status, message=sol.message,
+                          success=False)
+            break
+        _store_times(result, index, sol.y)
+        if t_eval is None or dense_output:
+            solutions.append(sol)
+        q = sol.y[:, -1]
+    if t_eval is None:
+        result.t, result.y = _stitch_steps(bounds[0], np.zeros(len(b)),
+                                           solutions)
+    if dense_output and result.success:
+        result.sol = _stitch_dense(bounds[0], q, solutions)
+    return result
+
+
+def time_points(output_grid, end):
+    """Time points of an output grid over [0, end]
+
+    :param output_grid: number of evenly spaced time points from 0 to end,
+        or sorted sequence of time points within that interval
+    :type output_grid: int or sequence of float
+    :param end: end of the interval
+    :type end: float
+    :raises ValueError: If the time points are not sorted or lie outside
+        the interval
+    :return: time points
+    :rtype: array of float
+    """
+    if np.ndim(output_grid) == 0:
+        return np.linspace(0, end, int(output_grid))
+    t_eval = np.asarray(output_grid, dtype=float)
+    if (t_eval.ndim != 1 or np.any(np.diff(t_eval) < 0)
+            or np.any(t_eval < 0) or np.any(t_eval > end)):
+        raise ValueError('output_grid times should be sorted and lie '
+                         'between 0 and time')
+    return t_eval
+
+
+def _jacobian_options(A, method):
+    """solve_ivp options giving the constant Jacobian A to implicit methods
+
+    :return: keyword arguments of solve_ivp
+    :rtype: dict
+    """
+    if method == 'LSODA':
+        # LSODA only accepts the Jacobian as a function of a dense matrix
+        dense = A.toarray() if scipy.sparse.issparse(A) else A
+        return {'jac': lambda t, y: dense}
+    if method in IMPLICIT_METHODS:
+        return {'jac': A}
+    return {}
+
+
+def _segment_times(t_eval, segment, s, end):
+    """Time points of t_eval on segment s, with the segment end appended if
+    missing, so that the next segment starts from the state at its end
+
+    :return: indices in t_eval of the time points on the segment, and the
+        time points to store on the segment; None for both if t_eval is None
+    :rtype: tuple of arrays
+    """
+    if t_eval is None:
+        return None, None
+    index = np.nonzero(segment == s)[0]
+    t_segment = t_eval[index]
+    if not t_segment.size or t_segment[-1] < end:
+        t_segment = np.append(t_segment, end)
+    return index, t_segment
+
+
+def _store_times(result, index, y):
+    """Stores the amounts y at the time points of result.t given by index,
+    from the first column of y on; nothing is stored if index is None
+
+    :return: None
+    """
+    if index is not None:
+        result.y[:, index] = y[:, :len(index)]
+
+
+def _stitch_steps(t0, q0, solutions):
+    """Steps taken over consecutive segments, starting from t0 and q0; the
+    start of each segment is the end of the previous one, so it is dropped
+
+    :return: time points and amounts of all steps
+    :rtype: tuple of arrays
+    """
+    t = np.concatenate([[t0]] + [sol.t[1:] for sol in solutions])
+    y = np.concatenate([q0[:, None]] + [sol.y[:, 1:] for sol in solutions],
+                       axis=1)
+    return t, y
+
+
+def _stitch_dense(t0, q, solutions):
+    """Continuous solution over consecutive segments from their dense output,
+    or the constant state q if there are no segments of nonzero length
+
+    :rtype: OdeSolution or function
+    """
+    if not solutions:
+        return lambda t: np.multiply.outer(q, np.ones(np.shape(t)))
+    ts = np.concatenate([[t0]] + [sol.sol.ts[1:] for sol in solutions])
+    interpolants = [interpolant for sol in solutions
+                    for interpolant in sol.sol.interpolants]
+    return scipy.integrate.OdeSolution(ts, interpolants)
+
+
+def _parameter(key):
+    """Read-only property of a model reading a parameter from its frozen
+    parameters, rather than holding a copy of it"""
+    return property(lambda self: getattr(self.parameters, key),
+                    doc=f'{key} parameter of the model, read-only')
 
 
 class Model(AbstractModel):
     """Base model for PK 1st order linear ODE model with variable
     number of peripheral compartments.
 
+    The linear system is assembled once on construction into a rate matrix
+    A and a dose input vector b, so that the right hand side reduces to
+    dq/dt = A q + Dose(t) b.
+
     :param parameters: parameters and constants of the model
-    :type parameters: dict
+    :type parameters: dict or Parameters
     """
+    __slots__ = ('parameters', 'nr_compartments', 'dose_mode', 'dose',
+                 'output_grid', 'sparse', 'rate_matrix', 'dose_vector')
+    base_compartments = 0
+    base_parameters = ('CL', 'V_c', 'X')
+
     def __init__(self, parameters):
         """Constructor for base model of PK 1st order linear ODE model
         with variable number of peripheral compartments.
 
-        :param parameters: parameters and constants of the model
-        :type parameters: dict
-        """
-        self.parameters = parameters
-        self.name = parameters['name']
-        self.nr_compartments = parameters['nr_compartments']
-        self.CL = parameters['CL']
-        self.V_c = parameters['V_c']
-        self.X = parameters['X']
-        self.dose = select_dose(parameters['dose_mode'])
-        self.base_compartments = 0
-        self.time = parameters['time']
+        :param parameters: parameters and constants of the model, frozen
+            into immutable Parameters if given as a dict
+        :type parameters: dict or Parameters
+        """
+        self.parameters = freeze(parameters)
+        self._init_compartments()
+        self.dose_mode = self.parameters['dose_mode']
+        self.dose = select_dose(self.dose_mode)
+        self.output_grid = self.parameters.get('output_grid', 1000)
+        self.sparse = self.parameters.get('sparse', 'auto')
+        if self.sparse == 'auto':
+            self.sparse = (self.nr_compartments + self.base_compartments
+                           >= SPARSE_THRESHOLD)
+        self.rate_matrix = self.generate_rate_matrix()
+        self.dose_vector = self.generate_dose_vector()
+
+    def _init_compartments(self):
+        """Reads the compartments of the model from its parameters, before
+        the rate matrix is assembled
+
+        :return: None
+        """
+        self.nr_compartments = self.parameters['nr_compartments']
+
+    name = _parameter('name')
+    CL = _parameter('CL')
+    V_c = _parameter('V_c')
+    X = _parameter('X')
+    time = _parameter('time')
+
+    @property
+    def periph(self):
+        """(V_p, Q_p) rows for each peripheral compartment, read-only
+
+        :return: array with dimensions nr_compartments x 2
+        :rtype: array of float
+        """
+        return self.parameters.periph
 
     def generate_transition(self, parameter_tuple, q_central, q_peripheral):
         """Helper function computes single transition equation
@@ -60,82 +287,775 @@ class Model(AbstractModel):
                                      - q_peripheral / V_peripheral)
         return transition
 
-    def solve(self):
-        """Function computes the numeric solution of the PK ODE model with
-        scipy solve_ivp for a specified time interval.
+    def parameter_names(self):
+        """Names of the model parameters, in the order of the parameter
+        vectors taken by rate_matrices and solve_batch. The peripheral
+        compartments' (V_p, Q_p) tuples are listed as V_p1, Q_p1, V_p2, ...
+
+        :return: parameter names
+        :rtype: list of strings
+        """
+        names = list(self.base_parameters)
+        for i in range(1, self.nr_compartments + 1):
+            names += [f'V_p{i}', f'Q_p{i}']
+        return names
+
+    def parameter_vector(self):
+        """Values of the model parameters, in the order of parameter_names.
+
+        :return: parameter vector with dimensions P
+        :rtype: array of float
+        """
+        return np.concatenate([[getattr(self, name)
+                                for name in self.base_parameters],
+                               self.periph.ravel()]).astype(float)
+
+    def parameter_dict(self, theta):
+        """Parameters of the model with the values of a parameter vector, to
+        build a model of the same structure from, e.g. after a fit.
+
+        :param theta: parameter vector, ordered as parameter_names
+        :type theta: array of float
+        :return: parameters and constants of the model
+        :rtype: dict
+        """
+        theta = [float(value) for value in theta]
+        nr_base = len(self.base_parameters)
+        parameters = dict(self.parameters,
+                          **dict(zip(self.base_parameters, theta)))
+        for i in range(1, self.nr_compartments + 1):
+            parameters[f'periph_{i}'] = tuple(
+                theta[nr_base + 2 * i - 2:nr_base + 2 * i])
+        return parameters
+
+    def volume_names(self):
+        """Names of the parameter holding the volume of each compartment,
+        in the order of the state vector, to convert amounts into
+        concentrations.
+
+        :return: parameter name, or None for the absorption compartment
+        :rtype: list of strings
+        """
+        names = [None] * (self.base_compartments - 1)
+        if self.base_compartments:
+            names.append('V_c')
+        return names + [f'V_p{i}'
+                        for i in range(1, self.nr_compartments + 1)]
+
+    def rate_matrices(self, theta):
+        """Builds the rate matrix for the central compartment, its clearance
+        and the exchange with every peripheral compartment, for one or a
+        stack of parameter vectors.
+
+        The central compartment is the last base compartment and the
+        peripheral compartments follow the base compartments in order. The
+        number of peripheral compartments is given by the length of the
+        parameter vectors, so that the base parameters alone give the rate
+        matrix of the base compartments.
+
+        :param theta: parameter vectors, ordered as parameter_names, with
+            dimensions ... x P
+        :type theta: array of float
+        :return: rate matrices A with dimensions ... x N x N, where N is the
+            total number of compartments
+        :rtype: array of float
+        """
+        theta = np.asarray(theta, dtype=float)
+        n = self.base_compartments + (theta.shape[-1]
+                                      - len(self.base_parameters)) // 2
+        matrix = np.zeros(theta.shape[:-1] + (n, n))
+        if not self.base_compartments:
+            # the base model has no central compartment to couple to
+            return matrix
+        c = self.base_compartments - 1
+        p = np.arange(self.base_compartments, n)
+        CL, V_c = theta[..., 0], theta[..., 1]
+        periph = theta[..., len(self.base_parameters):]
+        V_p, Q_p = periph[..., 0::2], periph[..., 1::2]
+        matrix[..., c, c] = -1. / (V_c * CL) - np.sum(Q_p, axis=-1) / V_c
+        matrix[..., c, p] = Q_p / V_p
+        matrix[..., p, c] = Q_p / V_c[..., None]
+        matrix[..., p, p] = -Q_p / V_p
+        return matrix
+
+    def derivative_entries(self, theta=None):
+        """Non-zero entries of the derivatives of the rate matrix with
+        respect to each model parameter, in closed form and in COO format,
+        so that sparse models never form the dense derivatives. Entries at
+        the same position are summed.
+
+        :param theta: parameter vector, ordered as parameter_names; defaults
+            to the parameter vector of the model
+        :type theta: array of float, optional
+        :return: values, (parameter, row, column) indices of the entries,
+            and shape P x N x N of dA / dtheta, where P is the number of
+            parameters and N the total number of compartments
+        :rtype: tuple
+        """
+        if theta is None:
+            theta = self.parameter_vector()
+        theta = np.asarray(theta, dtype=float)
+        nr_base = len(self.base_parameters)
+        n = self.base_compartments + (len(theta) - nr_base) // 2
+        shape = (len(theta), n, n)
+        if not self.base_compartments:
+            empty = np.zeros(0, dtype=int)
+            return np.zeros(0), (empty, empty, empty), shape
+        c = self.base_compartments - 1
+        p = np.arange(self.base_compartments, n)
+        central = np.full(len(p), c)
+        CL, V_c = theta[0], theta[1]
+        V_p, Q_p = theta[nr_base::2], theta[nr_base + 1::2]
+        # V_p and Q_p of each peripheral compartment
+        i_V = nr_base + 2 * np.arange(len(p))
+        i_Q = i_V + 1
+        params = np.concatenate([[0, 1], np.ones(len(p), dtype=int),
+                                 i_V, i_V, i_Q, i_Q, i_Q, i_Q])
+        rows = np.concatenate([[c, c], p, central, p, central, central, p,
+                               p])
+        cols = np.concatenate([[c, c], central, p, p, central, p, central,
+                               p])
+        values = np.concatenate([
+            [1. / (V_c * CL ** 2), (1. / CL + np.sum(Q_p)) / V_c ** 2],
+            -Q_p / V_c ** 2, -Q_p / V_p ** 2, Q_p / V_p ** 2,
+            np.full(len(p), -1. / V_c), 1. / V_p, np.full(len(p), 1. / V_c),
+            -1. / V_p])
+        return values, (params, rows, cols), shape
+
+    def rate_matrix_derivatives(self, theta=None):
+        """Derivatives of the rate matrix with respect to each model
+        parameter, in closed form, as a dense array (see derivative_entries).
+
+        :param theta: parameter vector, ordered as parameter_names; defaults
+            to the parameter vector of the model
+        :type theta: array of float, optional
+        :return: dA / dtheta with dimensions P x N x N, where P is the number
+            of parameters and N the total number of compartments
+        :rtype: array of float
+        """
+        values, index, shape = self.derivative_entries(theta)
+        derivatives = np.zeros(shape)
+        np.add.at(derivatives, index, values)
+        return derivatives
+
+    def generate_rate_matrix(self):
+        """Builds the rate matrix of the model from its parameters, as a
+        sparse matrix if the model is sparse.
+
+        :return: rate matrix A with dimensions N x N, where N is the total
+            number of compartments
+        :rtype: array of float or sparse matrix
+        """
+        if self.sparse:
+            return self.sparse_rate_matrix()
+        return self.rate_matrices(self.parameter_vector())
+
+    def sparse_rate_matrix(self, theta=None):
+        """Builds the rate matrix of the model in CSR format. The central
+        compartment is coupled to every peripheral compartment, and those
+        only to the central one, so the matrix is an arrowhead with O(N)
+        non-zero entries, built without forming the dense matrix.
+
+        :param theta: parameter vector, ordered as parameter_names; defaults
+            to the parameter vector of the model
+        :type theta: array of float, optional
+        :return: rate matrix A with dimensions N x N, where N is the total
+            number of compartments
+        :rtype: scipy.sparse.csr_matrix
+        """
+        if theta is None:
+            theta = self.parameter_vector()
+        theta = np.asarray(theta, dtype=float)
+        nr_base = len(self.base_parameters)
+        base = self.rate_matrices(theta[:nr_base])
+        nr_periph = (len(theta) - nr_base) // 2
+        n = nr_periph + self.base_compartments
+        if not self.base_compartments:
+            return scipy.sparse.csr_matrix((n, n))
+        c = self.base_compartments - 1
+        p = np.arange(self.base_compartments, n)
+        central = np.full(nr_periph, c)
+        V_c = theta[1]
+        V_p, Q_p = theta[nr_base::2], theta[nr_base + 1::2]
+        base_rows, base_cols = np.nonzero(base)
+        # the exchange terms of the central compartment's own rate are
+        # summed with its base rate on conversion to CSR
+        rows = np.concatenate([base_rows, [c], central, p, p])
+        cols = np.concatenate([base_cols, [c], p, central, p])
+        values = np.concatenate([base[base_rows, base_cols],
+                                 [-np.sum(Q_p) / V_c], Q_p / V_p,
+                                 Q_p / V_c, -Q_p / V_p])
+        return scipy.sparse.coo_matrix((values, (rows, cols)),
+                                       shape=(n, n)).tocsr()
+
+    def generate_dose_vector(self):
+        """Builds the vector selecting the compartment(s) receiving the dose.
+
+        :return: dose input vector b with dimensions N, where N is the total
+            number of compartments
+        :rtype: array of float
+        """
+        vector = np.zeros(self.nr_compartments + self.base_compartments)
+        if self.base_compartments:
+            vector[0] = 1.
+        return vector
+
+    def rhs(self, t, y):
+        """Right Hand Side (rhs) of the ODE model, dq/dt = A q + Dose(t) b,
+        with the rate matrix A and dose vector b precomputed on construction.
+        Called within scipy solve_ivp.
+
+        :param t: current time point
+        :type t: float
+        :param y: current amount in compartment at time point t with
+            dimensions N where N is total number of compartments
+        :type y: array of float
+        :return: dq_dt - an array of all compartments' dq_dt values at time t
+            with dimensions N where N is total number of compartments
+        :rtype: array of float
+        """
+        return self.rate_matrix @ y + self.dose(t, self.X) * self.dose_vector
+
+    @property
+    def jacobian(self):
+        """Jacobian of the rhs with respect to q. As the model is linear
+        this is the constant rate matrix.
+
+        :return: Jacobian with dimensions N x N, where N is the total number
+            of compartments
+        :rtype: array of float or sparse matrix
+        """
+        return self.rate_matrix
+
+    @property
+    def jac_sparsity(self):
+        """Sparsity pattern of the Jacobian, with ones where the rates of
+        the compartments depend on each other, for solvers estimating the
+        Jacobian by finite differences.
+
+        :return: pattern with dimensions N x N, where N is the total number
+            of compartments
+        :rtype: scipy.sparse.csr_matrix
+        """
+        pattern = scipy.sparse.csr_matrix(self.rate_matrix, dtype=float,
+                                          copy=True)
+        pattern.data[:] = 1.
+        return pattern
+
+    def stiffness_ratio(self, matrix=None):
+        """Estimates the stiffness of the model from the spread of the
+        eigenvalues of the rate matrix: the ratio between the slowest time
+        scale relevant over the solve interval (bounded by the interval
+        itself) and the fastest time scale.
+
+        For a sparse rate matrix the eigenvalues are not computed: the
+        fastest rate is bounded with the Gershgorin discs and the slowest
+        relevant rate is taken as 1 / time, which can only overestimate the
+        stiffness.
+
+        :param matrix: rate matrix, or stack of rate matrices forming a block
+            system; defaults to the rate matrix of the model
+        :type matrix: array of float or sparse matrix, optional
+        :return: stiffness ratio, 0 for a model without dynamics
+        :rtype: float
+        """
+        if matrix is None:
+            matrix = self.rate_matrix
+        if scipy.sparse.issparse(matrix):
+            fastest = np.max(abs(matrix).sum(axis=1).A1, initial=0.)
+            return fastest * self.time
+        rates = np.abs(np.linalg.eigvals(matrix).real)
+        rates = rates[rates > 0]
+        if not rates.size:
+            return 0.
+        slowest = np.min(rates)
+        if self.time:
+            slowest = max(slowest, 1. / self.time)
+        return np.max(rates) / slowest
+
+    def select_method(self, method='auto', matrix=None):
+        """Selects the solve_ivp integration method. With 'auto', stiff
+        models (see stiffness_ratio) are integrated with the implicit BDF
+        method and all others with the explicit RK45 method.
+
+        :param method: solve_ivp method name or 'auto', defaults to 'auto'
+        :type method: string, optional
+        :param matrix: rate matrix, or stack of rate matrices forming a block
+            system; defaults to the rate matrix of the model
+        :type matrix: array of float, optional
+        :return: solve_ivp method name
+        :rtype: string
+        """
+        if method != 'auto':
+            return method
+        if self.stiffness_ratio(matrix) > STIFFNESS_THRESHOLD:
+            return 'BDF'
+        return 'RK45'
+
+    def dose_segments(self, X=None):
+        """Splits the solve interval into segments of constant dose.
+
+        :param X: amount of dose administered, defaults to X of the model
+        :type X: float, optional
+        :return: S + 1 segment boundaries from 0 to time, and the S dose
+            values administered within each segment
+        :rtype: tuple of arrays of float
+        """
+        if X is None:
+            X = self.X
+        return dose_segments(self.dose_mode, X, self.time)
+
+    def output_times(self, output_grid=None):
+        """Time points at which the solution is stored.
+
+        :param output_grid: number of evenly spaced time points from 0 to
+            time, sorted sequence of time points within that interval, or
+            'steps' to store the steps taken by the solver only; defaults to
+            the 'output_grid' parameter of the model, or 1000 points if not set
+        :type output_grid: int, sequence of float or string, optional
+        :raises ValueError: If the output grid is not one of the above
+        :return: time points, or None for the solver steps
+        :rtype: array of float
+        """
+        if output_grid is None:
+            output_grid = self.output_grid
+        if isinstance(output_grid, str):
+            if output_grid != 'steps':
+                raise ValueError('output_grid should be a number of points, '
+                                 "a sequence of times or 'steps'")
+            return None
+        return time_points(output_grid, self.time)
+
+    def integrate(self, t_eval, method='auto', dense_output=False):
+        """Integrates the PK ODE model numerically with scipy solve_ivp,
+        piecewise between the switch times of the dose function so that the
+        integrator never steps across a change of dose.
+
+        Implicit methods (Radau, BDF, LSODA) are given the constant
+        Jacobian of the model.
+
+        :param t_eval: time points at which to store the solution, or None
+            to store the steps taken by the solver
+        :type t_eval: array of float
+        :param method: solve_ivp method, or 'auto' to pick an implicit method
+            for stiff models only; defaults to 'auto'
+        :type method: string, optional
+        :param dense_output: whether to compute the continuous solution,
+            defaults to False
+        :type dense_output: bool, optional
+        :return: result with the same fields as solve_ivp, summed over the
+            dose segments
+        :rtype: OptimizeResult
+        """
+        bounds, inputs = self.dose_segments()
+        return integrate_piecewise(self.rate_matrix, self.dose_vector,
+                                   bounds, inputs, t_eval,
+                                   self.select_method(method), dense_output)
+
+    def jit_integrate(self, t_eval, method='auto', dense_output=False):
+        """Integrates the PK ODE model with the compiled Runge-Kutta kernel
+        of _jit.py, which runs the whole solve in native code. Falls back to
+        integrate when numba is not installed, or when the kernel does not
+        apply: stiff models or methods other than RK45, dense output, no
+        output grid, or a sparse rate matrix.
+
+        :param t_eval: time points at which to store the solution, or None
+            to store the steps taken by the solver
+        :type t_eval: array of float
+        :param method: solve_ivp method, or 'auto' to pick an implicit method
+            for stiff models only; defaults to 'auto'
+        :type method: string, optional
+        :param dense_output: whether to compute the continuous solution,
+            defaults to False
+        :type dense_output: bool, optional
+        :return: result with the same fields as solve_ivp
+        :rtype: OptimizeResult
+        """
+        method = self.select_method(method)
+        if (not _jit.HAS_NUMBA or method != 'RK45' or dense_output
+                or t_eval is None or self.sparse):
+            return self.integrate(t_eval, method, dense_output)
+        bounds, inputs = self.dose_segments()
+        y, nfev, status = _jit.compile_kernels()(
+            self.rate_matrix, self.dose_vector, bounds, inputs, t_eval)
+        message = ('The solver successfully reached the end of the '
+                   'integration interval.' if status == 0 else
+                   'Required step size is less than spacing between numbers.')
+        return scipy.optimize.OptimizeResult(
+            t=t_eval, y=y, sol=None, nfev=nfev, njev=0, nlu=0, status=status,
+            message=message, success=status == 0)
+
+    def analytic_solution(self, t_eval, dense_output=False):
+        """Computes the exact solution of the PK ODE model with the matrix
+        exponential of the rate matrix, stitching together the segments of
+        constant dose.
+
+        :param t_eval: time points at which to evaluate the solution, or None
+            for the dose switch times only
+        :type t_eval: array of float
+        :param dense_output: whether to return the solution as a function of
+            time as well, defaults to False
+        :type dense_output: bool, optional
+        :return: result with the same t, y and sol fields as solve_ivp
+        :rtype: OptimizeResult
+        """
+        bounds, inputs = self.dose_segments()
+        if t_eval is None:
+            t_eval = bounds
+        A = self.rate_matrix
+        if self.sparse:
+            # the matrix exponential is dense
+            A = A.toarray()
+        y = linear_response(A, self.dose_vector, bounds, inputs, t_eval)
+        result = scipy.optimize.OptimizeResult(
+            t=t_eval, y=y, sol=None, nfev=0, njev=0, nlu=0, status=0,
+            message='Analytic solution.', success=True)
+        if dense_output:
+            def sol(t):
+                t = np.asarray(t, dtype=float)
+                y = linear_response(A, self.dose_vector, bounds, inputs,
+                                    np.atleast_1d(t))
+                return y if t.ndim else y[:, 0]
+            result.sol = sol
+        return result
+
+    def sensitivity_system(self, theta=None, wrt=None):
+        """Builds the linear system of the forward sensitivities, the amounts
+        q augmented with their derivatives s_p = dq / dtheta_p with respect
+        to the parameters of parameter_names:
+
+        | dq / dt = A q + Dose(t) b
+        | ds_p / dt = A s_p + (dA / dtheta_p) q + (dX / dtheta_p) Dose(t) b / X
+
+        The system z = [q, s_1, ..., s_P] is again linear with a block lower
+        triangular rate matrix and a dose input for a unit dose, so that it
+        is solved in a single pass by the solvers of the model itself.
+
+        :param theta: parameter vector, ordered as parameter_names; defaults
+            to the parameter vector of the model
+        :type theta: array of float, optional
+        :param wrt: indices in parameter_names of the P parameters to
+            differentiate with respect to; defaults to all parameters
+        :type wrt: sequence of int, optional
+        :return: rate matrix with dimensions (P + 1) N x (P + 1) N, sparse if
+            the model is sparse, and dose input vector with dimensions
+            (P + 1) N for a unit dose
+        :rtype: tuple
+        """
+        if theta is None:
+            rate_matrix = self.rate_matrix
+            theta = self.parameter_vector()
+        else:
+            theta = np.asarray(theta, dtype=float)
+            rate_matrix = (self.sparse_rate_matrix(theta) if self.sparse
+                           else self.rate_matrices(theta))
+        if wrt is None:
+            wrt = np.arange(len(theta))
+        wrt = list(wrt)
+        nr_parameters, n = len(wrt), len(self.dose_vector)
+        # dA / dtheta_p couples q into each s_p, in the first block column
+        if self.sparse:
+            matrix = scipy.sparse.kron(
+                scipy.sparse.identity(nr_parameters + 1), rate_matrix,
+                format='csr') + self.sparse_coupling(theta, wrt)
+        else:
+            matrix = np.kron(np.eye(nr_parameters + 1), rate_matrix)
+            matrix[n:, :n] = self.rate_matrix_derivatives(
+                theta)[wrt].reshape(-1, n)
+        vector = np.zeros((nr_parameters + 1, n))
+        X = self.parameter_names().index('X')
+        vector[0] = theta[X] * self.dose_vector
+        if X in wrt:
+            vector[1 + wrt.index(X)] = self.dose_vector
+        return matrix, vector.ravel()
+
+    def sparse_coupling(self, theta, wrt):
+        """Couplings of the amounts into their sensitivities in the rate
+        matrix of sensitivity_system, built from the entries of dA / dtheta
+        without forming its dense blocks.
+
+        :param theta: parameter vector, ordered as parameter_names
+        :type theta: array of float
+        :param wrt: indices in parameter_names of the P parameters to
+            differentiate with respect to
+        :type wrt: list of int
+        :return: matrix with dimensions (P + 1) N x (P + 1) N, holding
+            dA / dtheta_p in block row p + 1 of the first block column
+        :rtype: scipy.sparse.csr_matrix
+        """
+        values, (params, rows, cols), shape = self.derivative_entries(theta)
+        n = shape[1]
+        size = (len(wrt) + 1) * n
+        block = np.full(shape[0], -1)
+        block[wrt] = np.arange(len(wrt))
+        keep = block[params] >= 0
+        return scipy.sparse.coo_matrix(
+            (values[keep], ((1 + block[params[keep]]) * n + rows[keep],
+                            cols[keep])), shape=(size, size)).tocsr()
+
+    def sensitivity_solution(self, t_eval, solver='numeric', method='auto',
+                             dense_output=False, theta=None, wrt=None):
+        """Solves the PK ODE model together with its forward sensitivities
+        (see sensitivity_system), in a single numeric integration or matrix
+        exponential evaluation instead of one perturbed solve per parameter.
+
+        The analytic solver uses the matrix exponential, as the augmented
+        rate matrix repeats the eigenvalues of the model and is not
+        diagonalisable. The numeric solver picks its method from the
+        stiffness of the model itself, and the 'jit' solver falls back to
+        it.
+
+        :param t_eval: time points at which to store the solution, or None
+            to store the steps taken by the solver
+        :type t_eval: array of float
+        :param solver: 'numeric', 'analytic' or 'jit'; defaults to 'numeric'
+        :type solver: string, optional
+        :param method: solve_ivp method, or 'auto' to pick an implicit method
+            for stiff models only; defaults to 'auto'
+        :type method: string, optional
+        :param dense_output: whether to compute the continuous solution of
+            the amounts, defaults to False
+        :type dense_output: bool, optional
+        :param theta: parameter vector to solve for in place of the
+            parameters of the model, ordered as parameter_names, with the
+            structure of the model
+        :type theta: array of float, optional
+        :param wrt: indices in parameter_names of the P parameters to
+            differentiate with respect to; defaults to all parameters
+        :type wrt: sequence of int, optional
+        :raises ValueError: If the solver is not numeric, analytic nor jit
+        :return: result with the same fields as solve_ivp for the amounts,
+            and their sensitivities sens with dimensions P x N x T named by
+            sens_names
+        :rtype: OptimizeResult
+        """
+        matrix, vector = self.sensitivity_system(theta, wrt)
+        bounds, inputs = self.dose_segments(1.)
+        n = len(self.dose_vector)
+        if solver in ('numeric', 'jit'):
+            result = integrate_piecewise(matrix, vector, bounds, inputs,
+                                         t_eval, self.select_method(method),
+                                         dense_output)
+        elif solver == 'analytic':
+            if t_eval is None:
+                t_eval = bounds
+            if self.sparse:
+                matrix = matrix.toarray()
+            result = scipy.optimize.OptimizeResult(
+                t=t_eval, sol=None, nfev=0, njev=0, nlu=0, status=0,
+                message='Analytic solution.', success=True,
+                y=expm_response(matrix, vector, bounds, inputs, t_eval))
+            if dense_output:
+                def full_sol(t):
+                    t = np.asarray(t, dtype=float)
+                    z = expm_response(matrix, vector, bounds, inputs,
+                                      np.atleast_1d(t))
+                    return z if t.ndim else z[:, 0]
+                result.sol = full_sol
+        else:
+            raise ValueError('solver should be numeric, analytic or jit')
+        if result.sol is not None:
+            # the solution of the amounts only
+            full = result.sol
+            result.sol = lambda t: full(t)[:n]
+        z = result.y
+        result.y = z[:n]
+        result.sens = z[n:].reshape(-1, n, z.shape[-1])
+        names = self.parameter_names()
+        result.sens_names = names if wrt is None else [names[i] for i in wrt]
+        return result
+
+    def _option(self, value, key, default):
+        """Value of a solve option, or the model parameter of the same name
+        if it is None, or its default if the parameter is not set"""
+        if value is None:
+            return self.parameters.get(key, default)
+        return value
+
+    def _solve_raw(self, t_eval, solver, method, dense_output,
+                   sensitivities):
+        """Solves the model with the given solver, see solve
+
+        :raises ValueError: If the solver is not numeric, analytic nor jit
+        :return: result with the t, y, sol, nfev, njev and nlu fields
+        :rtype: OptimizeResult
+        """
+        with instrumentation.span('solve'):
+            if sensitivities:
+                sol = self.sensitivity_solution(t_eval, solver, method,
+                                                dense_output)
+            elif solver == 'numeric':
+                sol = self.integrate(t_eval, method, dense_output)
+            elif solver == 'analytic':
+                sol = self.analytic_solution(t_eval, dense_output)
+            elif solver == 'jit':
+                sol = self.jit_integrate(t_eval, method, dense_output)
+            else:
+                raise ValueError('solver should be numeric, analytic or jit')
+        instrumentation.count(nfev=sol.nfev, njev=sol.njev, nlu=sol.nlu)
+        return sol
+
+    def _solve_cached(self, cache, t_eval, solver, method, dense_output,
+                      sensitivities):
+        """Looks the solution up in a cache, or solves the model and stores
+        the result in the cache, see solve
 
-        :return: numeric solution of amount for each compartment as float
+        :return: result with the t, y, sol, nfev, njev and nlu fields
+        :rtype: OptimizeResult
+        """
+        key = solution_key(self.parameters, method=method, solver=solver,
+                           t_eval=t_eval, dense_output=dense_output,
+                           sensitivities=sensitivities)
+        sol = cache.get(key)
+        if sol is not None:
+            instrumentation.count(cache_hits=1)
+            return sol
+        sol = self._solve_raw(t_eval, solver, method, dense_output,
+                              sensitivities)
+        cache.put(key, sol)
+        return sol
+
+    def solve(self, method=None, solver=None, output_grid=None,
+              dense_output=None, metrics_only=None, cache=None,
+              sensitivities=None):
+        """Function computes the solution of the PK ODE model for a
+        specified time interval, either numerically with scipy solve_ivp or
+        exactly with the matrix exponential of the rate matrix.
+
+        :param method: solve_ivp method, or 'auto' to pick an implicit method
+            for stiff models only; defaults to the 'method' parameter of the
+            model, or 'auto' if not set
+        :type method: string, optional
+        :param solver: 'numeric', 'analytic' or 'jit' for the compiled
+            numeric solver (see jit_integrate); defaults to the 'solver'
+            parameter of the model, or 'numeric' if not set
+        :type solver: string, optional
+        :param output_grid: time points at which the solution is stored, see
+            output_times; defaults to the 'output_grid' parameter of the
+            model, or 1000 points if not set
+        :type output_grid: int, sequence of float or string, optional
+        :param dense_output: whether the returned Solution can be evaluated
+            at arbitrary times by calling it; defaults to the 'dense_output'
+            parameter of the model, or False if not set
+        :type dense_output: bool, optional
+        :param metrics_only: whether to keep only the summary metrics of the
+            solution and discard its trajectory; defaults to the
+            'metrics_only' parameter of the model, or False if not set
+        :type metrics_only: bool, optional
+        :param cache: cache to look the solution up in and store it to,
+            see cache.resolve_cache; defaults to the 'cache' parameter of the
+            model, or no cache if not set
+        :type cache: bool, string or SolutionCache, optional
+        :param sensitivities: whether to solve for the derivatives of the
+            solution with respect to every model parameter as well, see
+            sensitivity_solution; defaults to the 'sensitivities' parameter
+            of the model, or False if not set
+        :type sensitivities: bool, optional
+        :raises ValueError: If the solver is not numeric, analytic nor jit
+        :return: solution of amount for each compartment as float
             array with dimensions N x T, where N is the total number of
             compartments and T is the length of the time eval vector.
         :rtype: Solution
         """
-        t_eval = np.linspace(0, self.time, 1000)
-        y0 = np.array(np.zeros(
-                     (self.nr_compartments + self.base_compartments)))
-        sol = scipy.integrate.solve_ivp(fun=lambda t, y: self.rhs(t, y),
-                                        t_span=[t_eval[0], t_eval[-1]],
-                                        y0=y0,
-                                        t_eval=t_eval)
+        method = self._option(method, 'method', 'auto')
+        solver = self._option(solver, 'solver', 'numeric')
+        dense_output = self._option(dense_output, 'dense_output', False)
+        metrics_only = self._option(metrics_only, 'metrics_only', False)
+        cache = resolve_cache(self._option(cache, 'cache', False))
+        sensitivities = self._option(sensitivities, 'sensitivities', False)
+        start = time.perf_counter()
+        t_eval = self.output_times(output_grid)
+        if cache is None:
+            sol = self._solve_raw(t_eval, solver, method, dense_output,
+                                  sensitivities)
+        else:
+            sol = self._solve_cached(cache, t_eval, solver, method,
+                                     dense_output, sensitivities)
+        # wall time of this call, including any cache lookup
+        sol.elapsed = time.perf_counter() - start
         # if not isinstance(sol, float):
         # raise TypeError('Solution should be a float.')
         # if np.any(sol < 0):
         # raise ValueError('Solution should be non-negative.')
-        return Solution(sol, self.parameters)
+        solution = Solution(sol, self.parameters)
+        if metrics_only:
+            solution.discard_trajectory()
+        return solution
+
+    def solve_batch(self, param_array, solver='analytic', method='auto',
+                    output_grid=None):
+        """Solves the model structure (injection type, number of compartments,
+        dosing and time) for a stack of parameter vectors in a single call,
+        for instance for a population of virtual patients.
+
+        The dose functions scale linearly with the dose amount X, so every
+        parameter set shares the same dose profile scaled by its own X.
+
+        :param param_array: parameter vectors ordered as parameter_names,
+            with dimensions M x P
+        :type param_array: array of float
+        :param solver: 'analytic' to evaluate the exact solutions in one
+            vectorised pass or 'numeric' to integrate all systems together
+            with scipy solve_ivp; defaults to 'analytic'
+        :type solver: string, optional
+        :param method: solve_ivp method for the numeric solver, or 'auto'
+            to pick an implicit method for stiff batches; defaults to 'auto'
+        :type method: string, optional
+        :param output_grid: number of evenly spaced time points or sorted
+            sequence of time points at which to store the solutions; defaults
+            to the 'output_grid' parameter of the model, or 1000 points
+        :type output_grid: int or sequence of float, optional
+        :raises ValueError: If the parameter vectors do not match the model
+            structure, the solver is not numeric nor analytic, or the output
+            grid is not a grid of time points
+        :return: amount for each parameter set and compartment, with
+            dimensions M x N x T, where N is the total number of compartments
+            and T is the length of the time eval vector
+        :rtype: array of float
+        """
+        theta = np.atleast_2d(np.asarray(param_array, dtype=float))
+        if theta.shape[-1] != len(self.parameter_names()):
+            raise ValueError('parameter vectors should hold the values of '
+                             + ', '.join(self.parameter_names()))
+        A = self.rate_matrices(theta)
+        b = theta[:, self.base_parameters.index('X'), None] * self.dose_vector
+        bounds, inputs = self.dose_segments(1.)
+        t_eval = self.output_times(output_grid)
+        if t_eval is None:
+            raise ValueError('solve_batch needs an output grid of time points')
+        if solver == 'analytic':
+            return linear_response(A, b, bounds, inputs, t_eval)
+        elif solver != 'numeric':
+            raise ValueError('solver should be either numeric or analytic')
+
+        method = self.select_method(method, A)
+        # integrate all members together as one block diagonal system
+        sol = integrate_piecewise(scipy.sparse.block_diag(A, format='csr'),
+                                  b.ravel(), bounds, inputs, t_eval, method)
+        return sol.y.reshape(b.shape + (-1,))
 
 
 class IntravenousModels(Model):
     """Class for the intravenous bolus model with a single central compartment
-    and variable number of peripheral compartments"""
+    and variable number of peripheral compartments, with the dose administered
+    straight into the central compartment q_c = q[0].
+
+    | dq_c / dt = Dose(t) - q_c / (V_c * CL)
+            - Q_px( q_c / V_c - q_px / V_px)
+    | dq_px / dt = Q_px(q_c / V_c - q_px / V_px)
+    """
+    __slots__ = ()
+    base_compartments = 1
+
     def __init__(self, parameters):
         """Constructor for intravenous model, which inherits from Model superclass.
         Intravenous model has a single base compartment (the
         central compartment)
 
         :param parameters: parameters and constants of the model
-        :type parameters: dict
+        :type parameters: dict or Parameters
         """
         super().__init__(parameters)
-        self.base_compartments = 1
-
-    def rhs(self, t, y):
-        """Right Hand Side (rhs) of the ODE model.
-        Contains the implementation of the differential equations
-        defining the PK model.
-
-        | dq_c / dt = Dose(t) - (q_c / V_c) * CL
-                - Q_px( q_c / V_c - q_px / V_px)
-        | dq_px / dt = Q_px(q_c / V_c - q_px / V_px)
-        | Called as lambda function within scipy solve_ivp.
-
-        :param t: current time point
-        :type t: float
-        :param y: [q_c, q_p1, ..., q_pn] - current amount in compartment at
-            time point t with dimensions N where N is total number of
-            compartments
-        :type y: array of float
-        :return: dq_dt - an array of all compartments' dq_dt values at time t
-            with dimensions N where N is total number of compartments
-        :rtype: array of float
-        """
-        q = y
-        transitions = [0.]        # Placeholder in list for dqc_dt
-        sum_of_transitions = 0.
-        for i in range(1, self.nr_compartments + 1):
-            # create key to access parameter values for each compartment
-            key = f'periph_{i}'
-            # compute each peripheral compartment's transition to
-            # the central compartment
-            transition = self.generate_transition(self.parameters[key],
-                                                  q[0],
-                                                  q[i])
-            transitions.append(transition)
-            sum_of_transitions += transition
-        # compute central compartment's amount rate of change at time t
-        dqc_dt = (self.dose(t, self.X) - q[0] / (self.V_c * self.CL)
-                  - sum_of_transitions)
-        transitions[0] = dqc_dt        # prepend dqc_dt to list of dq_dt
-        dq_dt = transitions
-        return dq_dt
 
 
 class SubcutaneousModels(Model):
@@ -143,6 +1063,9 @@ class SubcutaneousModels(Model):
     central compartment, a single absorption compartment, and
     variable number of peripheral compartments
     """
+    __slots__ = ()
+    base_compartments = 2
+    base_parameters = ('CL', 'V_c', 'X', 'k_a')
 
     def __init__(self, parameters):
         """Constructor for subcutaneous model, which inherits from Model superclass.
@@ -151,50 +1074,305 @@ class SubcutaneousModels(Model):
         Absorption rate to the central compartment is k_a.
 
         :param parameters: parameters and constants of the model
-        :type parameters: dict
+        :type parameters: dict or Parameters
         """
         super().__init__(parameters)
-        self.k_a = parameters['k_a']
-        self.base_compartments = 2
 
-    def rhs(self, t, y):
+    k_a = _parameter('k_a')
 
-        """Right Hand Side (rhs) of the ODE model.
-        Contains the implementation of the differential equations
-        defining the PK model.
+    def rate_matrices(self, theta):
+        """Rate matrices of the subcutaneous model, with the dose administered
+        into the absorption compartment q_0 = q[0] and the central compartment
+        at q_c = q[1].
 
-        | dq0 / dt = Dose(t) - k_a * q_0
-        | dq_c / dt = k_a * q_0 - (q_c / V_c) CL
+        | dq_0 / dt = Dose(t) - k_a * q_0
+        | dq_c / dt = k_a * q_0 - q_c / (V_c * CL)
                         - Q_px( q_c / V_c - q_px / V_px )
         | dq_px / dt = Q_px (q_c / V_c - q_px / V_px)
-        | Called as lambda function within scipy solve_ivp.
 
-        :param t: current time point
-        :type t: float
-        :param y: [q_0, q_c, q_p1, ..., q_pn] - current amount in
-            compartment at time point t with dimensions N
-            where N is total number of compartments
-        :type y: array of float
-        :return: dq_dt - an array of all compartments' dq_dt values at time t
-            with dimensions N where N is total number of compartments
+        :param theta: parameter vectors, ordered as parameter_names, with
+            dimensions ... x P
+        :type theta: array of float
+        :return: rate matrices A with dimensions ... x N x N, where N is the
+            total number of compartments
         :rtype: array of float
         """
+        matrix = super().rate_matrices(theta)
+        k_a = np.asarray(theta, dtype=float)[..., 3]
+        matrix[..., 0, 0] = -k_a
+        matrix[..., 1, 0] = k_a
+        return matrix
 
-        q = y
-        transitions = [0., 0.]  # Placeholder [dq0_dt, dqc_dt, ... ]
-        sum_of_transitions = 0.
-        dq0_dt = self.dose(t, self.X) - self.k_a * q[0]
-        for i in range(1, self.nr_compartments + 1):
-            key = f'periph_{i}'
-            transition = self.generate_transition(self.parameters[key],
-                                                  q[1],
-                                                  q[i])
-            transitions.append(transition)
-            sum_of_transitions += transition
-        dqc_dt = ((self.k_a * q[0]) - q[1] / (self.V_c * self.CL)
-                  - sum_of_transitions)
-        transitions[0] = dq0_dt        # prepend dq0_dt to list of dq_dt
-        transitions[1] = dqc_dt        # prepend dqc_dt to list of dq_dt
-        dq_dt = transitions
-        return dq_dt
+    def derivative_entries(self, theta=None):
+        """Non-zero entries of the derivatives of the rate matrix of the
+        subcutaneous model with respect to each model parameter, see
+        Model.derivative_entries
+
+        :param theta: parameter vector, ordered as parameter_names; defaults
+            to the parameter vector of the model
+        :type theta: array of float, optional
+        :return: values, (parameter, row, column) indices of the entries,
+            and shape P x N x N of dA / dtheta
+        :rtype: tuple
+        """
+        values, (params, rows, cols), shape = super().derivative_entries(
+            theta)
+        # k_a moves the dose from the absorption to the central compartment
+        return (np.concatenate([values, [-1., 1.]]),
+                (np.concatenate([params, [3, 3]]),
+                 np.concatenate([rows, [0, 1]]),
+                 np.concatenate([cols, [0, 0]])), shape)
+
+
+class GraphModel(Model):
+    """Class for models of any topology, given as a graph of compartments
+    and the flows between them, compiled once into the rate matrix so that
+    every solver of Model applies unchanged.
+
+    The 'compartments' parameter maps each compartment name to its volume,
+    and the 'flows' parameter lists the flows as dicts with a 'type', a
+    'from' compartment, a 'to' compartment (except for clearance) and a
+    'value':
+
+    | clearance of q_i with CL: dq_i / dt -= q_i / (V_i * CL), with the
+        same convention as the mammillary models
+    | exchange between q_i and q_j with Q: flux Q (q_i / V_i - q_j / V_j)
+        from q_i to q_j
+    | absorption from q_i to q_j with rate k: flux k q_i from q_i to q_j
+
+    The dose is administered into the 'dose_compartment', the first
+    compartment by default.
+    """
+    __slots__ = ('compartments', 'volumes', 'flows', 'dose_compartment',
+                 'entry_signs', 'entry_rows', 'entry_cols', 'entry_kinds',
+                 'entry_flows', 'entry_volumes')
+    base_parameters = ('X',)
+
+    def _init_compartments(self):
+        """Reads the compartments and flows of the graph, compiling the flows
+        into the index arrays of the rate matrix entries.
+
+        :raises ValueError: If a flow has an unknown type or refers to an
+            unknown compartment
+        :return: None
+        """
+        parameters = self.parameters
+        self.compartments = list(parameters['compartments'])
+        self.nr_compartments = len(self.compartments)
+        self.volumes = np.array(list(parameters['compartments'].values()),
+                                dtype=float)
+        self.flows = list(parameters['flows'])
+        self.dose_compartment = self.compartment_index(
+            parameters.get('dose_compartment', self.compartments[0]))
+        self.compile_flows()
+
+    def compartment_index(self, name):
+        """Index of a compartment in the state vector
+
+        :param name: compartment name
+        :type name: string
+        :raises ValueError: If there is no such compartment
+        :return: index
+        :rtype: int
+        """
+        if name not in self.compartments:
+            raise ValueError(f'unknown compartment {name}, compartments are '
+                             + ', '.join(self.compartments))
+        return self.compartments.index(name)
+
+    def compile_flows(self):
+        """Compiles the flows into one entry of the rate matrix per term:
+        its row and column, its sign, its kind (an index into FLOW_TYPES),
+        the flow whose value it takes and the compartment whose volume it
+        takes.
+
+        :raises ValueError: If a flow has an unknown type or refers to an
+            unknown compartment
+        :return: None
+        """
+        entries = []
+        for f, flow in enumerate(self.flows):
+            if flow.get('type') not in FLOW_TYPES:
+                raise ValueError('flow type should be one of '
+                                 + ', '.join(FLOW_TYPES))
+            kind = FLOW_TYPES.index(flow['type'])
+            i = self.compartment_index(flow['from'])
+            if flow['type'] == 'clearance':
+                entries.append((i, i, -1., kind, f, i))
+                continue
+            j = self.compartment_index(flow['to'])
+            entries += [(i, i, -1., kind, f, i), (j, i, 1., kind, f, i)]
+            if flow['type'] == 'exchange':
+                entries += [(j, j, -1., kind, f, j), (i, j, 1., kind, f, j)]
+        entries = np.array(entries, dtype=float).reshape(-1, 6).T
+        self.entry_signs = entries[2]
+        (self.entry_rows, self.entry_cols, self.entry_kinds, self.entry_flows,
+         self.entry_volumes) = entries[[0, 1, 3, 4, 5]].astype(int)
+
+    def parameter_names(self):
+        """Names of the model parameters, in the order of the parameter
+        vectors taken by rate_matrices and solve_batch: the dose X, the
+        volume V_<compartment> of each compartment, then the value of each
+        flow, named CL_<from>, Q_<from>_<to> or k_<from>_<to>.
+
+        :return: parameter names
+        :rtype: list of strings
+        """
+        names = list(self.base_parameters)
+        names += [f'V_{name}' for name in self.compartments]
+        for flow in self.flows:
+            symbol = FLOW_SYMBOLS[flow['type']]
+            if flow['type'] == 'clearance':
+                names.append(f"{symbol}_{flow['from']}")
+            else:
+                names.append(f"{symbol}_{flow['from']}_{flow['to']}")
+        return names
+
+    def parameter_vector(self):
+        """Values of the model parameters, in the order of parameter_names.
+
+        :return: parameter vector with dimensions P
+        :rtype: array of float
+        """
+        return np.concatenate([[self.X], self.volumes,
+                               [flow['value'] for flow in self.flows]
+                               ]).astype(float)
+
+    def parameter_dict(self, theta):
+        """Parameters of the model with the values of a parameter vector, to
+        build a model of the same structure from, e.g. after a fit.
+
+        :param theta: parameter vector, ordered as parameter_names
+        :type theta: array of float
+        :return: parameters and constants of the model
+        :rtype: dict
+        """
+        theta = [float(value) for value in theta]
+        n = self.nr_compartments
+        return dict(self.parameters, X=theta[0],
+                    compartments=dict(zip(self.compartments, theta[1:1 + n])),
+                    flows=[dict(flow, value=value)
+                           for flow, value in zip(self.flows, theta[1 + n:])])
+
+    def volume_names(self):
+        """Names of the parameter holding the volume of each compartment,
+        in the order of the state vector, to convert amounts into
+        concentrations.
+
+        :return: parameter names
+        :rtype: list of strings
+        """
+        return [f'V_{name}' for name in self.compartments]
+
+    def entry_values(self, theta):
+        """Values of the compiled rate matrix entries
+
+        :param theta: parameter vectors, ordered as parameter_names, with
+            dimensions ... x P
+        :type theta: array of float
+        :return: entry values with dimensions ... x E
+        :rtype: array of float
+        """
+        theta = np.asarray(theta, dtype=float)
+        n = self.nr_compartments
+        value = theta[..., 1 + n + self.entry_flows]
+        volume = theta[..., 1 + self.entry_volumes]
+        with np.errstate(divide='ignore'):
+            rate = np.choose(self.entry_kinds, [1. / (volume * value),
+                                                value / volume, value])
+        return self.entry_signs * rate
+
+    def entry_derivatives(self, theta):
+        """Derivatives of the compiled rate matrix entries with respect to
+        the value of their flow and to the volume they take.
+
+        :param theta: parameter vector, ordered as parameter_names
+        :type theta: array of float
+        :return: derivatives with respect to the flow values and to the
+            volumes, each with dimensions E
+        :rtype: tuple of arrays of float
+        """
+        theta = np.asarray(theta, dtype=float)
+        n = self.nr_compartments
+        value = theta[1 + n + self.entry_flows]
+        volume = theta[1 + self.entry_volumes]
+        with np.errstate(divide='ignore'):
+            d_value = np.choose(self.entry_kinds, [
+                -1. / (volume * value ** 2), 1. / volume,
+                np.ones_like(value)])
+            d_volume = np.choose(self.entry_kinds, [
+                -1. / (volume ** 2 * value), -value / volume ** 2,
+                np.zeros_like(value)])
+        return self.entry_signs * d_value, self.entry_signs * d_volume
 
+    def derivative_entries(self, theta=None):
+        """Non-zero entries of the derivatives of the rate matrix of the
+        graph with respect to each model parameter, two for each compiled
+        rate matrix entry: with respect to its flow value and its volume.
+        See Model.derivative_entries
+
+        :param theta: parameter vector, ordered as parameter_names; defaults
+            to the parameter vector of the model
+        :type theta: array of float, optional
+        :return: values, (parameter, row, column) indices of the entries,
+            and shape P x N x N of dA / dtheta
+        :rtype: tuple
+        """
+        if theta is None:
+            theta = self.parameter_vector()
+        n = self.nr_compartments
+        d_value, d_volume = self.entry_derivatives(theta)
+        params = np.concatenate([1 + n + self.entry_flows,
+                                 1 + self.entry_volumes])
+        rows = np.tile(self.entry_rows, 2)
+        cols = np.tile(self.entry_cols, 2)
+        return (np.concatenate([d_value, d_volume]), (params, rows, cols),
+                (len(theta), n, n))
+
+    def rate_matrices(self, theta):
+        """Builds the rate matrix of the graph for one or a stack of
+        parameter vectors.
+
+        :param theta: parameter vectors, ordered as parameter_names, with
+            dimensions ... x P
+        :type theta: array of float
+        :return: rate matrices A with dimensions ... x N x N, where N is the
+            number of compartments
+        :rtype: array of float
+        """
+        values = self.entry_values(theta)
+        n = self.nr_compartments
+        batch_shape = values.shape[:-1]
+        matrix = np.zeros((int(np.prod(batch_shape)), n * n))
+        np.add.at(matrix, (slice(None), self.entry_rows * n + self.entry_cols),
+                  values.reshape(matrix.shape[0], -1))
+        return matrix.reshape(batch_shape + (n, n))
+
+    def sparse_rate_matrix(self, theta=None):
+        """Builds the rate matrix of the graph in CSR format, with one entry
+        per term of each flow.
+
+        :param theta: parameter vector, ordered as parameter_names; defaults
+            to the parameter vector of the model
+        :type theta: array of float, optional
+        :return: rate matrix A with dimensions N x N, where N is the number
+            of compartments
+        :rtype: scipy.sparse.csr_matrix
+        """
+        if theta is None:
+            theta = self.parameter_vector()
+        n = self.nr_compartments
+        return scipy.sparse.coo_matrix(
+            (self.entry_values(theta),
+             (self.entry_rows, self.entry_cols)), shape=(n, n)).tocsr()
+
+    def generate_dose_vector(self):
+        """Builds the vector selecting the compartment receiving the dose.
+
+        :return: dose input vector b with dimensions N, where N is the
+            number of compartments
+        :rtype: array of float
+        """
+        vector = np.zeros(self.nr_compartments)
+        vector[self.dose_compartment] = 1.
+        return vector
@@ -0,0 +1,190 @@
+"""parameters.py holds the compact, immutable parameters of a protocol, as
+frozen by Protocol.generate_model and shared by the Model and its Solution.
+
+The parameters of every model are held in slots rather than in a dict per
+protocol, and the (V_p, Q_p) pairs of the peripheral compartments are packed
+into a single read-only array with one row per compartment, which the models
+use as is. The optional parameters, e.g. solver or the graph of a graph
+model, are kept in a read-only mapping, with their nested dicts frozen into
+read-only mappings and their lists into tuples, so that no value changes
+once a model is generated.
+
+Parameters still read like the dict they were built from, with the
+periph_<i> pairs and lists as tuples, and compare equal to it:
+
+| parameters['CL'] == parameters.CL
+| parameters['periph_2'] == tuple(parameters.periph[1])
+| parameters.replace(time=2) for a copy with other values
+
+Parameters are not validated on construction, see config.validate.
+"""
+
+import collections.abc
+import types
+
+import numpy as np
+
+# parameters held in slots, in the order they are listed
+FIELDS = ('name', 'injection_type', 'V_c', 'periph_default', 'CL', 'X',
+          'k_a', 'dose_mode', 'nr_compartments', 'run_mode', 'time')
+_FIELD_SET = frozenset(FIELDS)
+_NO_OPTIONS = types.MappingProxyType({})
+
+
+class Parameters(collections.abc.Mapping):
+    """Immutable parameters of a protocol, read like a dict or through
+    attributes, e.g. parameters['CL'] or parameters.CL
+
+    :param parameters: protocol parameters
+    :type parameters: dict
+    :raises ValueError: If a periph_<i> value is not a pair of numbers
+    """
+    __slots__ = FIELDS + ('periph', 'options')
+
+    def __init__(self, parameters):
+        """Packs the parameters into slots and the periph_<i> pairs into an
+        array
+
+        :param parameters: protocol parameters
+        :type parameters: dict
+        :raises ValueError: If a periph_<i> value is not a pair of numbers
+        """
+        set_slot = object.__setattr__
+        nr_compartments = parameters.get('nr_compartments', 0)
+        if not isinstance(nr_compartments, int):
+            nr_compartments = 0
+        periph = {f'periph_{i}' for i in range(1, nr_compartments + 1)}
+        options = {}
+        for key, value in parameters.items():
+            if key in _FIELD_SET:
+                set_slot(self, key, value)
+            elif key not in periph:
+                options[key] = _frozen(value)
+        pairs = np.array([parameters[key] for key in sorted(
+            periph, key=lambda key: int(key[len('periph_'):]))],
+            dtype=float).reshape(-1, 2)
+        pairs.setflags(write=False)
+        set_slot(self, 'periph', pairs)
+        set_slot(self, 'options',
+                 types.MappingProxyType(options) if options else _NO_OPTIONS)
+
+    def __getitem__(self, key):
+        if key in _FIELD_SET:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        if key.startswith('periph_') and key[len('periph_'):].isdigit():
+            i = int(key[len('periph_'):])
+            if 1 <= i <= len(self.periph):
+                return tuple(float(value) for value in self.periph[i - 1])
+        return self.options[key]
+
+    def get(self, key, default=None):
+        """Value of a parameter, looked up without raising KeyError as the
+        optional parameters are read on every solve
+
+        :param key: parameter name
+        :type key: string
+        :param default: value if the parameter is not given, defaults to
+            None
+        :return: value of the parameter
+        """
+        if key in _FIELD_SET:
+            return getattr(self, key, default)
+        if key.startswith('periph_'):
+            return super().get(key, default)
+        return self.options.get(key, default)
+
+    def __iter__(self):
+        for key in FIELDS:
+            if hasattr(self, key):
+                yield key
+        for i in range(1, len(self.periph) + 1):
+            yield f'periph_{i}'
+        yield from self.options
+
+    def __len__(self):
+        return (sum(hasattr(self, key) for key in FIELDS) + len(self.periph)
+                + len(self.options))
+
+    def __getattr__(self, key):
+        # only called for unset slots and optional parameters
+        if key.startswith('_') or key == 'options':
+            raise AttributeError(key)
+        try:
+            return self.options[key]
+        except KeyError:
+            raise AttributeError(key) from None
+
+    def __setattr__(self, key, value):
+        raise AttributeError('Parameters are immutable')
+
+    def __delattr__(self, key):
+        raise AttributeError('Parameters are immutable')
+
+    def __eq__(self, other):
+        if not isinstance(other, collections.abc.Mapping):
+            return NotImplemented
+        # the nested values of other are frozen alike, e.g. lists to tuples
+        return dict(self.items()) == {key: _frozen(value)
+                                      for key, value in other.items()}
+
+    def __reduce__(self):
+        return type(self), (self.to_dict(),)
+
+    def __repr__(self):
+        return 'Parameters({0!r})'.format(self.to_dict())
+
+    def to_dict(self):
+        """Copy of the parameters as a new dict
+
+        :return: protocol parameters, with the periph_<i> pairs and lists as
+            tuples, and nested dicts as new dicts
+        :rtype: dict
+        """
+        return {key: _thawed(self[key]) for key in self}
+
+    def replace(self, **changes):
+        """Copy of the parameters with some values changed
+
+        :param changes: new values of the parameters
+        :return: the changed parameters
+        :rtype: Parameters
+        """
+        return type(self)(dict(self.to_dict(), **changes))
+
+
+def _frozen(value):
+    """Read-only copy of a parameter value, with dicts as read-only mappings
+    and lists as tuples, at every level"""
+    if isinstance(value, collections.abc.Mapping):
+        return types.MappingProxyType({key: _frozen(item)
+                                       for key, item in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(_frozen(item) for item in value)
+    return value
+
+
+def _thawed(value):
+    """Copy of a frozen parameter value with its read-only mappings as
+    dicts, e.g. to write it as JSON"""
+    if isinstance(value, types.MappingProxyType):
+        return {key: _thawed(item) for key, item in value.items()}
+    if isinstance(value, tuple):
+        return tuple(_thawed(item) for item in value)
+    return value
+
+
+def freeze(parameters):
+    """Parameters of a dict, or the parameters themselves if they are
+    already frozen
+
+    :param parameters: protocol parameters
+    :type parameters: dict or Parameters
+    :return: immutable parameters
+    :rtype: Parameters
+    """
+    if isinstance(parameters, Parameters):
+        return parameters
+    return Parameters(parameters)
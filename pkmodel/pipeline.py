@@ -0,0 +1,319 @@
+"""pipeline.py composes the Protocol -> Model -> Solution flow of run.py
+out of generators, so that any number of models streams from a config
+source to output sinks while only a few solutions are held at once.
+
+| source: configs, or any iterable of parameter dicts, e.g.
+    sweep.parameter_grid
+| solve: solves each protocol lazily, in this process or a pool of worker
+    processes with at most max_pending jobs in flight
+| transforms: keep_metrics, downsample
+| sinks: SolutionFiles (csv, npz or parquet files), StoreSink (one hdf5
+    store), MetricsTable (one csv row per model and compartment)
+
+Every stage is a generator consuming the previous one, and run drives the
+pipeline into the sinks:
+
+| results = solve(configs(paths), workers=4)
+| run(downsample(results, 100), [StoreSink('solutions.h5'),
+    MetricsTable('metrics.csv')])
+
+Each stage passes on PipelineResult tuples. Failed protocols carry their
+error and no solution, and go through the transforms and sinks untouched.
+"""
+
+import collections
+import collections.abc
+import concurrent.futures
+import csv
+import itertools
+import os
+
+from pkmodel import config, store
+from pkmodel.metrics import METRICS
+from pkmodel.protocol import Protocol
+
+PipelineResult = collections.namedtuple(
+    'PipelineResult', ['name', 'parameters', 'solution', 'error',
+                       'threshold'], defaults=(None,))
+PipelineResult.__doc__ = """Outcome of a protocol in a pipeline: its name
+and parameters as given by the source, its Solution, the error message if
+it failed (None otherwise, and no solution if it failed), and the threshold
+of its metrics if keep_metrics was given one (None for the 'threshold'
+parameter)."""
+
+
+def configs(paths, format=None):
+    """Reads the protocols of config files one at a time, see
+    config.iter_documents
+
+    :param paths: paths of the config files, or text or binary streams
+    :type paths: iterable
+    :param format: format of every config, defaults to the extension of each
+    :type format: string, optional
+    :return: parameters of each protocol
+    :rtype: generator of dicts
+    """
+    for path in paths:
+        yield from config.iter_documents(path, format)
+
+
+def result_name(parameters, index=None):
+    """Name of a protocol in the pipeline: its 'name' parameter, or else the
+    default name followed by the index of the protocol in the stream, so
+    that the outputs of nameless protocols do not overwrite each other
+
+    :param parameters: protocol parameters
+    :type parameters: dict
+    :param index: index of the protocol in the stream, defaults to None for
+        the default name alone
+    :type index: int, optional
+    :return: name of the protocol
+    :rtype: string
+    """
+    if isinstance(parameters, collections.abc.Mapping) and 'name' in parameters:
+        return parameters['name']
+    if index is None:
+        return config.DEFAULTS['name']
+    return '{0}_{1}'.format(config.DEFAULTS['name'], index)
+
+
+def solve_protocol(parameters, index=None):
+    """Solves a single protocol: Protocol(...).generate_model().solve()
+
+    :param parameters: protocol parameters
+    :type parameters: dict
+    :param index: index of the protocol in the stream, see result_name
+    :type index: int, optional
+    :return: outcome of the protocol
+    :rtype: PipelineResult
+    """
+    name = result_name(parameters, index)
+    try:
+        solution = Protocol(parameters=parameters).generate_model().solve()
+    except Exception as e:
+        return PipelineResult(name, parameters, None,
+                              '{0}: {1}'.format(type(e).__name__, e))
+    return PipelineResult(name, parameters, solution, None)
+
+
+def solve(jobs, workers=1, max_pending=None):
+    """Solves protocols lazily, in the order they are given. Protocols are
+    only read from the source once there is room for them, so that at most
+    max_pending solutions are held by this stage. Nameless protocols are
+    named after their index in jobs, see result_name.
+
+    :param jobs: parameters of each protocol
+    :type jobs: iterable of dicts
+    :param workers: number of worker processes, defaults to 1 to solve in
+        the current process; None for the number of CPUs
+    :type workers: int, optional
+    :param max_pending: number of protocols solved ahead of the consumer,
+        defaults to twice the number of workers
+    :type max_pending: int, optional
+    :return: outcome of each protocol
+    :rtype: generator of PipelineResult
+    """
+    if workers == 1:
+        yield from map(solve_protocol, jobs, itertools.count())
+        return
+    if max_pending is None:
+        max_pending = 2 * (workers or os.cpu_count() or 1)
+    pending = collections.deque()
+    with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+        for index, job in enumerate(jobs):
+            pending.append(executor.submit(solve_protocol, job, index))
+            if len(pending) >= max_pending:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def keep_metrics(results, threshold=None):
+    """Computes the metrics of each solution and releases its trajectory,
+    see Solution.discard_trajectory
+
+    :param results: outcome of each protocol
+    :type results: iterable of PipelineResult
+    :param threshold: quantity for the time above threshold, defaults to the
+        'threshold' parameter of each protocol
+    :type threshold: float, optional
+    :return: outcome of each protocol, with the metrics only and their
+        threshold
+    :rtype: generator of PipelineResult
+    """
+    for result in results:
+        if result.solution is not None:
+            result.solution.discard_trajectory(threshold)
+        yield result._replace(threshold=threshold)
+
+
+def downsample(results, points):
+    """Keeps evenly spaced points of each trajectory, see
+    Solution.downsample
+
+    :param results: outcome of each protocol
+    :type results: iterable of PipelineResult
+    :param points: largest number of time points kept
+    :type points: int
+    :return: outcome of each protocol, with the downsampled solution
+    :rtype: generator of PipelineResult
+    """
+    for result in results:
+        if (result.solution is not None
+                and not result.solution.trajectory_discarded):
+            result = result._replace(
+                solution=result.solution.downsample(points))
+        yield result
+
+
+class SolutionFiles:
+    """Sink saving each solution to its own file in a directory, as
+    <name>_solution.<format> (see Solution.save_solution)
+
+    :param directory: output directory, created if it does not exist
+    :type directory: string
+    :param output_format: 'csv' (default), 'npz' or 'parquet'
+    :type output_format: string, optional
+    """
+    def __init__(self, directory, output_format='csv'):
+        """Creates the output directory"""
+        os.makedirs(directory, exist_ok=True)
+        self.dir_path = os.path.join(directory, '')
+        self.output_format = output_format
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, result):
+        """Saves a solution
+
+        :param result: outcome of a solved protocol
+        :type result: PipelineResult
+        :return: None
+        """
+        result.solution.save_solution(self.dir_path, result.name,
+                                      self.output_format)
+
+    def close(self):
+        """Nothing to close, each file is written at once
+
+        :return: None
+        """
+
+
+class StoreSink:
+    """Sink appending every solution to a single HDF5 store, kept open for
+    the whole stream (see store.SolutionStore)
+
+    :param path: file path of the store, created if it does not exist
+    :type path: string
+    :raises ImportError: If h5py is not installed
+    """
+    def __init__(self, path):
+        """Opens the store"""
+        self.store = store.SolutionStore(path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, result):
+        """Appends a solution to the store
+
+        :param result: outcome of a solved protocol
+        :type result: PipelineResult
+        :raises ValueError: If the solution does not have the time points and
+            number of compartments of the store
+        :return: None
+        """
+        self.store.append(result.name, *result.solution.get_solution)
+
+    def close(self):
+        """Closes the store
+
+        :return: None
+        """
+        self.store.close()
+
+
+class MetricsTable:
+    """Sink writing the metrics of every solution to a single csv table,
+    with one row per model and compartment, written as they arrive
+
+    :param path: file path of the table
+    :type path: string
+    :param threshold: quantity for the time above threshold, defaults to the
+        threshold of each result, as kept by keep_metrics
+    :type threshold: float, optional
+    """
+    columns = ('name', 'compartment') + METRICS
+
+    def __init__(self, path, threshold=None):
+        """Opens the table and writes its header"""
+        self.threshold = threshold
+        self.file = open(path, 'w', newline='')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(self.columns)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, result):
+        """Writes the metrics of a solution
+
+        :param result: outcome of a solved protocol
+        :type result: PipelineResult
+        :raises ValueError: If the trajectory was discarded and the table
+            has a different threshold
+        :return: None
+        """
+        threshold = self.threshold
+        if threshold is None:
+            threshold = result.threshold
+        metrics = result.solution.metrics(threshold)
+        for compartment in range(len(metrics['AUC'])):
+            self.writer.writerow(
+                [result.name, compartment]
+                + [metrics[key][compartment] for key in self.columns[2:]])
+
+    def close(self):
+        """Closes the table
+
+        :return: None
+        """
+        self.file.close()
+
+
+def run(results, sinks):
+    """Drives a pipeline, writing each solved protocol to every sink as it
+    arrives, and closes the sinks at the end.
+
+    :param results: outcome of each protocol
+    :type results: iterable of PipelineResult
+    :param sinks: sinks with write and close methods
+    :type sinks: list
+    :return: number of protocols, and the failed results
+    :rtype: tuple
+    """
+    count = 0
+    failed = []
+    try:
+        for result in results:
+            count += 1
+            if result.error is not None:
+                failed.append(result)
+                continue
+            for sink in sinks:
+                sink.write(result)
+    finally:
+        for sink in sinks:
+            sink.close()
+    return count, failed
@@ -0,0 +1,151 @@
+"""plotting.py renders plots of solutions off-screen through the
+object-oriented matplotlib API with the Agg canvas, so that figures are
+never registered with pyplot and are released as soon as they are saved.
+
+Plots can also be deferred: numeric outputs are saved first, and the plots
+of every saved solution whose parameters were saved with plot: 'deferred'
+are rendered afterwards in a separate stage, optionally across a pool of
+worker processes.
+"""
+
+import concurrent.futures
+import glob
+import json
+import os
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from pkmodel import store
+
+# extensions of saved solutions that deferred plots can be rendered from
+SOLUTION_EXTENSIONS = ('csv', 'npz', 'parquet')
+
+
+def draw(ax, y, t):
+    """Plots the quantity of each compartment against time.
+
+    :param ax: axes to plot on
+    :type ax: matplotlib Axes
+    :param y: quantities with dimensions N x T
+    :type y: array of float
+    :param t: T time points
+    :type t: array of float
+    :return: None
+    """
+    for i in range(y.shape[0]):
+        #iterate over each compartment and sequentially plot
+        if i == 0:
+            label = 'central compartment'
+        else:
+            #add legend labels for each peripheral compartment
+            label = 'peripheral compartment ' + str(i)
+        ax.plot(t, y[i, :], label=label)
+    ax.legend()
+    ax.set_title('Quantity(t) for drug in central & peripheral components')
+    ax.set_xlabel('Time')
+    ax.set_ylabel('Quantity')
+
+
+def save_plot(path, y, t):
+    """Renders the plot of a solution with the Agg canvas and saves it.
+
+    :param path: file path of the plot
+    :type path: string
+    :param y: quantities with dimensions N x T
+    :type y: array of float
+    :param t: T time points
+    :type t: array of float
+    :return: None
+    """
+    figure = Figure()
+    FigureCanvasAgg(figure)
+    draw(figure.add_subplot(), y, t)
+    figure.savefig(path)
+    figure.clear()
+
+
+def load_saved_solution(path):
+    """Loads a saved csv, npz or parquet solution.
+
+    :param path: file path of the solution
+    :type path: string
+    :return: y array with dimensions N x T and t array with dimensions T
+    :rtype: tuple of arrays
+    """
+    if path.endswith('.csv'):
+        # columns: index, Time, quantity of each compartment
+        table = np.loadtxt(path, delimiter=',', skiprows=1, ndmin=2)
+        return table[:, 2:].T, table[:, 1]
+    solution = store.load_solution(path)
+    return solution['y'], solution['t']
+
+
+def is_deferred(path):
+    """Whether the plot of a saved solution was deferred, as given by the
+    plot parameter saved along with it in <name>_params.txt
+
+    :param path: file path of the solution
+    :type path: string
+    :return: True if the plot was deferred
+    :rtype: bool
+    """
+    params_path = path[:path.rindex('_solution.')] + '_params.txt'
+    try:
+        with open(params_path) as file:
+            return json.load(file).get('plot') == 'deferred'
+    except (OSError, ValueError):
+        return False
+
+
+def pending_plots(dir_path='./Output/'):
+    """Finds the saved solutions whose plot was deferred and has not been
+    rendered yet. Solutions saved with plot: False are never pending.
+
+    :param dir_path: output directory, defaults to './Output/'
+    :type dir_path: string, optional
+    :return: (solution path, plot path) for each pending plot
+    :rtype: list of tuples
+    """
+    pending = {}
+    for extension in SOLUTION_EXTENSIONS:
+        pattern = os.path.join(dir_path, '*_solution.' + extension)
+        for path in sorted(glob.glob(pattern)):
+            plot_path = path[:-len('_solution.' + extension)] + '_plot.png'
+            if (plot_path not in pending and not os.path.isfile(plot_path)
+                    and is_deferred(path)):
+                pending[plot_path] = path
+    return [(path, plot_path) for plot_path, path in pending.items()]
+
+
+def render_saved(paths):
+    """Renders the plot of a saved solution.
+
+    :param paths: (solution path, plot path)
+    :type paths: tuple of strings
+    :return: plot path
+    :rtype: string
+    """
+    path, plot_path = paths
+    save_plot(plot_path, *load_saved_solution(path))
+    return plot_path
+
+
+def render_pending(dir_path='./Output/', workers=1):
+    """Renders the deferred plots of all saved solutions that do not have
+    one yet (see pending_plots).
+
+    :param dir_path: output directory, defaults to './Output/'
+    :type dir_path: string, optional
+    :param workers: number of worker processes, defaults to 1 which renders
+        in the current process; None uses the number of CPUs
+    :type workers: int, optional
+    :return: paths of the rendered plots
+    :rtype: list of strings
+    """
+    pending = pending_plots(dir_path)
+    if workers == 1:
+        return list(map(render_saved, pending))
+    with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+        return list(executor.map(render_saved, pending))
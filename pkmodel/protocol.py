@@ -2,9 +2,11 @@
 # Protocol class
 #
 
-import ast
-from .models import IntravenousModels, SubcutaneousModels
+from . import config
+from .models import GraphModel, IntravenousModels, SubcutaneousModels
 from .AbstractProtocol import AbstractProtocol
+from .parameters import Parameters
+from .instrumentation import timed
 
 
 class Protocol(AbstractProtocol):
@@ -14,12 +16,13 @@ class Protocol(AbstractProtocol):
     Args:
         AbstractProtocol (Class): AbstractProtocol is super-class of Protocol.
     """
-    def __init__(self, file_dir=None):
+    def __init__(self, file_dir=None, parameters=None):
         """Initialises Protocol object with default parameters
 
         The parameters are:
         name = name of model - output files will be saved under this name
-        injection_type = intravenous bolus or subcutaneous (as described above)
+        injection_type = intravenous bolus or subcutaneous (as described above),
+        or graph for a model of any topology (see below)
         V_c = volume of the central compartment (mL)
         nr_compartments = the number of peripheral compartments
         periph_1 = (volume in the peripheral compartment (mL), transition rate
@@ -34,39 +37,72 @@ class Protocol(AbstractProtocol):
         doses
         time = time period in which dosing is observed (hours - maximum 5)
 
+        Parameters of graph models, in place of V_c, nr_compartments,
+        periph_* and CL (see models.GraphModel):
+        compartments = dictionary mapping compartment names to volumes (mL)
+        flows = list of flow dictionaries with a 'type' ('clearance',
+        'exchange' or 'absorption'), a 'from' and a 'to' compartment name
+        ('from' only for clearance) and a float 'value' (CL, Q or k_a)
+        dose_compartment = name of the compartment receiving the dose, the
+        first compartment by default
+
+        Optional parameters, not set by default:
+        solver = 'numeric' (default) to integrate with scipy solve_ivp,
+        'analytic' to compute the exact solution, or 'jit' to integrate
+        with a compiled RK45 loop if numba is installed
+        method = solve_ivp method of the numeric solver, 'auto' by default
+        output_grid = number of time points at which the solution is stored
+        (1000 by default), a list of time points, or 'steps' for the solver
+        steps only
+        dense_output = True to make the solution callable at any time
+        metrics_only = True to keep only the summary metrics (AUC, Cmax,
+        Tmax, Cmin, half-life, time above threshold) of the solution
+        threshold = quantity for the time above threshold metric
+        output_format = format, or list of formats, of the saved solution:
+        'csv' (default), 'npz', 'parquet' or 'hdf5'
+        plot = True (default) to save the plot, False to skip it, or
+        'deferred' to render it later with plotting.render_pending
+        sparse = True to store the rate matrix sparse, False for dense, or
+        'auto' (default) for sparse from 100 compartments
+        cache = True to reuse the solutions of identical parameter sets
+        within a process, or 'disk' to also keep them in ./Output/cache/
+        across runs
+        sensitivities = True to solve for the derivatives of the solution
+        and of its AUC, Cmax and Cmin with respect to every parameter
+
         Args:
             file_dir (string, optional): Path for config file to update
             parameters if defined. Defaults to None.
+            parameters (dict, optional): Parameters to update the defaults
+            with, in place of a config file. Defaults to None.
         """
-        self.params = {
-            'name': 'model1',
-            'V_c': 1.0,
-            'periph_default': (1.0, 1.0),      # (V_p1, Q_p1)
-            'CL': 1.0,
-            'X': 1.0,
-            'dose_mode': 'normal',
-            'nr_compartments': 1,          # nr of peripheral compartments
-            'injection_type': 'intravenous',    # 'subcutaneous'
-            'run_mode': 'save',
-            'time': 1
-        }
+        self.params = dict(config.DEFAULTS)
         if file_dir:
             self.fill_parameters(file_dir)
+        elif parameters:
+            self.update_parameters(dict(parameters))
 
+    @timed('read_config')
     def read_config(self, file_dir):
-        """Reads in config file and converts into python dictionary
+        """Reads in config file and converts into python dictionary. The
+        format is given by the extension of the file: JSON, TOML, YAML, or
+        a Python dictionary otherwise (see config.read_documents)
 
         Args:
             file_dir (string): Relative path for the config file
 
+        Raises:
+            ValueError: If the file holds several protocols, which are read
+            with config.load instead
+
         Returns:
             dict: Dictionary of the parameters
         """
-        config_file = open(file_dir, "r")
-        config_file_str = config_file.read()
-        config_file.close()
-        dictionaries_list = ast.literal_eval(str(config_file_str))
-        return dictionaries_list
+        documents = config.read_documents(file_dir)
+        if len(documents) != 1:
+            raise ValueError(f'{file_dir} holds {len(documents)} protocols, '
+                             'read them with pkmodel.config.load')
+        return documents[0]
 
     def check_fill_parametersdict(self):
         """Checks the parameters are a dictionary
@@ -74,19 +110,18 @@ class Protocol(AbstractProtocol):
         Raises:
             TypeError: If parameters are not a dictionary
         """
-        if not isinstance(self.params, dict):
-            raise TypeError('data input should be a dictionary')
+        config.validate(self.params, ())
 
     def check_fill_parametersstr(self):
-        """Checks the name and injection_type parameters are strings
+        """Checks the name and injection_type parameters are strings, and
+        that injection_type is intravenous, subcutaneous or graph
 
         Raises:
             TypeError: If the name and injection_type parameters are not
             strings
+            ValueError: If injection_type is not a known model type
         """
-        for i in 'name', 'injection_type':
-            if not isinstance(self.params[i], str):
-                raise TypeError(f'{i} should be a string')
+        config.validate(self.params, ('name', 'injection_type'))
 
     def check_fill_parametersint(self):
         """Checks that nr_compartments and time paramters are integers
@@ -96,39 +131,20 @@ class Protocol(AbstractProtocol):
             ValueError: If nr_compartments or time are less than 0
             ValueError: If time is larger than 5
         """
-        for i in 'nr_compartments', 'time':
-            if not isinstance(self.params[i], int):
-                raise TypeError(f'{i} should be a integer')
-            if self.params[i] < 0:
-                raise ValueError(f'{i} should be at least 0')
-            # Makes sure that time does not get too large as not relevant for
-            # the model
-            if i == 'time':
-                if self.params['time'] > 5:
-                    raise ValueError('Time should not '
-                                     'exceed a value of 5 hours')
+        config.validate(self.params, ('nr_compartments', 'time'))
 
     def check_fill_parametersperip(self):
         """Checks that periph_* parameters are a tuple with two
-        floats both larger than 0.
+        floats both at least 0.
 
         Raises:
             TypeError: If periph_* parameter is not a tuple
             TypeError: If a value in the tuple is not a float
             ValueError: If a value in the tuple is less than 0
         """
-        for n in range(1, self.params['nr_compartments'] + 1):
-            if not isinstance(self.params[f'periph_{n}'], tuple):
-                raise TypeError(f'periph_{n} should be a tuple')
-
-            for i in range(0, 1):
-                if not isinstance(self.params[f'periph_{n}'][i], float):
-                    raise TypeError('values associated with the peripheral'
-                                    f' compartment {n} should be float')
-                if self.params[f'periph_{n}'][i] < 0:
-                    raise ValueError(f'values associated \
-                        with the peripheral compartment \
-                            {n} should be larger than 0')
+        config.validate(self.params, [
+            f'periph_{n}'
+            for n in range(1, self.params['nr_compartments'] + 1)])
 
     def check_fill_parametersCLX(self):
         """Checks that parameters CL and X are floats and larger than 0
@@ -137,20 +153,31 @@ class Protocol(AbstractProtocol):
             TypeError: If CL or X is not a float
             ValueError: If CL or X is less than 0
         """
-        for i in 'CL', 'X':
-            if not isinstance(self.params[i], float):
-                raise TypeError(f'{i} should be a float')
-            if self.params[i] < 0:
-                raise ValueError(f'{i} should be at least 0')
+        config.validate(self.params, ('CL', 'X'))
 
+    @timed('call_all_checks')
     def call_all_checks(self):
-        """Calls all the check functions at once
+        """Calls all the checks at once, in a single pass over the compiled
+        schema of config.py, which also checks the optional parameters
+
+        Raises:
+            TypeError: If a parameter has the wrong type
+            ValueError: If a parameter is missing or out of its bounds
         """
-        self.check_fill_parametersdict()
-        self.check_fill_parametersint()
-        self.check_fill_parametersperip()
-        self.check_fill_parametersCLX()
-        self.check_fill_parametersstr()
+        config.validate(self.params)
+
+    def check_fill_parametersgraph(self):
+        """Checks that the compartments of a graph model map names to float
+        volumes larger than 0, and that its flows are dictionaries with a
+        float value of at least 0
+
+        Raises:
+            TypeError: If compartments is not a dictionary of floats, flows
+            is not a list of dictionaries or a flow value is not a float
+            ValueError: If a volume is not larger than 0 or a flow value is
+            less than 0
+        """
+        config.validate(self.params, ('compartments', 'flows'))
 
     def fill_parameters(self, file_dir):
         """Fills the parameters using the config file and updates the
@@ -159,42 +186,44 @@ class Protocol(AbstractProtocol):
         Args:
             file_dir (string): Relative path for the config file
         """
-        param_dicts = self.read_config(file_dir)
-        # Uses the dictionary from read_config function
-        # If config_file does not define parameter, use default parameter
-        for k in self.params.keys():
-            if k not in param_dicts:
-                param_dicts[k] = self.params[k]
-        # Add parameters for each peripheral compartment based on the
-        # number of compartments defined. Uses defaults if not already
-        # defined in config file.
-        for i in range(1, param_dicts['nr_compartments'] + 1):
-            key = f'periph_{i}'
-            if key not in param_dicts:
-                param_dicts[key] = self.params['periph_default']
-        # If modelling subcutaneous injection, add k_a parameter if not
-        # defined in config_file
-        if (param_dicts['injection_type'] == 'subcutaneous'
-                and 'k_a' not in param_dicts.keys()):
-            param_dicts['k_a'] = 1.0
+        self.update_parameters(self.read_config(file_dir))
+
+    def update_parameters(self, param_dicts):
+        """Updates the default values with the given parameters, adds the
+        peripheral compartments and checks all values
+
+        Args:
+            param_dicts (dict): Parameters, for instance read from a config
+            file. Completed with the defaults in place.
+        """
+        # If config_file does not define parameter, use default parameter,
+        # and add the peripheral compartments and the k_a parameter of
+        # subcutaneous models if not defined
+        config.fill_defaults(param_dicts, self.params)
         # Update parameters with new dictionary and run checks on all values
         self.params = param_dicts
         self.call_all_checks()
 
     def generate_model(self):
-        """Generates a model object based on the parameters in the Protocol object
+        """Generates a model object based on the parameters in the Protocol object,
+        frozen into immutable Parameters (see parameters.py) so that later
+        changes to the protocol do not reach the model
 
         Raises:
             Exception: If an incorrect mode is given
-            (not intravenous nor subcutaneous)
+            (not intravenous, subcutaneous nor graph)
 
         Returns:
             Model Obnject: An initiated model using the defined parameters
         """
-        if self.params['injection_type'] == 'intravenous':
-            return IntravenousModels(self.params)
-        elif self.params['injection_type'] == 'subcutaneous':
-            return SubcutaneousModels(self.params)
+        # the model and its solution share a frozen copy of the parameters
+        parameters = Parameters(self.params)
+        if parameters['injection_type'] == 'intravenous':
+            return IntravenousModels(parameters)
+        elif parameters['injection_type'] == 'subcutaneous':
+            return SubcutaneousModels(parameters)
+        elif parameters['injection_type'] == 'graph':
+            return GraphModel(parameters)
         else:
-            raise Exception(
-                'model type should be either intravenous or subcutaneous')
+            raise Exception('model type should be intravenous, subcutaneous '
+                            'or graph')
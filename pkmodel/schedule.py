@@ -0,0 +1,249 @@
+"""schedule.py evaluates multiple dose schedules of a PK model by linear
+superposition, without integrating over the whole schedule.
+
+The model is linear and time invariant, so the amounts after any number of
+doses are the sum of the responses to each dose, shifted to its time. All of
+them are built from a single unit response, the step response of the model
+to a unit rate infusion starting at 0,
+
+| S(tau) = integral of exp(A s) b ds from 0 to tau, and S(tau) = 0 for tau < 0
+
+which is evaluated once at all the delays needed, in the eigenbasis of the
+rate matrix (see analytic.linear_response):
+
+| bolus of amount a at t_k: a exp(A (t - t_k)) b = a (A S(t - t_k) + b)
+| infusion of amount a over [t_k, t_k + d): a / d (S(t - t_k) - S(t - t_k - d))
+
+The periodic steady state of a dose repeated every interval tau is solved
+for directly: the amounts q_0 at the start of each interval satisfy
+q_0 = exp(A tau) q_0 + r(tau), where r is the response to a single dose, so
+
+| q_0 = (I - exp(A tau))^-1 r(tau)
+
+Schedules are described by the start time, amount and duration of each
+dose, a duration of 0 being a bolus.
+"""
+
+import numpy as np
+import scipy.linalg
+import scipy.optimize
+import scipy.sparse
+
+from pkmodel.analytic import linear_response
+from pkmodel.models import time_points
+from pkmodel.solution import Solution
+
+
+def repeated_doses(interval, nr_doses, amount, duration=0., start=0.):
+    """Schedule of a dose repeated at a fixed interval.
+
+    :param interval: time between the starts of two doses
+    :type interval: float
+    :param nr_doses: number of doses
+    :type nr_doses: int
+    :param amount: amount of each dose
+    :type amount: float
+    :param duration: duration of each dose, defaults to 0 for boluses
+    :type duration: float, optional
+    :param start: time of the first dose, defaults to 0
+    :type start: float, optional
+    :return: start times, amounts and durations of the doses, each with
+        dimensions K
+    :rtype: tuple of arrays of float
+    """
+    times = start + interval * np.arange(nr_doses)
+    return (times, np.full(nr_doses, float(amount)),
+            np.full(nr_doses, float(duration)))
+
+
+def step_response(A, b, tau):
+    """Response of dq/dt = A q + u(t) b from q(0) = 0 to a unit rate input
+    u(t) = 1 for t >= 0, at the delays tau, or 0 for tau <= 0.
+
+    :param A: rate matrix with dimensions N x N
+    :type A: array of float
+    :param b: dose input vector with dimensions N
+    :type b: array of float
+    :param tau: delays, with any dimensions D
+    :type tau: array of float
+    :return: amounts with dimensions N x D
+    :rtype: array of float
+    """
+    tau = np.asarray(tau, dtype=float)
+    response = np.zeros((len(b),) + tau.shape)
+    positive = tau > 0
+    if np.any(positive):
+        # each distinct delay is evaluated once
+        delays, inverse = np.unique(tau[positive], return_inverse=True)
+        response[:, positive] = linear_response(
+            A, b, np.array([0., delays[-1]]), np.ones(1), delays)[:, inverse]
+    return response
+
+
+def free_response(A, q0, t):
+    """Amounts exp(A t) q0 from the initial amounts q0, without input.
+
+    :param A: rate matrix with dimensions N x N
+    :type A: array of float
+    :param q0: initial amounts with dimensions N
+    :type q0: array of float
+    :param t: T time points, at least 0
+    :type t: array of float
+    :return: amounts with dimensions N x T
+    :rtype: array of float
+    """
+    return A @ step_response(A, q0, t) + q0[:, None]
+
+
+def superpose(A, b, times, amounts, durations, t_eval):
+    """Amounts over a dose schedule, as the sum of the responses to each
+    dose.
+
+    :param A: rate matrix with dimensions N x N
+    :type A: array of float
+    :param b: dose input vector with dimensions N
+    :type b: array of float
+    :param times: start time of each dose, with dimensions K
+    :type times: array of float
+    :param amounts: amount of each dose, with dimensions K
+    :type amounts: array of float
+    :param durations: duration of each dose, 0 for a bolus, with dimensions K
+    :type durations: array of float
+    :param t_eval: T time points at which to evaluate the amounts
+    :type t_eval: array of float
+    :return: amounts with dimensions N x T
+    :rtype: array of float
+    """
+    times, amounts, durations = np.broadcast_arrays(
+        *(np.asarray(value, dtype=float)
+          for value in (times, amounts, durations)))
+    t_eval = np.asarray(t_eval, dtype=float)
+    bolus = durations == 0
+    delays = t_eval[None, :] - times[:, None]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rates = np.where(bolus, amounts, amounts / durations)
+    # the step responses of all doses are evaluated in a single call, at
+    # the delays since their start, and since their end for infusions
+    steps = step_response(A, b, np.concatenate(
+        [delays, delays[~bolus] - durations[~bolus, None]]))
+    starts, ends = steps[:, :len(times)], steps[:, len(times):]
+    infused = np.einsum('k,nkt->nt', rates[~bolus],
+                        starts[:, ~bolus] - ends)
+    # exp(A tau) b = A S(tau) + b
+    injected = A @ np.einsum('k,nkt->nt', amounts[bolus], starts[:, bolus])
+    injected += np.outer(b, np.sum(amounts[bolus, None]
+                                   * (delays[bolus] >= 0), axis=0))
+    return infused + injected
+
+
+def steady_state(A, b, interval, amount, duration, t_eval):
+    """Periodic steady state of a dose repeated every interval, over one
+    interval starting at a dose.
+
+    :param A: rate matrix with dimensions N x N
+    :type A: array of float
+    :param b: dose input vector with dimensions N
+    :type b: array of float
+    :param interval: time between the starts of two doses
+    :type interval: float
+    :param amount: amount of each dose
+    :type amount: float
+    :param duration: duration of each dose, 0 for a bolus, at most interval
+    :type duration: float
+    :param t_eval: T time points within [0, interval]
+    :type t_eval: array of float
+    :raises ValueError: If the model has no steady state, as the drug is not
+        eliminated from every compartment
+    :return: amounts with dimensions N x T
+    :rtype: array of float
+    """
+    if np.max(np.linalg.eigvals(A).real, initial=-np.inf) >= 0:
+        raise ValueError('model has no steady state, the drug should be '
+                         'eliminated from every compartment')
+    if not 0 <= duration <= interval:
+        raise ValueError('duration should be between 0 and the interval')
+    dose = ([0.], [amount], [duration])
+    # amounts left by all the previous doses at the start of an interval,
+    # just before its dose
+    q_end = superpose(A, b, *dose, [interval])[:, 0]
+    q0 = np.linalg.solve(np.eye(len(b)) - scipy.linalg.expm(A * interval),
+                         q_end)
+    return free_response(A, q0, t_eval) + superpose(A, b, *dose, t_eval)
+
+
+def _system(model):
+    """Dense rate matrix and dose vector of a model"""
+    A = model.rate_matrix
+    if scipy.sparse.issparse(A):
+        A = A.toarray()
+    return A, model.dose_vector
+
+
+def _solution(model, y, t_eval, time):
+    """Solution of the amounts y of a model at the time points t_eval"""
+    result = scipy.optimize.OptimizeResult(
+        t=t_eval, y=y, sol=None, nfev=0, njev=0, nlu=0, status=0,
+        message='Superposition of unit responses.', success=True)
+    return Solution(result, model.parameters.replace(time=time))
+
+
+def solve_schedule(model, times, amounts, durations=0., time=None,
+                   output_grid=1000):
+    """Solves a model for a dose schedule, in place of its dose function.
+
+    :param model: model giving the rate matrix and dosed compartment
+    :type model: Model
+    :param times: start time of each dose
+    :type times: array of float
+    :param amounts: amount of each dose
+    :type amounts: array of float
+    :param durations: duration of each dose, 0 for boluses; defaults to 0
+    :type durations: float or array of float, optional
+    :param time: end of the solve interval, which may exceed the time
+        period of the model; defaults to the end of the last dose
+    :type time: float, optional
+    :param output_grid: number of evenly spaced time points from 0 to time,
+        or sorted sequence of time points; defaults to 1000 points
+    :type output_grid: int or sequence of float, optional
+    :return: solution of the amounts in each compartment
+    :rtype: Solution
+    """
+    times, amounts, durations = np.broadcast_arrays(
+        *(np.asarray(value, dtype=float)
+          for value in (times, amounts, durations)))
+    if time is None:
+        time = float(np.max(times + durations, initial=0.))
+    t_eval = time_points(output_grid, time)
+    A, b = _system(model)
+    return _solution(model, superpose(A, b, times, amounts, durations,
+                                      t_eval), t_eval, time)
+
+
+def solve_steady_state(model, interval, amount=None, duration=0.,
+                       output_grid=1000):
+    """Solves a model for the periodic steady state of a dose repeated every
+    interval, over one interval starting at a dose.
+
+    :param model: model giving the rate matrix and dosed compartment
+    :type model: Model
+    :param interval: time between the starts of two doses
+    :type interval: float
+    :param amount: amount of each dose, defaults to X of the model
+    :type amount: float, optional
+    :param duration: duration of each dose, defaults to 0 for boluses
+    :type duration: float, optional
+    :param output_grid: number of evenly spaced time points from 0 to
+        interval, or sorted sequence of time points within it; defaults to
+        1000 points
+    :type output_grid: int or sequence of float, optional
+    :raises ValueError: If the model has no steady state
+    :return: solution of the amounts in each compartment
+    :rtype: Solution
+    """
+    if amount is None:
+        amount = model.X
+    t_eval = time_points(output_grid, interval)
+    A, b = _system(model)
+    return _solution(model, steady_state(A, b, interval, amount, duration,
+                                         t_eval), t_eval, interval)
+
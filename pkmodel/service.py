@@ -0,0 +1,290 @@
+"""service.py runs pkmodel as a long-lived local job service, so that many
+solves share the start-up and imports of a single process pool rather than
+paying for them on every run.py invocation.
+
+Jobs arrive as JSON lines, over a TCP socket on localhost or on stdin, and
+results are streamed back as JSON lines as soon as each job completes, in
+the order they complete. A request is either the parameters of a protocol,
+or an object with the parameters and options of the job:
+
+| {"id": 7, "parameters": {"name": "a", "CL": 2.0}, "output": "metrics"}
+| {"id": 7, "ok": true, "elapsed": 0.004, "metrics": {"AUC": [...], ...}}
+
+where output is 'metrics' (default) to reply with the metrics of each
+compartment, or 'files' to save the outputs of the protocol in ./Output/ as
+run.py does and reply with their paths. A failing job replies with ok false
+and its error. Jobs without an id are numbered in the order they arrive.
+
+The asyncio front end only parses requests and writes replies; each job runs
+Protocol -> Model.solve in a worker process. At most max_pending jobs are in
+flight at once, beyond which the service stops reading requests, so that a
+fast client is held back by the socket buffers rather than queueing jobs
+without bound.
+"""
+
+import asyncio
+import concurrent.futures
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+from pkmodel import config
+from pkmodel.protocol import Protocol
+
+OUTPUTS = ('metrics', 'files')
+# default host of the service, only reachable from this machine
+HOST = '127.0.0.1'
+
+
+def run_request(parameters, output='metrics'):
+    """Runs a single job in a worker process:
+    Protocol(...).generate_model().solve()
+
+    :param parameters: protocol parameters, with the periph_* pairs as
+        tuples or lists
+    :type parameters: dict
+    :param output: 'metrics' to return the metrics of each compartment, or
+        'files' to save the outputs and return their paths, for names
+        without a path separator
+    :type output: string, optional
+    :return: reply fields of the job, without its id
+    :rtype: dict
+    """
+    start = time.perf_counter()
+    try:
+        if output not in OUTPUTS:
+            raise ValueError('output should be one of ' + ', '.join(OUTPUTS))
+        parameters = config.periph_tuples(dict(parameters))
+        if output == 'files':
+            # test runs would display the plot in the worker
+            parameters['run_mode'] = 'save'
+        protocol = Protocol(parameters=parameters)
+        if (output == 'files' and os.path.basename(protocol.params['name'])
+                != protocol.params['name']):
+            raise ValueError('name should not contain a path separator')
+        solution = protocol.generate_model().solve()
+        if output == 'metrics':
+            result = {'metrics': {key: value.tolist() for key, value
+                                  in solution.metrics().items()}}
+        else:
+            result = {'files': sorted(map(os.path.normpath,
+                                          solution.output()))}
+    except Exception as e:
+        result = {'error': '{0}: {1}'.format(type(e).__name__, e)}
+    result['ok'] = 'error' not in result
+    result['elapsed'] = time.perf_counter() - start
+    return result
+
+
+def parse_request(line, number):
+    """Parses a request line into its id, protocol parameters and output
+
+    :param line: JSON object of the request
+    :type line: string or bytes
+    :param number: number of the request, its id if it gives none
+    :type number: int
+    :raises ValueError: If the line is not a JSON object
+    :return: id, parameters and output of the job
+    :rtype: tuple
+    """
+    request = json.loads(line)
+    if not isinstance(request, dict):
+        raise ValueError('request should be a JSON object')
+    if 'parameters' not in request:
+        return number, request, 'metrics'
+    return (request.get('id', number), request['parameters'],
+            request.get('output', 'metrics'))
+
+
+class JobService:
+    """Queue of solve jobs in front of a pool of worker processes.
+
+    :param workers: number of worker processes, defaults to the number of
+        CPUs
+    :type workers: int, optional
+    :param max_pending: number of jobs in flight above which requests are no
+        longer read, defaults to twice the number of workers
+    :type max_pending: int, optional
+    :param executor: executor running the jobs in place of a new process
+        pool, e.g. shared with other services; defaults to None
+    :type executor: concurrent.futures.Executor, optional
+    """
+    def __init__(self, workers=None, max_pending=None, executor=None):
+        """Starts the worker processes"""
+        self.owns_executor = executor is None
+        if executor is None:
+            # forked workers would inherit the client sockets open at the
+            # time, and keep them open once the service closes them
+            executor = concurrent.futures.ProcessPoolExecutor(
+                workers, multiprocessing.get_context('spawn'))
+        self.executor = executor
+        if max_pending is None:
+            max_pending = 2 * (workers or os.cpu_count() or 1)
+        self.max_pending = max_pending
+        self.numbers = itertools.count()
+        self.__pending = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Shuts the worker processes down, once their jobs are done
+
+        :return: None
+        """
+        if self.owns_executor:
+            self.executor.shutdown()
+
+    @property
+    def pending(self):
+        """Semaphore of the jobs in flight, created in the running event
+        loop"""
+        if self.__pending is None:
+            self.__pending = asyncio.Semaphore(self.max_pending)
+        return self.__pending
+
+    async def run(self, parameters, output='metrics'):
+        """Runs a job in the pool, once counted as pending"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, run_request,
+                                          parameters, output)
+
+    async def process(self, readline, write):
+        """Runs the jobs of a stream of request lines, writing the reply of
+        each job as it completes. The next line is only read once fewer than
+        max_pending jobs are in flight.
+
+        :param readline: coroutine function returning the next line, or an
+            empty line at the end of the stream
+        :type readline: function
+        :param write: coroutine function writing a reply line
+        :type write: function
+        :return: number of requests
+        :rtype: int
+        """
+        tasks = set()
+        count = 0
+        while True:
+            await self.pending.acquire()
+            line = await readline()
+            if not line:
+                self.pending.release()
+                break
+            if not line.strip():
+                self.pending.release()
+                continue
+            count += 1
+            task = asyncio.ensure_future(self.reply(line, write))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks)
+        return count
+
+    async def reply(self, line, write):
+        """Runs the job of a request line, counted as pending, and writes
+        its reply; a job the pool fails to run replies with its error"""
+        number = next(self.numbers)
+        try:
+            job_id, parameters, output = parse_request(line, number)
+        except ValueError as e:
+            self.pending.release()
+            result = {'id': number, 'ok': False,
+                      'error': 'ValueError: {0}'.format(e)}
+        else:
+            try:
+                result = dict(id=job_id, **await self.run(parameters,
+                                                          output))
+            except Exception as e:
+                result = {'id': job_id, 'ok': False,
+                          'error': '{0}: {1}'.format(type(e).__name__, e)}
+            finally:
+                self.pending.release()
+        await write(json.dumps(result) + '\n')
+
+    async def handle_connection(self, reader, writer):
+        """Serves the requests of a client connection, see process"""
+        lock = asyncio.Lock()
+
+        async def write(line):
+            async with lock:
+                writer.write(line.encode())
+                await writer.drain()
+
+        try:
+            await self.process(reader.readline, write)
+        finally:
+            writer.close()
+
+    async def serve(self, host=HOST, port=0):
+        """Starts serving on a TCP socket. Each connection sends requests
+        and receives their replies until it closes its end.
+
+        :param host: host to listen on, defaults to HOST for local clients
+            only
+        :type host: string, optional
+        :param port: port to listen on, defaults to 0 for any free port
+        :type port: int, optional
+        :return: the server, listening on server.sockets[0].getsockname()
+        :rtype: asyncio.Server
+        """
+        return await asyncio.start_server(self.handle_connection, host, port)
+
+    async def serve_stdio(self, stdin=None, stdout=None):
+        """Serves the requests read from stdin, writing the replies to
+        stdout, until the end of stdin
+
+        :param stdin: binary stream of requests, defaults to sys.stdin
+        :type stdin: file object, optional
+        :param stdout: text stream of replies, defaults to sys.stdout
+        :type stdout: file object, optional
+        :return: number of requests
+        :rtype: int
+        """
+        stdin = stdin or sys.stdin.buffer
+        stdout = stdout or sys.stdout
+        loop = asyncio.get_running_loop()
+
+        async def readline():
+            # a blocking read, kept off the event loop
+            return await loop.run_in_executor(None, stdin.readline)
+
+        async def write(line):
+            stdout.write(line)
+            stdout.flush()
+
+        return await self.process(readline, write)
+
+
+async def request(jobs, host=HOST, port=None):
+    """Sends jobs to a running service and collects their replies, e.g. to
+    drive the service from Python.
+
+    :param jobs: protocol parameters, or request objects (see parse_request)
+    :type jobs: iterable of dicts
+    :param host: host of the service, defaults to HOST
+    :type host: string, optional
+    :param port: port of the service
+    :type port: int
+    :return: reply of each job, in the order they completed
+    :rtype: list of dicts
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+
+    async def send():
+        for job in jobs:
+            writer.write((json.dumps(job) + '\n').encode())
+            await writer.drain()
+        writer.write_eof()
+
+    sender = asyncio.ensure_future(send())
+    replies = [json.loads(line) async for line in reader]
+    await sender
+    writer.close()
+    return replies
@@ -4,10 +4,23 @@ pharmokinetic model
 """
 
 from pkmodel.AbstractSolution import AbstractSolution
-import matplotlib.pyplot as plt
+from pkmodel.metrics import compute_metrics, metric_sensitivities
+from pkmodel import store
+from pkmodel.instrumentation import timed
+from pkmodel.parameters import freeze
+import numpy as np
 import os
-import pandas as pd
 import json
+import logging
+
+# values of the 'plot' parameter: save the plot, skip it, or defer it to
+# plotting.render_pending
+PLOT_OPTIONS = (True, False, 'deferred')
+
+logger = logging.getLogger('pkmodel')
+
+# matplotlib and pandas are imported when first needed by the plotting and
+# csv methods, so that importing pkmodel for a numeric solve stays fast
 
 
 class Solution(AbstractSolution):
@@ -16,6 +29,9 @@ class Solution(AbstractSolution):
     :param AbstractSolution: [description]
     :type AbstractSolution: [type]
     """
+    __slots__ = ('__solution_vector', '__parameter_dict', '__metrics',
+                 '__metric_sensitivities')
+
     def __init__(self, solution_vector, parameter_dict) -> None:
         """Initialise instance of Solution class with a solution vector
         generated by Model.
@@ -23,9 +39,14 @@ class Solution(AbstractSolution):
         :param solution_vector: x * t matrix where x is number of compartments
             and t is length of time vector
         :type solution_vector: array of float
+        :param parameter_dict: parameters of the model, frozen into
+            immutable Parameters if given as a dict
+        :type parameter_dict: dict or Parameters
         """
         self.__solution_vector = solution_vector
-        self.__parameter_dict = parameter_dict
+        self.__parameter_dict = freeze(parameter_dict)
+        self.__metrics = None
+        self.__metric_sensitivities = None
 
     @property
     def get_solution(self):
@@ -34,18 +55,157 @@ class Solution(AbstractSolution):
         :return: list of y, t --> where y = np.array of quantities and
         <-- t = np.array of time
         :rtype: list of numpy arrays
+        :raises ValueError: If the trajectory was discarded
         """
         vector = self.__solution_vector
+        if vector.y is None:
+            raise ValueError('trajectory of the solution was discarded')
         y = vector.y
         t = vector.t
         return [y, t]
 
+    def __call__(self, t):
+        """Evaluate the solution at arbitrary times, for solutions computed
+        with dense output
+
+        :param t: time point or array of time points within the solved
+            time interval
+        :type t: float or array of float
+        :raises ValueError: If the solution was computed without dense output
+        :return: amount in each compartment, with dimensions N or N x T
+        :rtype: numpy array
+        """
+        dense_solution = self.__solution_vector.get('sol')
+        if dense_solution is None:
+            raise ValueError('solution was computed without dense output')
+        return dense_solution(t)
+
+    @property
+    def stats(self):
+        """Counters of the solve: RHS evaluations nfev, Jacobian evaluations
+        njev and LU decompositions nlu (all 0 for the analytic solver), and
+        the wall time of Model.solve in seconds
+
+        :return: nfev, njev, nlu and elapsed
+        :rtype: dict
+        """
+        vector = self.__solution_vector
+        return {key: vector.get(key)
+                for key in ('nfev', 'njev', 'nlu', 'elapsed')}
+
+    @property
+    def sensitivities(self):
+        """Derivatives of the amount in each compartment with respect to
+        each model parameter, for solutions computed with sensitivities
+
+        :raises ValueError: If the solution was computed without
+            sensitivities, or its trajectory was discarded
+        :return: parameter names mapped to arrays with dimensions N x T
+        :rtype: dict
+        """
+        vector = self.__solution_vector
+        if vector.get('sens_names') is None:
+            raise ValueError('solution was computed without sensitivities')
+        if vector.get('sens') is None:
+            raise ValueError('trajectory of the solution was discarded')
+        return dict(zip(vector.sens_names, vector.sens))
+
+    def metric_sensitivities(self):
+        """Derivatives of the AUC, Cmax and Cmin of each compartment with
+        respect to each model parameter (see metrics.metric_sensitivities),
+        e.g. metric_sensitivities()['CL']['AUC'] holds dAUC / dCL
+
+        :raises ValueError: If the solution was computed without
+            sensitivities
+        :return: parameter names mapped to dicts of arrays with dimensions N
+        :rtype: dict
+        """
+        if self.__metric_sensitivities is not None:
+            return self.__metric_sensitivities
+        sensitivities = self.sensitivities
+        y, t = self.get_solution
+        derivatives = metric_sensitivities(
+            y, np.array(list(sensitivities.values())), t)
+        return {name: {key: value[i] for key, value in derivatives.items()}
+                for i, name in enumerate(sensitivities)}
+
+    @property
+    def trajectory_discarded(self):
+        """Whether the trajectory was discarded, keeping the metrics only
+
+        :return: True if discard_trajectory was called
+        :rtype: bool
+        """
+        return self.__metrics is not None
+
+    def metrics(self, threshold=None):
+        """Summary statistics of the solution for each compartment: AUC,
+        Cmax, Tmax, Cmin, terminal half-life and time above threshold
+        (see metrics.compute_metrics)
+
+        :param threshold: quantity for the time above threshold, defaults to
+            the 'threshold' parameter, or None to skip it
+        :type threshold: float, optional
+        :raises ValueError: If the trajectory was discarded and a different
+            threshold is asked for
+        :return: array with dimensions N of each statistic
+        :rtype: dict
+        """
+        if threshold is None:
+            threshold = self.get_parameters.get('threshold')
+        if self.__metrics is not None:
+            if threshold != self.__metrics[0]:
+                raise ValueError('trajectory of the solution was discarded, '
+                                 'metrics are only available for threshold '
+                                 f'{self.__metrics[0]}')
+            return self.__metrics[1]
+        y, t = self.get_solution
+        return compute_metrics(y, t, threshold)
+
+    def downsample(self, points):
+        """Solution keeping evenly spaced points of the trajectory, the
+        first and last time points included, e.g. to store or plot many
+        solutions
+
+        :param points: largest number of time points kept
+        :type points: int
+        :raises ValueError: If the trajectory was discarded
+        :return: new solution with the same parameters
+        :rtype: Solution
+        """
+        y, t = self.get_solution
+        index = np.unique(np.linspace(0, len(t) - 1, max(points, 1))
+                          .round().astype(int))
+        vector = type(self.__solution_vector)(self.__solution_vector)
+        vector.update(t=t[index], y=y[:, index], sol=None)
+        if vector.get('sens') is not None:
+            vector['sens'] = vector['sens'][..., index]
+        return Solution(vector, self.__parameter_dict)
+
+    def discard_trajectory(self, threshold=None):
+        """Computes the metrics, and their sensitivities if solved for, and
+        then releases the stored trajectory, to keep memory flat when solving
+        many models
+
+        :param threshold: quantity for the time above threshold, defaults to
+            the 'threshold' parameter, or None to skip it
+        :type threshold: float, optional
+        :return: None
+        """
+        if threshold is None:
+            threshold = self.get_parameters.get('threshold')
+        if self.__metrics is None:
+            self.__metrics = (threshold, self.metrics(threshold))
+            if self.__solution_vector.get('sens_names') is not None:
+                self.__metric_sensitivities = self.metric_sensitivities()
+        self.__solution_vector.update(y=None, t=None, sol=None, sens=None)
+
     @property
     def get_parameters(self):
         """Return parameter dictionary
 
-        :return dictionary of paremters
-        :type: dict
+        :return immutable parameters of the model
+        :type: Parameters
         """
         return self.__parameter_dict
 
@@ -55,89 +215,160 @@ class Solution(AbstractSolution):
         :return: plots of quantity vs time for each compartment
         :type: matplotlib plot
         """
+        import matplotlib.pyplot as plt
+        from pkmodel import plotting
+
         array_list = self.get_solution
         #generate figure
         f = plt.figure()
-
-        t = array_list[1]
-
-        for i in range(array_list[0].shape[0]):
-            #iterate over each compartment and sequentially plot
-            y = array_list[0][i, :]
-            if i == 0:
-                plt.plot(t, y, figure=f, label='central compartment')
-            else:
-                #add legend labels for each peripheral compartment
-                label = 'peripheral compartment ' + str(i)
-                plt.plot(t, y, figure=f, label=label)
-
-        plt.legend()
-        plt.title('Quantity(t) for drug in central & peripheral components')
-        plt.xlabel('Time')
-        plt.ylabel('Quantity')
+        plotting.draw(f.add_subplot(), *array_list)
 
         return f
 
+    @timed('plot')
     def show_plot(self):
         """ displays plot for testing
 
         :return: None
         """
+        import matplotlib.pyplot as plt
+
         self.generate_plot()
         plt.show()
 
+    @timed('plot')
     def save_plot(self, dir_path, model_no):
-        """ saves plot of solutions as png
+        """ saves plot of solutions as png, rendered off-screen
+        <-- without pyplot so that no figure is left open
 
-        :return: None
+        :return: path of the plot
+        :rtype: string
         """
-        self.generate_plot()
-        plt.savefig('{0}{1}_plot.png'.format(dir_path, model_no))
+        from pkmodel import plotting
+
+        path = '{0}{1}_plot.png'.format(dir_path, model_no)
+        plotting.save_plot(path, *self.get_solution)
+        return path
 
+    @timed('save_parameters')
     def save_parameters(self, dir_path, model_no):
         """ saves input parameters in text file
 
-        :return: None
+        :return: path of the text file
+        :rtype: string
         """
-        param_dict = self.get_parameters
+        param_dict = self.get_parameters.to_dict()
         del param_dict['dose_mode']
 
-        with open('{0}{1}_params.txt'.format(dir_path,
-                                             model_no), 'w') as file:
+        path = '{0}{1}_params.txt'.format(dir_path, model_no)
+        with open(path, 'w') as file:
             file.write(json.dumps(param_dict))
+        return path
 
-    def save_solution(self, dir_path, model_no):
-        """ saves solutions in a csv file
+    @timed('save_solution')
+    def save_solution(self, dir_path, model_no, output_format='csv'):
+        """ saves solutions in a csv file, or in a binary format:
+        <-- compressed npz, parquet, or appended to the hdf5 store of the
+        <-- output directory, one per worker process (see store.store_name)
 
-        :return: None
+        :param output_format: one of store.FORMATS, defaults to 'csv'
+        :type output_format: string, optional
+        :raises ValueError: If the output format is not one of store.FORMATS
+        :return: path of the file, or of the store appended to
+        :rtype: string
+        """
+        y, t = self.get_solution
+        path = '{0}{1}_solution.{2}'.format(dir_path, model_no,
+                                            output_format)
+        if output_format == 'csv':
+            import pandas as pd
+
+            df = pd.DataFrame(np.column_stack([t, y.T]),
+                              columns=['Time'] + list(range(len(y))))
+            df.to_csv(path, index=True)
+        elif output_format == 'npz':
+            store.save_npz(path, y, t)
+        elif output_format == 'parquet':
+            store.save_parquet(path, y, t)
+        elif output_format == 'hdf5':
+            path = dir_path + store.store_name()
+            store.save_hdf5(path, model_no, y, t)
+        else:
+            raise ValueError('output_format should be one of '
+                             + ', '.join(store.FORMATS))
+        return path
+
+    @timed('save_metrics')
+    def save_metrics(self, dir_path, model_no):
+        """ saves metrics of each compartment in a json file
+
+        :return: path of the json file
+        :rtype: string
         """
-        solution = self.get_solution
-        df_t = pd.DataFrame(solution[1])
-        df_t = df_t.rename(columns={0: 'Time'})
-        df_y = pd.DataFrame(solution[0]).T
-        df = pd.merge(df_t, df_y, left_index=True, right_index=True)
+        metrics = {key: value.tolist()
+                   for key, value in self.metrics().items()}
+        path = '{0}{1}_metrics.json'.format(dir_path, model_no)
+        with open(path, 'w') as file:
+            file.write(json.dumps(metrics))
+        return path
 
-        df.to_csv('{0}{1}_solution.csv'.format(dir_path,
-                                               model_no), index=True)
+    def save_outputs(self, dir_path, plot=True):
+        """ saves the parameters, and the solution in each output format
+        <-- and its plot, or the metrics if the trajectory was discarded
+
+        :param plot: whether to save the plot, defaults to True
+        :type plot: bool or string, optional
+        :return: paths of the saved files
+        :rtype: list of strings
+        """
+        name = self.get_parameters['name']
+        if self.trajectory_discarded:
+            return [self.save_metrics(dir_path, name),
+                    self.save_parameters(dir_path, name)]
+        paths = [self.save_parameters(dir_path, name)]
+        output_formats = self.get_parameters.get('output_format', 'csv')
+        if isinstance(output_formats, str):
+            output_formats = [output_formats]
+        for output_format in output_formats:
+            paths.append(self.save_solution(dir_path, name, output_format))
+        # plot once the numeric outputs are saved
+        if plot is True:
+            paths.append(self.save_plot(dir_path, name))
+        return paths
 
     def output(self):
         """ creates and populates output directory
         <-- with saved plot, parameters, and solution
+        <-- or with parameters and metrics if the trajectory was discarded
+        <-- in test mode, the metrics of a discarded trajectory are logged
+        <-- at INFO level with the 'pkmodel' logger
+        <-- the 'plot' parameter skips the plot if False, or defers it to
+        <-- plotting.render_pending if 'deferred'
 
-        :return: None
+        :raises ValueError: If the 'plot' parameter is not one of
+            PLOT_OPTIONS
+        :return: paths of the saved files, none in test mode
+        :rtype: list of strings
         """
         parameter_dict = self.get_parameters
+        plot = parameter_dict.get('plot', True)
+        # 1 == True, so the type is checked as well
+        if not isinstance(plot, (bool, str)) or plot not in PLOT_OPTIONS:
+            raise ValueError('plot should be one of True, False, deferred')
         #check run mode - either test or save
         if parameter_dict['run_mode'] == 'save':
             #run mode save = save graph fig
             dir_path = './Output/'
             if not os.path.isdir(dir_path):
                 os.mkdir(dir_path)
-            self.save_plot(dir_path, parameter_dict['name'])
-            self.save_parameters(dir_path, parameter_dict['name'])
-            self.save_solution(dir_path, parameter_dict['name'])
+            return self.save_outputs(dir_path, plot)
         elif parameter_dict['run_mode'] == 'test':
             #run mode test = show plot without save
-            self.show_plot()
+            if self.trajectory_discarded:
+                logger.info('metrics of %s: %s', parameter_dict['name'],
+                            self.metrics())
+            elif plot is not False:
+                self.show_plot()
+        return []
 
 
@@ -0,0 +1,252 @@
+"""store.py writes and reads solution arrays in binary formats, without
+going through pandas:
+
+| npz: compressed numpy archive with the t and y arrays
+| parquet: one column for time and one for each compartment (needs pyarrow)
+| hdf5: appendable store of many solutions of the same shape in a single
+    M x N x T dataset (needs h5py); worker processes each append to their
+    own store, see store_name
+
+The optional dependencies are only imported when their format is used.
+"""
+
+import multiprocessing
+import os
+
+import numpy as np
+
+FORMATS = ('csv', 'npz', 'parquet', 'hdf5')
+# file name of the appendable store within the output directory
+STORE_NAME = 'solutions.h5'
+# file name of the store of a worker process, formatted with its pid
+WORKER_STORE_NAME = 'solutions_{0}.h5'
+
+
+def store_name():
+    """File name of the appendable store within the output directory:
+    STORE_NAME in the main process, or WORKER_STORE_NAME in a worker process
+    of a sweep or service, so that parallel workers never wait on the lock
+    of the same HDF5 file
+
+    :return: file name of the store
+    :rtype: string
+    """
+    if multiprocessing.current_process().name == 'MainProcess':
+        return STORE_NAME
+    return WORKER_STORE_NAME.format(os.getpid())
+
+
+def save_npz(path, y, t):
+    """Saves a solution as a compressed numpy archive.
+
+    :param path: file path, ending in .npz
+    :type path: string
+    :param y: quantities with dimensions N x T
+    :type y: array of float
+    :param t: T time points
+    :type t: array of float
+    :return: None
+    """
+    np.savez_compressed(path, t=t, y=y)
+
+
+def load_npz(path):
+    """Loads a solution saved with save_npz.
+
+    :param path: file path
+    :type path: string
+    :return: t array with dimensions T and y array with dimensions N x T
+    :rtype: dict
+    """
+    with np.load(path) as archive:
+        return {'t': archive['t'], 'y': archive['y']}
+
+
+def save_parquet(path, y, t):
+    """Saves a solution as a parquet table with a Time column and one column
+    for each compartment.
+
+    :param path: file path, ending in .parquet
+    :type path: string
+    :param y: quantities with dimensions N x T
+    :type y: array of float
+    :param t: T time points
+    :type t: array of float
+    :raises ImportError: If pyarrow is not installed
+    :return: None
+    """
+    pa, pq = _import_pyarrow()
+    columns = [pa.array(t)] + [pa.array(row) for row in y]
+    names = ['Time'] + [str(i) for i in range(len(y))]
+    pq.write_table(pa.Table.from_arrays(columns, names=names), path)
+
+
+def load_parquet(path):
+    """Loads a solution saved with save_parquet, memory-mapping the file.
+
+    :param path: file path
+    :type path: string
+    :raises ImportError: If pyarrow is not installed
+    :return: t array with dimensions T and y array with dimensions N x T
+    :rtype: dict
+    """
+    pa, pq = _import_pyarrow()
+    table = pq.read_table(path, memory_map=True)
+    columns = [column.to_numpy() for column in table.columns]
+    return {'t': columns[0], 'y': np.stack(columns[1:])}
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError('the parquet format needs pyarrow, install it with '
+                          '`pip install pyarrow`')
+    return pyarrow, pyarrow.parquet
+
+
+class SolutionStore:
+    """Appendable HDF5 store of many solutions sharing the same time points
+    and number of compartments. The solutions are stacked in a single y
+    dataset with dimensions M x N x T, with their names in a names dataset
+    and the shared time points in a t dataset.
+
+    Use as a context manager, or call close when done.
+
+    :param path: file path of the store, created if it does not exist
+    :type path: string
+    :param mode: 'a' to append to the store or 'r' to read it only,
+        defaults to 'a'
+    :type mode: string, optional
+    :raises ImportError: If h5py is not installed
+    """
+    def __init__(self, path, mode='a'):
+        """Opens the store
+
+        :param path: file path of the store, created if it does not exist
+        :type path: string
+        :param mode: 'a' to append to the store or 'r' to read it only,
+            defaults to 'a'
+        :type mode: string, optional
+        """
+        try:
+            import h5py
+        except ImportError:
+            raise ImportError('the hdf5 format needs h5py, install it with '
+                              '`pip install h5py`')
+        self.__h5py = h5py
+        self.file = h5py.File(path, mode)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        """Number of solutions in the store"""
+        if 'y' not in self.file:
+            return 0
+        return self.file['y'].shape[0]
+
+    def close(self):
+        """Closes the store file
+
+        :return: None
+        """
+        self.file.close()
+
+    @property
+    def t(self):
+        """Time points shared by all solutions, read lazily from the file
+
+        :rtype: h5py Dataset
+        """
+        return self.file['t']
+
+    @property
+    def y(self):
+        """Quantities of all solutions with dimensions M x N x T, read lazily
+        from the file
+
+        :rtype: h5py Dataset
+        """
+        return self.file['y']
+
+    @property
+    def names(self):
+        """Names of the solutions in the order they were appended
+
+        :rtype: list of strings
+        """
+        return [name.decode() for name in self.file['names'][:]]
+
+    def append(self, name, y, t):
+        """Appends a solution to the store
+
+        :param name: name of the solution
+        :type name: string
+        :param y: quantities with dimensions N x T
+        :type y: array of float
+        :param t: T time points
+        :type t: array of float
+        :raises ValueError: If the solution does not have the time points
+            and number of compartments of the solutions in the store
+        :return: None
+        """
+        y = np.asarray(y, dtype=float)
+        if 'y' not in self.file:
+            self.file.create_dataset('t', data=t)
+            self.file.create_dataset('y', shape=(0,) + y.shape,
+                                     dtype=float,
+                                     maxshape=(None,) + y.shape,
+                                     chunks=(1,) + y.shape,
+                                     compression='gzip')
+            self.file.create_dataset('names', shape=(0,), maxshape=(None,),
+                                     dtype=self.__h5py.string_dtype())
+        if (self.y.shape[1:] != y.shape
+                or not np.array_equal(self.t[:], t)):
+            raise ValueError('solutions in a store should have the same time '
+                             'points and number of compartments')
+        m = len(self)
+        self.y.resize(m + 1, axis=0)
+        self.file['names'].resize(m + 1, axis=0)
+        self.y[m] = y
+        self.file['names'][m] = name
+
+
+def save_hdf5(path, name, y, t):
+    """Appends a solution to the store at path.
+
+    :param path: file path of the store, created if it does not exist
+    :type path: string
+    :param name: name of the solution
+    :type name: string
+    :param y: quantities with dimensions N x T
+    :type y: array of float
+    :param t: T time points
+    :type t: array of float
+    :raises ImportError: If h5py is not installed
+    :return: None
+    """
+    with SolutionStore(path) as store:
+        store.append(name, y, t)
+
+
+def load_solution(path):
+    """Loads a solution saved as npz or parquet, by file extension.
+
+    :param path: file path
+    :type path: string
+    :raises ValueError: If the file extension is not .npz nor .parquet
+    :return: t and y arrays
+    :rtype: mapping
+    """
+    extension = os.path.splitext(path)[1]
+    if extension == '.npz':
+        return load_npz(path)
+    elif extension == '.parquet':
+        return load_parquet(path)
+    raise ValueError('solution files should be either .npz or .parquet, '
+                     'open .h5 stores with SolutionStore')
@@ -0,0 +1,208 @@
+"""sweep.py runs many PK models, given by config files or a parameter grid,
+across a pool of worker processes. Each job goes through the same
+Protocol -> Model -> Solution pipeline as run.py, and a failing job is
+reported without aborting the rest of the sweep.
+"""
+
+import ast
+import collections
+import collections.abc
+import contextlib
+import concurrent.futures
+import functools
+import glob
+import itertools
+import os
+import time
+
+from pkmodel import config, instrumentation
+from pkmodel.protocol import Protocol
+
+SweepResult = collections.namedtuple('SweepResult',
+                                     ['job', 'elapsed', 'error', 'stats'],
+                                     defaults=[None])
+SweepResult.__doc__ = """Outcome of a single sweep job: the config path,
+ConfigJob or parameter dict, the wall time in seconds, the error message if the job
+failed (None otherwise), and the instrumentation summary of the job if it
+was instrumented (None otherwise)."""
+
+ConfigJob = collections.namedtuple('ConfigJob',
+                                   ['path', 'index', 'parameters'])
+ConfigJob.__doc__ = """Protocol read from a config file: the path of the
+file, the index of the protocol within the file (None if the file holds a
+single protocol), and the parameters of the protocol."""
+
+
+def config_paths(source):
+    """Lists the config files of a sweep.
+
+    :param source: directory holding the config files, or glob pattern
+        matching them
+    :type source: string
+    :return: sorted paths of the config files
+    :rtype: list of strings
+    """
+    if os.path.isdir(source):
+        source = os.path.join(source, '*')
+    return sorted(path for path in glob.glob(source) if os.path.isfile(path))
+
+
+def config_jobs(paths):
+    """Reads the protocols of the config files of a sweep, in any format of
+    config.read_documents, so that files holding many protocols give one job
+    each. Files that cannot be read are passed on as paths, for their job to
+    report the error.
+
+    :param paths: paths of the config files
+    :type paths: iterable of strings
+    :return: protocol of each config file, with the path it was read from,
+        or path of each file that cannot be read
+    :rtype: generator of ConfigJob or strings
+    """
+    for path in paths:
+        try:
+            documents = config.read_documents(path)
+        except Exception:
+            yield path
+            continue
+        if len(documents) == 1:
+            yield ConfigJob(path, None, documents[0])
+            continue
+        for index, document in enumerate(documents):
+            yield ConfigJob(path, index, document)
+
+
+def job_label(job):
+    """Label of a sweep job in reports: the name of its protocol and the
+    config file it was read from, whichever are known
+
+    :param job: config path, ConfigJob or parameters
+    :type job: string, ConfigJob or dict
+    :return: label of the job
+    :rtype: string
+    """
+    if isinstance(job, ConfigJob):
+        source = job.path
+        if job.index is not None:
+            source = '{0}[{1}]'.format(job.path, job.index)
+        parameters = job.parameters
+        if (isinstance(parameters, collections.abc.Mapping)
+                and 'name' in parameters):
+            return '{0} ({1})'.format(parameters['name'], source)
+        return source
+    if isinstance(job, collections.abc.Mapping):
+        return job.get('name', config.DEFAULTS['name'])
+    return job
+
+
+def parameter_grid(base, grid):
+    """Generates the parameter dicts of every combination of the grid values.
+    Each job is named after the base name and its index in the grid, so
+    that saved outputs do not overwrite each other.
+
+    :param base: parameters shared by all jobs
+    :type base: dict
+    :param grid: values to sweep over for each parameter name
+    :type grid: dict of lists
+    :return: parameter dict for each grid point
+    :rtype: generator of dicts
+    """
+    names = list(grid)
+    for i, values in enumerate(itertools.product(*grid.values())):
+        parameters = dict(base, **dict(zip(names, values)))
+        parameters['name'] = '{0}_{1}'.format(base.get('name', 'model'), i)
+        yield parameters
+
+
+def read_grid(file_dir):
+    """Reads a parameter grid file, in the Python dictionary style of the
+    config files, mapping parameter names to lists of values.
+
+    :param file_dir: path of the grid file
+    :type file_dir: string
+    :return: values to sweep over for each parameter name
+    :rtype: dict of lists
+    """
+    with open(file_dir, 'r') as file:
+        return ast.literal_eval(file.read())
+
+
+def run_job(job, instrument=False):
+    """Runs a single sweep job: Protocol(...).generate_model().solve().output()
+
+    :param job: config path, protocol read from a config file, or
+        parameters
+    :type job: string, ConfigJob, dict or Parameters
+    :param instrument: whether to record the spans and counters of the job
+        (see instrumentation.py), defaults to False
+    :type instrument: bool, optional
+    :return: outcome of the job
+    :rtype: SweepResult
+    """
+    recorder = instrumentation.Recorder()
+    start = time.perf_counter()
+    error = None
+    with recorder if instrument else contextlib.nullcontext():
+        try:
+            if isinstance(job, ConfigJob):
+                protocol = Protocol(parameters=job.parameters)
+            elif isinstance(job, collections.abc.Mapping):
+                protocol = Protocol(parameters=job)
+            else:
+                protocol = Protocol(job)
+            protocol.generate_model().solve().output()
+        except Exception as e:
+            error = '{0}: {1}'.format(type(e).__name__, e)
+    stats = recorder.summary() if instrument else None
+    return SweepResult(job, time.perf_counter() - start, error, stats)
+
+
+def run_sweep(jobs, workers=None, chunksize=1, instrument=False):
+    """Runs the jobs of a sweep across a process pool. Results are yielded
+    in the order of the jobs as they complete.
+
+    :param jobs: config paths, ConfigJob or parameter dicts
+    :type jobs: iterable
+    :param workers: number of worker processes, defaults to the number of
+        CPUs; 1 runs the jobs in the current process
+    :type workers: int, optional
+    :param chunksize: number of jobs sent to a worker at once, defaults to 1
+    :type chunksize: int, optional
+    :param instrument: whether to record the spans and counters of each job,
+        defaults to False
+    :type instrument: bool, optional
+    :return: outcome of each job
+    :rtype: generator of SweepResult
+    """
+    job_runner = functools.partial(run_job, instrument=instrument)
+    if workers == 1:
+        yield from map(job_runner, jobs)
+        return
+    with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+        yield from executor.map(job_runner, jobs, chunksize=chunksize)
+
+
+def summarise(results):
+    """Summarises the outcomes of a sweep.
+
+    :param results: outcome of each job
+    :type results: iterable of SweepResult
+    :return: number of jobs, list of failed results and total job time
+    :rtype: tuple
+    """
+    results = list(results)
+    failed = [result for result in results if result.error is not None]
+    return len(results), failed, sum(result.elapsed for result in results)
+
+
+def aggregate_stats(results):
+    """Adds up the instrumentation summaries of the jobs of a sweep run with
+    instrument=True.
+
+    :param results: outcome of each job
+    :type results: iterable of SweepResult
+    :return: summary of the spans and counters of all jobs
+    :rtype: dict
+    """
+    return instrumentation.merge(result.stats for result in results
+                                 if result.stats is not None)
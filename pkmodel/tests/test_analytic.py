@@ -0,0 +1,70 @@
+import unittest
+import numpy as np
+import scipy.integrate
+import pkmodel as pk
+from pkmodel.analytic import linear_response
+
+
+class AnalyticTest(unittest.TestCase):
+    """
+    Tests the closed form solution in :mod:`analytic`.
+    """
+    def test_single_compartment(self):
+        """
+        Tests a constant dose into a single compartment against the
+        closed form q(t) = X / k (1 - exp(-k t)).
+        """
+        t_eval = np.linspace(0, 2, 50)
+        y = linear_response([[-0.5]], [1.], [0., 2.], [3.], t_eval)
+        np.testing.assert_allclose(y[0], 3. / 0.5
+                                   * (1 - np.exp(-0.5 * t_eval)))
+
+    def test_defective_matrix(self):
+        """
+        Tests the matrix exponential fallback for a matrix that is not
+        diagonalisable, against the numerical solution.
+        """
+        A = np.array([[-1., 0.], [1., -1.]])
+        b = np.array([1., 0.])
+        bounds = np.array([0., 0.3, 1.])
+        inputs = np.array([2., 0.])
+        t_eval = np.linspace(0, 1, 20)
+        y = linear_response(A, b, bounds, inputs, t_eval)
+        sol = scipy.integrate.solve_ivp(
+            lambda t, q: A @ q + b * (2. if t < 0.3 else 0.), [0., 1.],
+            [0., 0.], t_eval=t_eval, rtol=1e-10, atol=1e-12, max_step=0.01)
+        np.testing.assert_allclose(y, sol.y, atol=1e-8)
+
+    def test_models(self):
+        """
+        Tests the analytic solve against the numeric solve for both
+        models and all dose functions.
+        """
+        parameters = {'name': 'test1',
+                      'V_c': 2.0,
+                      'nr_compartments': 2,
+                      'periph_1': (5.0, 3.0),
+                      'periph_2': (1.0, 0.7),
+                      'CL': 0.5,
+                      'X': 6.0,
+                      'k_a': 1.3,
+                      'time': 2
+                      }
+        for model_class in pk.models.IntravenousModels, \
+                pk.models.SubcutaneousModels:
+            for dose_mode in 'normal', 'pulse', 'zero':
+                model = model_class(dict(parameters, dose_mode=dose_mode))
+                y = model.solve(solver='analytic').get_solution[0]
+                t_eval = np.linspace(0, model.time, 1000)
+                bounds, inputs = model.dose_segments()
+                sol = scipy.integrate.solve_ivp(
+                    model.rhs, [0, model.time], np.zeros(y.shape[0]),
+                    t_eval=t_eval, rtol=1e-10, atol=1e-10,
+                    max_step=np.min(np.diff(bounds)) / 4)
+                np.testing.assert_allclose(y, sol.y, atol=1e-5)
+        with self.assertRaises(ValueError):
+            model.solve(solver='random')
+
+
+if __name__ == '__main__':
+    unittest.main()
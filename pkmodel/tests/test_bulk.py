@@ -0,0 +1,102 @@
+import io
+import json
+import unittest
+import numpy as np
+from pkmodel import bulk, config, Protocol
+
+
+class BulkTest(unittest.TestCase):
+    """
+    Tests loading many protocols at once in :mod:`bulk`.
+    """
+    def setUp(self):
+        self.records = [
+            {'name': 'iv1', 'CL': 2.0, 'nr_compartments': 2,
+             'periph_1': (3.0, 0.5)},
+            {'name': 'sc1', 'injection_type': 'subcutaneous', 'k_a': 3.0},
+            {'name': 'iv2', 'nr_compartments': 2, 'periph_2': (4.0, 2.0),
+             'X': 2.0},
+            {'name': 'sc2', 'injection_type': 'subcutaneous', 'V_c': 2.0},
+            {'name': 'g1', 'injection_type': 'graph',
+             'compartments': {'central': 1.0, 'tissue': 2.0},
+             'flows': [{'type': 'clearance', 'from': 'central',
+                        'value': 1.0},
+                       {'type': 'exchange', 'from': 'central',
+                        'to': 'tissue', 'value': 0.5}]},
+            {'name': 'g2', 'injection_type': 'graph', 'X': 3.0,
+             'compartments': {'central': 2.0, 'tissue': 1.0},
+             'flows': [{'type': 'clearance', 'from': 'central',
+                        'value': 0.5},
+                       {'type': 'exchange', 'from': 'central',
+                        'to': 'tissue', 'value': 2.0}]},
+        ]
+        self.text = ''.join(json.dumps(record) + '\n'
+                            for record in self.records)
+
+    def test_batches(self):
+        batches = bulk.load_batches(io.StringIO(self.text), 'jsonl')
+        self.assertEqual([batch.names for batch in batches],
+                         [['iv1', 'iv2'], ['sc1', 'sc2'], ['g1', 'g2']])
+        self.assertEqual([batch.positions for batch in batches],
+                         [[0, 2], [1, 3], [4, 5]])
+        # every row matches the model built from the protocol on its own
+        documents = config.read_documents(io.StringIO(self.text), 'jsonl')
+        for batch in batches:
+            for i, position in enumerate(batch.positions):
+                model = Protocol(
+                    parameters=documents[position]).generate_model()
+                self.assertEqual(batch.parameter_names(),
+                                 model.parameter_names())
+                np.testing.assert_array_equal(batch.theta[i],
+                                              model.parameter_vector())
+            amounts = batch.solve(output_grid=11)
+            for expected, model in zip(amounts, batch.models()):
+                np.testing.assert_allclose(
+                    model.solve(solver='analytic',
+                                output_grid=11).get_solution[0], expected,
+                    rtol=1e-10, atol=1e-14)
+        self.assertEqual([model.name for model in bulk.load_models(
+            io.BytesIO(self.text.encode()), 'jsonl')],
+            ['iv1', 'iv2', 'sc1', 'sc2', 'g1', 'g2'])
+
+    def test_structure(self):
+        # defaults given explicitly do not change the structure
+        self.assertEqual(bulk.structure_key({'CL': 2.0}),
+                         bulk.structure_key({'nr_compartments': 1,
+                                             'dose_mode': 'normal'}))
+        self.assertNotEqual(bulk.structure_key({}),
+                            bulk.structure_key({'time': 2}))
+
+    def test_invalid(self):
+        records = [dict(record) for record in self.records[:4]]
+        records[2]['X'] = -1.0
+        with self.assertRaisesRegex(ValueError, 'protocol 2: X'):
+            bulk.group(records)
+        records[2]['X'] = 1
+        with self.assertRaisesRegex(TypeError, 'protocol 2: X'):
+            bulk.group(records)
+        records[2]['X'] = 1.0
+        records[2]['periph_2'] = (4.0,)
+        with self.assertRaisesRegex(ValueError, 'protocol 2: periph_2'):
+            bulk.group(records)
+        with self.assertRaisesRegex(TypeError, 'protocol 1'):
+            bulk.group([{}, []])
+
+    def test_invalid_structure(self):
+        # True == 1 == 1.0, but only the first value is valid
+        for key, valid, invalid in (('nr_compartments', 1, True),
+                                    ('time', 1, True),
+                                    ('dense_output', True, 1),
+                                    ('periph_default', (1.0, 1.0),
+                                     (1, 1.0))):
+            records = [{'name': 'a', key: valid}, {'name': 'b', key: invalid}]
+            self.assertNotEqual(bulk.structure_key(records[0]),
+                                bulk.structure_key(records[1]))
+            with self.assertRaisesRegex(TypeError, f'protocol 1: .*{key}'):
+                bulk.group(records)
+            with self.assertRaises(TypeError):
+                config.validate(config.fill_defaults(dict(records[1])))
+
+
+if __name__ == '__main__':
+    unittest.main()
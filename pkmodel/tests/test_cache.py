@@ -0,0 +1,92 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import pkmodel as pk
+from pkmodel import cache
+
+
+class CacheTest(unittest.TestCase):
+    """
+    Tests the solution cache in :mod:`cache`.
+    """
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.protocol = pk.Protocol('pkmodel/tests/test_config_file.txt')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_solution_key(self):
+        params = self.protocol.params
+        key = cache.solution_key(params, solver='numeric')
+        # output only parameters and unused compartments are ignored
+        same = dict(params, name='other', run_mode='test',
+                    periph_3=(9.0, 9.0), CL=params['CL'] * (1 + 1e-14))
+        self.assertEqual(cache.solution_key(same, solver='numeric'), key)
+        self.assertEqual(cache.solution_key(dict(params, X=6),
+                                            solver='numeric'), key)
+        self.assertNotEqual(cache.solution_key(params, solver='analytic'),
+                            key)
+        self.assertNotEqual(cache.solution_key(dict(params, X=6.1),
+                                               solver='numeric'), key)
+        self.assertNotEqual(cache.solution_key(
+            dict(params, periph_2=(3.0, 2.0)), solver='numeric'), key)
+
+    def test_solve_cached(self):
+        solutions = cache.SolutionCache()
+        model = self.protocol.generate_model()
+        first = model.solve(cache=solutions)
+        self.assertEqual((solutions.hits, solutions.misses), (0, 1))
+        second = self.protocol.generate_model().solve(cache=solutions)
+        self.assertEqual((solutions.hits, solutions.misses), (1, 1))
+        np.testing.assert_array_equal(second.get_solution[0],
+                                      first.get_solution[0])
+        # discarding the trajectory of one solution leaves the cache intact
+        second.discard_trajectory()
+        third = model.solve(cache=solutions, metrics_only=True)
+        self.assertTrue(third.trajectory_discarded)
+        self.assertIsNotNone(model.solve(cache=solutions).get_solution[0])
+        with self.assertRaises(ValueError):
+            model.solve(cache='memory')
+
+    def test_lru_eviction(self):
+        result = self.protocol.generate_model().analytic_solution(
+            np.linspace(0, 1, 100))
+        nbytes = cache.result_nbytes(result)
+        solutions = cache.SolutionCache(max_bytes=2 * nbytes)
+        solutions.put('a', result)
+        solutions.put('b', result)
+        self.assertIsNotNone(solutions.get('a'))
+        solutions.put('c', result)
+        self.assertEqual(len(solutions), 2)
+        self.assertEqual(solutions.nbytes, 2 * nbytes)
+        self.assertNotIn('b', solutions)
+        self.assertIn('a', solutions)
+        self.assertFalse(solutions.get('c').y.flags.writeable)
+
+    def test_disk_tier(self):
+        cache_dir = os.path.join(self.tmp_dir, 'cache')
+        model = self.protocol.generate_model()
+        first = model.solve(cache=cache.SolutionCache(cache_dir=cache_dir))
+        self.assertEqual(len(os.listdir(cache_dir)), 1)
+        # a new cache, as in a later run, reads the solution from disk
+        solutions = cache.SolutionCache(cache_dir=cache_dir)
+        second = model.solve(cache=solutions)
+        self.assertEqual(solutions.hits, 1)
+        np.testing.assert_array_equal(second.get_solution[0],
+                                      first.get_solution[0])
+        # sensitivities are solved for separately, and cached with the
+        # solution
+        first = model.solve(cache=cache.SolutionCache(cache_dir=cache_dir),
+                            sensitivities=True)
+        self.assertEqual(len(os.listdir(cache_dir)), 2)
+        second = model.solve(cache=solutions, sensitivities=True)
+        self.assertEqual(solutions.hits, 2)
+        np.testing.assert_array_equal(second.sensitivities['CL'],
+                                      first.sensitivities['CL'])
+
+
+if __name__ == '__main__':
+    unittest.main()
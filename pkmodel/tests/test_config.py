@@ -0,0 +1,111 @@
+import importlib.util
+import json
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+from pkmodel import config, sweep, Protocol
+
+HAS_YAML = importlib.util.find_spec('yaml') is not None
+
+
+class ConfigTest(unittest.TestCase):
+    """
+    Tests reading and validating config files in :mod:`config`.
+    """
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp_dir = tempfile.mkdtemp()
+        os.chdir(self.tmp_dir)
+        self.expected = Protocol(parameters={
+            'name': 'a', 'injection_type': 'subcutaneous',
+            'nr_compartments': 2, 'periph_1': (5.0, 3.0),
+            'CL': 2.0}).params
+        documents = {
+            'a.json': json.dumps({'name': 'a',
+                                  'injection_type': 'subcutaneous',
+                                  'nr_compartments': 2,
+                                  'periph_1': [5.0, 3.0], 'CL': 2.0}),
+            'b.jsonl': '{"name": "b1"}\n{"name": "b2", "X": 2.0}\n',
+            'c.toml': '[[protocols]]\nname = "c1"\n\n'
+                      '[[protocols]]\nname = "c2"\nperiph_1 = [2.0, 1.0]\n',
+            'd.yaml': 'name: d1\n---\nname: d2\ninjection_type: graph\n'
+                      'compartments: {central: 1.0}\n'
+                      'flows: [{type: clearance, from: central, '
+                      'value: 1.0}]\n',
+            'e.txt': "[{'name': 'e1'}, {'name': 'e2', 'time': 2}]",
+            'f.toml': 'name = "f"\n',
+        }
+        for path, text in documents.items():
+            with open(path, 'w') as file:
+                file.write(text)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmp_dir)
+
+    def test_formats(self):
+        self.assertEqual(Protocol('a.json').params, self.expected)
+        self.assertEqual(Protocol('f.toml').params['name'], 'f')
+        names = {path: [parameters['name']
+                        for parameters in config.load(path)]
+                 for path in ('b.jsonl', 'c.toml', 'e.txt')}
+        self.assertEqual(names, {'b.jsonl': ['b1', 'b2'],
+                                 'c.toml': ['c1', 'c2'],
+                                 'e.txt': ['e1', 'e2']})
+        self.assertEqual(config.load('c.toml')[1]['periph_1'], (2.0, 1.0))
+        with self.assertRaises(ValueError):
+            Protocol('b.jsonl')
+        # the YAML file is passed on as a path without PyYAML
+        jobs = list(sweep.config_jobs(sorted(os.listdir('.'))))
+        self.assertEqual(len(jobs), 10 if HAS_YAML else 9)
+
+    @unittest.skipUnless(HAS_YAML, 'PyYAML is not installed')
+    def test_yaml(self):
+        self.assertEqual([parameters['name']
+                          for parameters in config.load('d.yaml')],
+                         ['d1', 'd2'])
+        self.assertEqual(Protocol(parameters=config.load('d.yaml')[1])
+                         .generate_model().compartments, ['central'])
+
+    def test_parameters(self):
+        parameters = config.load('a.json')[0]
+        self.assertEqual(parameters, self.expected)
+        self.assertEqual(parameters.k_a, 1.0)
+        with self.assertRaises(TypeError):
+            parameters['CL'] = 1.0
+        with self.assertRaises(AttributeError):
+            parameters.CL = 1.0
+        self.assertEqual(pickle.loads(pickle.dumps(parameters)), parameters)
+
+    def test_validate(self):
+        bad_params = [
+            ({'periph_1': (1.0, 'test')}, TypeError),
+            ({'periph_1': (1.0, -1.0)}, ValueError),
+            ({'periph_1': (1.0,)}, ValueError),
+            ({'V_c': 'test'}, TypeError),
+            ({'k_a': -1.0}, ValueError),
+            ({'injection_type': 'random'}, ValueError),
+            ({'dose_mode': 'random'}, ValueError),
+            ({'run_mode': 'random'}, ValueError),
+            ({'solver': 'random'}, ValueError),
+            ({'dense_output': 1}, TypeError),
+            ({'output_format': ['csv', 'random']}, ValueError),
+            ({'output_grid': 'random'}, TypeError),
+            ({'nr_compartments': True}, TypeError),
+            ({'plot': 1}, ValueError),
+            ({'sparse': 0}, ValueError),
+            ({'time': 10}, ValueError),
+            ({'injection_type': 'graph'}, TypeError),
+        ]
+        for params, error in bad_params:
+            with self.assertRaises(error):
+                config.validate(dict(self.expected, **params))
+        del self.expected['X']
+        with self.assertRaises(ValueError):
+            config.validate(self.expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
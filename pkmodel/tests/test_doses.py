@@ -1,6 +1,7 @@
 import unittest
 from pkmodel.dose import (select_dose, unit_fn_dose,
-                          pulse_series_dose, zero_dose)
+                          pulse_series_dose, zero_dose,
+                          switch_times, dose_segments)
 import numpy as np
 
 
@@ -46,5 +47,20 @@ class DosesTest(unittest.TestCase):
                                                pulse_width=pulse_width,
                                                interval=interval))
 
+    def test_switch_times(self):
+        np.testing.assert_allclose(switch_times('pulse', 0.5,
+                                                pulse_width=0.1,
+                                                interval=0.2),
+                                   [0.1, 0.3, 0.4])
+        for key in 'normal', 'zero':
+            self.assertEqual(len(switch_times(key, 1.)), 0)
+        with self.assertRaises(Exception):
+            switch_times('false_key', 1.)
 
-
+    def test_dose_segments(self):
+        bounds, values = dose_segments('pulse', 2., 0.3)
+        np.testing.assert_allclose(bounds, [0., 0.1, 0.2, 0.3])
+        np.testing.assert_array_equal(values, [2., 0., 2.])
+        bounds, values = dose_segments('normal', 2., 0.3)
+        np.testing.assert_array_equal(bounds, [0., 0.3])
+        np.testing.assert_array_equal(values, [2.])
@@ -0,0 +1,83 @@
+import unittest
+import numpy as np
+import scipy.optimize
+import pkmodel as pk
+from pkmodel import fitting
+
+
+class FittingTest(unittest.TestCase):
+    """
+    Tests the parameter estimation in :mod:`fitting`.
+    """
+    def setUp(self):
+        self.parameters = {'name': 'fit',
+                           'V_c': 2.0,
+                           'nr_compartments': 1,
+                           'periph_1': (1.0, 1.5),
+                           'CL': 0.5,
+                           'X': 1.0,
+                           'k_a': 2.0,
+                           'dose_mode': 'normal',
+                           'time': 5,
+                           'output_grid': 101
+                           }
+        self.true_model = pk.models.SubcutaneousModels(self.parameters)
+        self.times = np.linspace(0.25, 5, 20)
+        solution = self.true_model.solve(output_grid=self.times,
+                                         solver='analytic')
+        self.concentrations = solution.get_solution[0][1] / 2.0
+        # initial guess away from the true parameters
+        self.model = pk.models.SubcutaneousModels(dict(
+            self.parameters, V_c=3.0, CL=1.0, k_a=1.0, periph_1=(2.0, 1.0)))
+
+    def test_jacobian(self):
+        for compartment in None, 2:
+            objective = fitting.Objective(self.model, self.times,
+                                          self.concentrations,
+                                          compartment=compartment)
+            self.assertEqual(objective.parameters,
+                             ['CL', 'V_c', 'k_a', 'V_p1', 'Q_p1'])
+            phi = np.log(objective.theta0[objective.indices])
+            expected = scipy.optimize.approx_fprime(
+                phi, objective.residuals, 1e-7)
+            np.testing.assert_allclose(objective.jacobian(phi), expected,
+                                       atol=1e-5)
+        with self.assertRaises(ValueError):
+            fitting.Objective(self.model, self.times, self.concentrations,
+                              compartment=0)
+        with self.assertRaises(ValueError):
+            fitting.Objective(self.model, self.times, self.concentrations,
+                              parameters=['CL', 'Q'])
+        with self.assertRaises(ValueError):
+            fitting.Objective(self.model, self.times,
+                              self.concentrations[1:])
+
+    def test_fit(self):
+        model = pk.models.SubcutaneousModels(dict(
+            self.parameters, V_c=3.0, CL=1.0, k_a=1.0))
+        result = fitting.fit(model, self.times, self.concentrations,
+                             parameters=['CL', 'V_c', 'k_a'], xtol=1e-12)
+        self.assertTrue(result.success)
+        self.assertLess(result.cost, 1e-16)
+        for name, value in result.parameters.items():
+            self.assertAlmostEqual(value, self.parameters[name], places=5)
+        # the solution of the best fit keeps the parameters not fitted
+        self.assertEqual(result.solution.get_parameters['periph_1'],
+                         (1.0, 1.5))
+        y, t = result.solution.get_solution
+        self.assertEqual(len(t), 101)
+        np.testing.assert_allclose(
+            y, self.true_model.solve().get_solution[0], atol=1e-6)
+
+    def test_multistart(self):
+        result = fitting.fit(self.model, self.times, self.concentrations,
+                             starts=3, seed=1, workers=2)
+        self.assertEqual(len(result.costs), 3)
+        self.assertEqual(result.cost, min(result.costs))
+        y = result.solution.get_solution[0]
+        np.testing.assert_allclose(y[1, -1] / result.parameters['V_c'],
+                                   self.concentrations[-1], rtol=1e-4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,39 @@
+import json
+import subprocess
+import sys
+import unittest
+
+# generous bound on the time to import pkmodel in a fresh interpreter, which
+# is dominated by numpy and scipy; loading matplotlib and pandas as well
+# roughly doubles it
+IMPORT_TIME_LIMIT = 5.0
+
+IMPORT_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import pkmodel
+elapsed = time.perf_counter() - start
+print(json.dumps({'elapsed': elapsed, 'modules': sorted(sys.modules)}))
+"""
+
+
+class ImportTest(unittest.TestCase):
+    """
+    Guards the startup time of ``import pkmodel``.
+    """
+    @classmethod
+    def setUpClass(cls):
+        output = subprocess.run([sys.executable, '-c', IMPORT_SCRIPT],
+                                capture_output=True, text=True, check=True)
+        cls.result = json.loads(output.stdout)
+
+    def test_heavy_modules_not_imported(self):
+        for module in 'matplotlib', 'pandas', 'pkmodel.plotting':
+            self.assertNotIn(module, self.result['modules'])
+
+    def test_import_time(self):
+        self.assertLess(self.result['elapsed'], IMPORT_TIME_LIMIT)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import json
+import os
+import pstats
+import shutil
+import tempfile
+import unittest
+import pkmodel as pk
+from pkmodel import instrumentation, sweep
+
+
+class InstrumentationTest(unittest.TestCase):
+    """
+    Tests the spans, counters and sinks in :mod:`instrumentation`.
+    """
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.config = os.path.abspath('pkmodel/tests/test_config_file.txt')
+        self.tmp_dir = tempfile.mkdtemp()
+        os.chdir(self.tmp_dir)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmp_dir)
+
+    def test_inactive(self):
+        self.assertIsNone(instrumentation.active())
+        with instrumentation.span('nothing'):
+            instrumentation.count(nfev=1)
+        solution = pk.Protocol(self.config).generate_model().solve()
+        stats = solution.stats
+        self.assertGreater(stats['nfev'], 0)
+        self.assertGreater(stats['elapsed'], 0)
+        analytic = pk.Protocol(self.config).generate_model().solve(
+            solver='analytic')
+        self.assertEqual(analytic.stats['nfev'], 0)
+
+    def test_recorder(self):
+        sinks = [instrumentation.JsonLinesSink('trace.jsonl'),
+                 instrumentation.ProfileSink('run.prof')]
+        with instrumentation.Recorder(sinks) as recorder:
+            self.assertIs(instrumentation.active(), recorder)
+            solution = pk.Protocol(self.config).generate_model().solve()
+            solution.output()
+        self.assertIsNone(instrumentation.active())
+        summary = recorder.summary()
+        for name in ('read_config', 'call_all_checks', 'solve', 'plot',
+                     'save_solution', 'save_parameters'):
+            self.assertEqual(summary['spans'][name]['count'], 1)
+        self.assertEqual(summary['counters']['nfev'], solution.stats['nfev'])
+        with open('trace.jsonl') as file:
+            events = [json.loads(line) for line in file]
+        self.assertEqual(len(events), len(summary['spans']) + 1)
+        self.assertEqual(events[0]['name'], 'read_config')
+        self.assertGreater(pstats.Stats('run.prof').total_calls, 0)
+
+    def test_sweep_stats(self):
+        results = list(sweep.run_sweep([self.config, self.config],
+                                       workers=1, instrument=True))
+        stats = sweep.aggregate_stats(results)
+        self.assertEqual(stats['spans']['solve']['count'], 2)
+        self.assertEqual(stats['counters']['nfev'],
+                         sum(result.stats['counters']['nfev']
+                             for result in results))
+        self.assertIn('solve', instrumentation.format_summary(stats))
+        self.assertIsNone(sweep.run_job(self.config).stats)
+
+
+if __name__ == '__main__':
+    unittest.main()
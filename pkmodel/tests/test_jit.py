@@ -0,0 +1,85 @@
+import unittest
+from unittest import mock
+import numpy as np
+import pkmodel as pk
+from pkmodel import _jit
+
+
+class JitTest(unittest.TestCase):
+    """
+    Tests the compiled solver kernels in :mod:`_jit`, which also run
+    uncompiled when numba is not installed.
+    """
+    def setUp(self):
+        self.protocol = pk.Protocol('pkmodel/tests/test_config_file.txt')
+        self.t_eval = np.linspace(0, 1, 101)
+
+    def test_dormand_prince(self):
+        for dose_mode in 'normal', 'pulse':
+            self.protocol.params['dose_mode'] = dose_mode
+            model = self.protocol.generate_model()
+            bounds, inputs = model.dose_segments()
+            y, nfev, status = _jit.dormand_prince(
+                model.rate_matrix, model.dose_vector, bounds, inputs,
+                self.t_eval)
+            # same steps as solve_ivp RK45
+            expected = model.integrate(self.t_eval, 'RK45')
+            self.assertEqual(status, 0)
+            self.assertEqual(nfev, expected.nfev)
+            np.testing.assert_allclose(y, expected.y, atol=1e-9)
+
+    def test_zero_length_segments(self):
+        model = self.protocol.generate_model()
+        A, b = model.rate_matrix, model.dose_vector
+        for bounds, inputs, t_eval in (
+                ([0., 0.], [1.], np.zeros(3)),
+                ([0., 0.5, 0.5, 1.], [1., 2., 0.], self.t_eval)):
+            bounds, inputs = np.array(bounds), np.array(inputs)
+            y, nfev, status = _jit.dormand_prince(A, b, bounds, inputs,
+                                                  t_eval)
+            expected = pk.models.integrate_piecewise(A, b, bounds, inputs,
+                                                     t_eval, 'RK45')
+            self.assertEqual(status, 0)
+            self.assertEqual(nfev, expected.nfev)
+            np.testing.assert_allclose(y, expected.y, atol=1e-9)
+
+    def test_solve_jit(self):
+        model = self.protocol.generate_model()
+        expected = model.solve(solver='numeric', output_grid=self.t_eval)
+        patches = {'HAS_NUMBA': True}
+        if not _jit.HAS_NUMBA:
+            # runs the kernel uncompiled
+            patches['compile_kernels'] = lambda: _jit.dormand_prince
+        with mock.patch.multiple(_jit, **patches):
+            solution = model.solve(solver='jit', output_grid=self.t_eval)
+        self.assertEqual(solution.stats['nfev'], expected.stats['nfev'])
+        np.testing.assert_allclose(solution.get_solution[0],
+                                   expected.get_solution[0], atol=1e-9)
+        # falls back to solve_ivp where the kernel does not apply
+        dense = model.solve(solver='jit', dense_output=True)
+        self.assertEqual(dense(0.5).shape, (4,))
+        with self.assertRaises(ValueError):
+            model.solve(solver='random')
+
+    @unittest.skipUnless(_jit.HAS_NUMBA, 'numba is not installed')
+    def test_compile_kernels(self):
+        kernel = _jit.compile_kernels()
+        self.assertIs(_jit.compile_kernels(), kernel)
+        # the Python kernels are left uncompiled
+        self.assertIsNot(_jit.dormand_prince, kernel)
+        self.assertIs(kernel.py_func.__code__, _jit.dormand_prince.__code__)
+        model = self.protocol.generate_model()
+        y, nfev, status = kernel(model.rate_matrix, model.dose_vector,
+                                 *model.dose_segments(), self.t_eval)
+        expected = model.integrate(self.t_eval, 'RK45')
+        self.assertEqual(nfev, expected.nfev)
+        np.testing.assert_allclose(y, expected.y, atol=1e-9)
+        # a zero-length interval takes no step
+        y, nfev, status = kernel(model.rate_matrix, model.dose_vector,
+                                 np.zeros(2), np.ones(1), np.zeros(3))
+        self.assertEqual((nfev, status), (0, 0))
+        np.testing.assert_array_equal(y, np.zeros((4, 3)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+import unittest
+import numpy as np
+from pkmodel.metrics import METRICS, compute_metrics
+
+
+class MetricsTest(unittest.TestCase):
+    """
+    Tests the summary statistics in :mod:`metrics`.
+    """
+    def test_exponential_decay(self):
+        """
+        Tests the statistics of y = exp(-k t) against their closed forms.
+        """
+        k = 2.
+        t = np.linspace(0, 3, 3001)
+        y = np.exp(-k * t)
+        metrics = compute_metrics(y, t, threshold=0.5)
+        self.assertEqual(tuple(metrics), METRICS)
+        self.assertAlmostEqual(metrics['AUC'], (1 - np.exp(-k * 3)) / k, 5)
+        self.assertEqual(metrics['Cmax'], 1.)
+        self.assertEqual(metrics['Tmax'], 0.)
+        self.assertAlmostEqual(metrics['Cmin'], np.exp(-k * 3))
+        self.assertAlmostEqual(metrics['half_life'], np.log(2) / k)
+        self.assertAlmostEqual(metrics['time_above'], np.log(2) / k, 6)
+
+    def test_stack(self):
+        """
+        Tests statistics of a stack of solutions, including ones without a
+        terminal decline.
+        """
+        t = np.linspace(0, 1, 11)
+        y = np.stack([np.stack([t, 1 - t]), np.stack([t ** 2, 0 * t])])
+        metrics = compute_metrics(y, t)
+        for key in METRICS:
+            self.assertEqual(metrics[key].shape, (2, 2))
+        np.testing.assert_allclose(metrics['AUC'], [[0.5, 0.5], [0.335, 0.]])
+        np.testing.assert_array_equal(metrics['Tmax'], [[1., 0.], [1., 0.]])
+        self.assertTrue(np.isnan(metrics['half_life'][0, 0]))
+        self.assertTrue(np.isnan(metrics['half_life'][1, 1]))
+        self.assertTrue(np.all(np.isnan(metrics['time_above'])))
+        np.testing.assert_allclose(
+            compute_metrics(y, t, threshold=0.25)['time_above'],
+            [[0.75, 0.75], [0.5, 0.]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,6 @@
 import unittest
+import numpy as np
+import scipy.sparse
 import pkmodel as pk
 from pkmodel.AbstractModel import AbstractModel
 
@@ -59,6 +61,44 @@ class ModelTest(unittest.TestCase):
             model = pk.models.Model(parameters[i])
             self.assertEqual(model.parameters, expected_model[i])
 
+    def test_frozen_parameters(self):
+        """
+        Tests the models share immutable parameters, with the peripheral
+        compartments packed into an array.
+        """
+        parameters = {'name': 'test1',
+                      'V_c': 1.0,
+                      'nr_compartments': 2,
+                      'periph_1': (5.0, 3.0),
+                      'periph_2': (1.0, 4.7),
+                      'CL': 5.0,
+                      'X': 6.0,
+                      'k_a': 2.0,
+                      'dose_mode': 'normal',
+                      'solver': 'analytic',
+                      'time': 1
+                      }
+        model = pk.models.SubcutaneousModels(parameters)
+        self.assertEqual(model.parameters, parameters)
+        self.assertEqual(model.parameters.to_dict(), parameters)
+        np.testing.assert_array_equal(model.periph, [[5.0, 3.0], [1.0, 4.7]])
+        self.assertEqual((model.k_a, model.parameters.solver),
+                         (2.0, 'analytic'))
+        with self.assertRaises(ValueError):
+            model.periph[0, 0] = 1.0
+        with self.assertRaises(AttributeError):
+            model.CL = 1.0
+        with self.assertRaises(AttributeError):
+            model.volume = 1.0
+        changed = model.parameters.replace(periph_2=(2.0, 1.0))
+        self.assertEqual(changed['periph_2'], (2.0, 1.0))
+        self.assertEqual(model.parameters['periph_2'], (1.0, 4.7))
+        # protocols freeze their parameters into the model
+        protocol = pk.Protocol(parameters=parameters)
+        model = protocol.generate_model()
+        protocol.params['X'] = 1.0
+        self.assertEqual(model.X, 6.0)
+
     def test_generate_model(self):
         """
         Tests generate_model for 3 cases
@@ -80,6 +120,445 @@ class ModelTest(unittest.TestCase):
             test = model.generate_transition(*test_array[i])
             self.assertEqual(test, expected_transition[i])
 
+    def test_rhs_matches_transitions(self):
+        """
+        Tests the matrix form rhs against the per-compartment transitions.
+        """
+        parameters = {'name': 'test1',
+                      'V_c': 2.0,
+                      'nr_compartments': 3,
+                      'periph_1': (5.0, 3.0),
+                      'periph_2': (1.0, 4.7),
+                      'periph_3': (6.0, 2.4),
+                      'CL': 5.0,
+                      'X': 6.0,
+                      'k_a': 1.3,
+                      'dose_mode': 'normal',
+                      'time': 1
+                      }
+        for model_class in pk.models.IntravenousModels, \
+                pk.models.SubcutaneousModels:
+            model = model_class(parameters)
+            c = model.base_compartments - 1
+            y = np.random.uniform(0, 10, model.rate_matrix.shape[0])
+            transitions = [model.generate_transition(
+                parameters[f'periph_{i}'], y[c], y[c + i])
+                for i in range(1, 4)]
+            expected = np.zeros_like(y)
+            expected[c] = (-y[c] / (model.V_c * model.CL)
+                           - sum(transitions))
+            expected[c + 1:] = transitions
+            if c:
+                expected[0] = -model.k_a * y[0]
+                expected[c] += model.k_a * y[0]
+            expected[0] += model.X
+            np.testing.assert_allclose(model.rhs(0.5, y), expected)
+
+    def test_method_selection(self):
+        """
+        Tests stiff models select an implicit method with the Jacobian.
+        """
+        parameters = {'name': 'test1',
+                      'V_c': 1.0,
+                      'nr_compartments': 1,
+                      'periph_1': (1.0, 1.0),
+                      'CL': 1.0,
+                      'X': 1.0,
+                      'dose_mode': 'normal',
+                      'time': 1
+                      }
+        model = pk.models.IntravenousModels(parameters)
+        np.testing.assert_array_equal(model.jacobian, model.rate_matrix)
+        self.assertEqual(model.select_method(), 'RK45')
+        self.assertEqual(model.select_method('Radau'), 'Radau')
+
+        stiff_model = pk.models.IntravenousModels(
+            dict(parameters, periph_1=(1.0, 1e4)))
+        self.assertGreater(stiff_model.stiffness_ratio(),
+                           pk.models.STIFFNESS_THRESHOLD)
+        self.assertEqual(stiff_model.select_method(), 'BDF')
+        y_auto = stiff_model.solve().get_solution[0]
+        for method in 'RK45', 'Radau', 'LSODA':
+            y = stiff_model.solve(method=method).get_solution[0]
+            np.testing.assert_allclose(y, y_auto, rtol=1e-2, atol=1e-3)
+
+    def test_solve_batch(self):
+        """
+        Tests batch solves against solving each parameter set separately.
+        """
+        parameters = {'name': 'test1',
+                      'V_c': 1.0,
+                      'nr_compartments': 2,
+                      'periph_1': (1.0, 1.0),
+                      'periph_2': (2.0, 0.5),
+                      'CL': 1.0,
+                      'X': 1.0,
+                      'k_a': 1.0,
+                      'dose_mode': 'pulse',
+                      'time': 1
+                      }
+        for model_class in pk.models.IntravenousModels, \
+                pk.models.SubcutaneousModels:
+            model = model_class(parameters)
+            names = model.parameter_names()
+            self.assertEqual(names[-4:], ['V_p1', 'Q_p1', 'V_p2', 'Q_p2'])
+            np.testing.assert_array_equal(
+                model.parameter_vector(),
+                [parameters[name] for name in names[:-4]] + [1, 1, 2, .5])
+            theta = np.random.uniform(0.5, 2., (5, len(names)))
+            y = model.solve_batch(theta)
+            self.assertEqual(y.shape, (5, model.rate_matrix.shape[0], 1000))
+            for i in range(5):
+                member = dict(parameters, **dict(zip(names[:-4], theta[i])))
+                member['periph_1'] = tuple(theta[i, -4:-2])
+                member['periph_2'] = tuple(theta[i, -2:])
+                expected = model_class(member).solve(solver='analytic')
+                np.testing.assert_allclose(y[i], expected.get_solution[0],
+                                           atol=1e-12)
+            np.testing.assert_allclose(
+                model.solve_batch(theta, solver='numeric'), y, atol=1e-3)
+        with self.assertRaises(ValueError):
+            model.solve_batch(theta[:, 1:])
+
+    def test_pulse_integration(self):
+        """
+        Tests the numeric solve integrates pulse doses piecewise, matching
+        the analytic solution.
+        """
+        parameters = {'name': 'test1',
+                      'V_c': 2.0,
+                      'nr_compartments': 1,
+                      'periph_1': (5.0, 3.0),
+                      'CL': 0.5,
+                      'X': 6.0,
+                      'dose_mode': 'pulse',
+                      'time': 5
+                      }
+        model = pk.models.IntravenousModels(parameters)
+        bounds, inputs = model.dose_segments()
+        self.assertEqual(len(bounds), 51)
+        np.testing.assert_array_equal(inputs, [6., 0.] * 25)
+        t_eval = np.linspace(0, model.time, 1000)
+        for method in 'RK45', 'BDF', 'LSODA':
+            sol = model.integrate(t_eval, method)
+            self.assertTrue(sol.success)
+            self.assertGreater(sol.nfev, 0)
+            np.testing.assert_allclose(
+                sol.y, model.analytic_solution(t_eval).y, rtol=1e-2)
+
+    def test_output_grid(self):
+        """
+        Tests the output grid options and dense output of solve.
+        """
+        parameters = {'name': 'test1',
+                      'V_c': 2.0,
+                      'nr_compartments': 1,
+                      'periph_1': (5.0, 3.0),
+                      'CL': 0.5,
+                      'X': 6.0,
+                      'dose_mode': 'pulse',
+                      'time': 1
+                      }
+        model = pk.models.IntravenousModels(parameters)
+        self.assertEqual(len(model.output_times()), 1000)
+        self.assertEqual(len(model.output_times(10)), 10)
+        self.assertIsNone(model.output_times('steps'))
+        for grid in 'random', [0.5, 0.2], [0.5, 2.]:
+            with self.assertRaises(ValueError):
+                model.output_times(grid)
+
+        exact = model.solve(solver='analytic', dense_output=True)
+        for solver in 'numeric', 'analytic':
+            solution = model.solve(solver=solver, output_grid=[0.1, 0.55])
+            y, t = solution.get_solution
+            np.testing.assert_array_equal(t, [0.1, 0.55])
+            np.testing.assert_allclose(y, exact([0.1, 0.55]), rtol=1e-2)
+            with self.assertRaises(ValueError):
+                solution(0.5)
+
+            solution = model.solve(solver=solver, output_grid='steps',
+                                   dense_output=True)
+            y, t = solution.get_solution
+            self.assertEqual(t[0], 0.)
+            self.assertEqual(t[-1], 1.)
+            self.assertTrue(np.all(np.diff(t) > 0))
+            np.testing.assert_allclose(y, exact(t), rtol=1e-2, atol=1e-6)
+            np.testing.assert_allclose(solution(0.55), exact(0.55),
+                                       rtol=1e-2)
+        model = pk.models.IntravenousModels(
+            dict(parameters, output_grid=[0., 1.]))
+        self.assertEqual(model.solve_batch([model.parameter_vector()]).shape,
+                         (1, 2, 2))
+        with self.assertRaises(ValueError):
+            model.solve_batch([model.parameter_vector()], output_grid='steps')
+
+    def test_zero_time(self):
+        """
+        Tests solves over a zero-length interval and with no output times.
+        """
+        parameters = {'name': 'test1', 'V_c': 2.0, 'nr_compartments': 1,
+                      'periph_1': (5.0, 3.0), 'CL': 0.5, 'X': 6.0,
+                      'dose_mode': 'normal', 'time': 0}
+        model = pk.models.IntravenousModels(parameters)
+        for solver in 'numeric', 'analytic':
+            y, t = model.solve(solver=solver, output_grid=5).get_solution
+            np.testing.assert_array_equal(t, np.zeros(5))
+            np.testing.assert_array_equal(y, np.zeros((2, 5)))
+            solution = model.solve(solver=solver, output_grid='steps',
+                                   dense_output=True)
+            np.testing.assert_array_equal(solution.get_solution[1][0], 0.)
+            np.testing.assert_array_equal(solution(0.), np.zeros(2))
+
+        model = pk.models.IntravenousModels(dict(parameters, time=1))
+        for solver in 'numeric', 'analytic':
+            y, t = model.solve(solver=solver, output_grid=0).get_solution
+            self.assertEqual((y.shape, t.shape), ((2, 0), (0,)))
+
+    def test_sparse(self):
+        """
+        Tests sparse rate matrices match the dense ones, and large models
+        are stored sparse.
+        """
+        parameters = {'name': 'test1',
+                      'V_c': 2.0,
+                      'nr_compartments': 3,
+                      'periph_1': (1.0, 1.0),
+                      'periph_2': (2.0, 3.0),
+                      'periph_3': (0.5, 1e4),
+                      'CL': 1.0,
+                      'X': 1.0,
+                      'k_a': 2.0,
+                      'dose_mode': 'pulse',
+                      'time': 1
+                      }
+        t_eval = np.linspace(0, 1, 11)
+        for injection_type in 'intravenous', 'subcutaneous':
+            parameters['injection_type'] = injection_type
+            dense = pk.Protocol(parameters=dict(
+                parameters, sparse=False)).generate_model()
+            model = pk.Protocol(parameters=dict(
+                parameters, sparse=True)).generate_model()
+            self.assertFalse(dense.sparse)
+            np.testing.assert_allclose(model.rate_matrix.toarray(),
+                                       dense.rate_matrix)
+            np.testing.assert_array_equal(model.jac_sparsity.toarray(),
+                                          dense.rate_matrix != 0)
+            self.assertEqual(model.jac_sparsity.nnz,
+                             2 * model.base_compartments - 1 + 3 * 3)
+            self.assertEqual(model.select_method(), 'BDF')
+            for solver in 'numeric', 'analytic':
+                np.testing.assert_allclose(
+                    model.solve(solver=solver,
+                                output_grid=t_eval).get_solution[0],
+                    dense.solve(solver=solver,
+                                output_grid=t_eval).get_solution[0],
+                    rtol=1e-6, atol=1e-9)
+
+        n = pk.models.SPARSE_THRESHOLD
+        parameters.update({f'periph_{i}': (1.0, 1.0) for i in range(1, n)},
+                          nr_compartments=n - 1)
+        self.assertFalse(pk.models.IntravenousModels(
+            dict(parameters, nr_compartments=n - 2)).sparse)
+        model = pk.models.IntravenousModels(parameters)
+        self.assertTrue(model.sparse)
+        self.assertEqual(model.rate_matrix.nnz, 1 + 3 * (n - 1))
+
+    def test_graph_model(self):
+        """
+        Tests graph models reproduce the mammillary models, and catenary
+        chains of compartments.
+        """
+        parameters = {'name': 'test1',
+                      'V_c': 2.0,
+                      'nr_compartments': 2,
+                      'periph_1': (1.0, 1.5),
+                      'periph_2': (2.0, 3.0),
+                      'CL': 1.5,
+                      'X': 1.0,
+                      'k_a': 2.0,
+                      'dose_mode': 'pulse',
+                      'time': 1
+                      }
+        flows = [{'type': 'clearance', 'from': 'central', 'value': 1.5},
+                 {'type': 'exchange', 'from': 'central', 'to': 'p1',
+                  'value': 1.5},
+                 {'type': 'exchange', 'from': 'central', 'to': 'p2',
+                  'value': 3.0}]
+        intravenous = dict(parameters, flows=flows, compartments={
+            'central': 2.0, 'p1': 1.0, 'p2': 2.0})
+        subcutaneous = dict(parameters, dose_compartment='depot', flows=flows
+                            + [{'type': 'absorption', 'from': 'depot',
+                                'to': 'central', 'value': 2.0}],
+                            compartments={'depot': 1.0, 'central': 2.0,
+                                          'p1': 1.0, 'p2': 2.0})
+        for model_class, graph in ((pk.models.IntravenousModels, intravenous),
+                                   (pk.models.SubcutaneousModels,
+                                    subcutaneous)):
+            model = model_class(parameters)
+            for sparse in False, True:
+                graph_model = pk.models.GraphModel(dict(graph, sparse=sparse))
+                rate_matrix = graph_model.rate_matrix
+                if sparse:
+                    rate_matrix = rate_matrix.toarray()
+                np.testing.assert_allclose(rate_matrix, model.rate_matrix)
+                np.testing.assert_array_equal(graph_model.dose_vector,
+                                              model.dose_vector)
+            np.testing.assert_allclose(graph_model.solve().get_solution[0],
+                                       model.solve().get_solution[0])
+
+        # catenary chain of compartments, cleared from the last one
+        catenary = pk.models.GraphModel(dict(parameters, compartments={
+            'a': 1.0, 'b': 1.0, 'c': 1.0}, flows=[
+            {'type': 'absorption', 'from': 'a', 'to': 'b', 'value': 1.0},
+            {'type': 'absorption', 'from': 'b', 'to': 'c', 'value': 2.0},
+            {'type': 'clearance', 'from': 'c', 'value': 0.5}]))
+        self.assertEqual(catenary.parameter_names(),
+                         ['X', 'V_a', 'V_b', 'V_c', 'k_a_b', 'k_b_c',
+                          'CL_c'])
+        np.testing.assert_allclose(catenary.rate_matrix, [[-1., 0., 0.],
+                                                          [1., -2., 0.],
+                                                          [0., 2., -2.]])
+        theta = catenary.parameter_vector() * np.random.uniform(
+            0.5, 2., (3, 7))
+        y = catenary.solve_batch(theta)
+        for i in range(3):
+            expected = pk.models.GraphModel(dict(
+                catenary.parameters, X=theta[i, 0],
+                compartments=dict(zip('abc', theta[i, 1:4])),
+                flows=[dict(flow, value=value) for flow, value in
+                       zip(catenary.flows, theta[i, 4:])]))
+            np.testing.assert_allclose(
+                y[i], expected.solve(solver='analytic').get_solution[0],
+                atol=1e-12)
+        with self.assertRaises(ValueError):
+            pk.models.GraphModel(dict(catenary.parameters, flows=[
+                {'type': 'leak', 'from': 'a', 'value': 1.0}]))
+        with self.assertRaises(ValueError):
+            pk.models.GraphModel(dict(catenary.parameters,
+                                      dose_compartment='d'))
+
+        # the graph is frozen with the parameters, and hashed alike
+        frozen = graph_model.parameters
+        self.assertEqual(frozen, dict(subcutaneous, sparse=True))
+        self.assertEqual(pk.cache.solution_key(frozen),
+                         pk.cache.solution_key(dict(subcutaneous,
+                                                    sparse=True)))
+        self.assertEqual(frozen.to_dict()['flows'][0], flows[0])
+        with self.assertRaises(TypeError):
+            frozen['compartments']['depot'] = 2.0
+        with self.assertRaises(TypeError):
+            frozen['flows'][0]['value'] = 2.0
+        with self.assertRaises(AttributeError):
+            frozen['flows'].append(flows[0])
+
+    def test_sensitivities(self):
+        """
+        Tests the forward sensitivities against central differences of the
+        batch solutions.
+        """
+        parameters = {'name': 'test1',
+                      'V_c': 2.0,
+                      'nr_compartments': 2,
+                      'periph_1': (1.0, 1.5),
+                      'periph_2': (2.0, 3.0),
+                      'CL': 1.5,
+                      'X': 1.0,
+                      'k_a': 2.0,
+                      'dose_mode': 'pulse',
+                      'time': 1
+                      }
+        graph = dict(parameters, flows=[
+            {'type': 'absorption', 'from': 'depot', 'to': 'central',
+             'value': 2.0},
+            {'type': 'exchange', 'from': 'central', 'to': 'liver',
+             'value': 1.5},
+            {'type': 'clearance', 'from': 'liver', 'value': 0.5}],
+            compartments={'depot': 1.0, 'central': 2.0, 'liver': 1.5})
+        models = [pk.models.IntravenousModels(parameters),
+                  pk.models.SubcutaneousModels(parameters),
+                  pk.models.SubcutaneousModels(dict(parameters, sparse=True)),
+                  pk.models.GraphModel(graph)]
+        t_eval = np.linspace(0, 1, 51)
+        h = 1e-6
+        for model in models:
+            theta = model.parameter_vector()
+            step = h * np.diag(theta)
+            # closed form derivatives of the rate matrix
+            scale = 2 * h * theta[:, None, None]
+            dA = (model.rate_matrices(theta + step)
+                  - model.rate_matrices(theta - step)) / scale
+            np.testing.assert_allclose(model.rate_matrix_derivatives(), dA,
+                                       atol=1e-6)
+            dy = (model.solve_batch(theta + step, output_grid=t_eval)
+                  - model.solve_batch(theta - step,
+                                      output_grid=t_eval)) / scale
+            for solver, atol in ('analytic', 1e-6), ('numeric', 1e-3):
+                solution = model.solve(solver=solver, output_grid=t_eval,
+                                       sensitivities=True)
+                np.testing.assert_allclose(
+                    solution.get_solution[0],
+                    model.solve(solver=solver,
+                                output_grid=t_eval).get_solution[0],
+                    atol=atol)
+                sensitivities = solution.sensitivities
+                self.assertEqual(list(sensitivities),
+                                 model.parameter_names())
+                np.testing.assert_allclose(
+                    np.array(list(sensitivities.values())), dy, atol=atol)
+
+        model = models[1]
+        solution = model.solve(solver='analytic', output_grid=t_eval,
+                               sensitivities=True, dense_output=True)
+        np.testing.assert_allclose(solution(t_eval[10]),
+                                   solution.get_solution[0][:, 10])
+        auc = solution.metrics()['AUC']
+        derivatives = solution.metric_sensitivities()
+        self.assertEqual(list(derivatives['CL']), ['AUC', 'Cmax', 'Cmin'])
+        # the amounts, and so the AUC, scale linearly with the dose
+        np.testing.assert_allclose(derivatives['X']['AUC'], auc / model.X)
+        solution.discard_trajectory()
+        np.testing.assert_array_equal(
+            solution.metric_sensitivities()['V_c']['Cmax'],
+            derivatives['V_c']['Cmax'])
+        with self.assertRaises(ValueError):
+            solution.sensitivities
+        with self.assertRaises(ValueError):
+            model.solve().sensitivities
+        with self.assertRaises(ValueError):
+            model.solve(solver='random', sensitivities=True)
+
+    def test_sparse_sensitivities(self):
+        """
+        Tests the sensitivity system of sparse models is built sparse, and
+        matches the dense one.
+        """
+        parameters = {'name': 'sparse', 'nr_compartments': 3,
+                      'periph_1': (2.0, 1.0), 'periph_2': (1.0, 3.0),
+                      'periph_3': (0.5, 0.2), 'k_a': 2.0}
+        for injection_type in 'intravenous', 'subcutaneous':
+            parameters['injection_type'] = injection_type
+            dense = pk.Protocol(parameters=dict(
+                parameters, sparse=False)).generate_model()
+            model = pk.Protocol(parameters=dict(
+                parameters, sparse=True)).generate_model()
+            theta = 1.5 * model.parameter_vector()
+            for args in (), (theta, [0, 3, 5]):
+                matrix, vector = model.sensitivity_system(*args)
+                expected = dense.sensitivity_system(*args)
+                self.assertTrue(scipy.sparse.issparse(matrix))
+                np.testing.assert_allclose(matrix.toarray(), expected[0])
+                np.testing.assert_allclose(vector, expected[1])
+        n = 1000
+        parameters = {'name': 'large', 'nr_compartments': n - 1}
+        for i in range(1, n):
+            parameters[f'periph_{i}'] = (1.0 + i / n, 0.5)
+        model = pk.Protocol(parameters=parameters).generate_model()
+        self.assertTrue(model.sparse)
+        matrix, vector = model.sensitivity_system()
+        # P = 2N + 1 blocks of size N, with O(N) entries in each
+        self.assertEqual(matrix.shape, ((2 * n + 2) * n,) * 2)
+        self.assertLess(matrix.nnz, 10 * (2 * n + 2) * n)
+
     def test_abstractmodel(self):
         AbstractModel.__abstractmethods__ = set()
         model = AbstractModel()
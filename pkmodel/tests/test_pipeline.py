@@ -0,0 +1,137 @@
+import collections
+import csv
+import importlib.util
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from pkmodel import pipeline, store, Protocol
+
+
+class PipelineTest(unittest.TestCase):
+    """
+    Tests the streaming pipeline in :mod:`pipeline`.
+    """
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.jobs = [{'name': 'a', 'CL': 2.0, 'output_grid': 50},
+                     {'name': 'b', 'nr_compartments': 2,
+                      'periph_2': (2.0, 1.0), 'output_grid': 50},
+                     {'name': 'c', 'CL': -1.0},
+                     {'name': 'd', 'X': 3.0, 'output_grid': 50}]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def counted(self, jobs, read):
+        for job in jobs:
+            read.append(job['name'])
+            yield job
+
+    def test_lazy(self):
+        read = []
+        results = pipeline.solve(self.counted(self.jobs, read))
+        self.assertEqual(read, [])
+        self.assertEqual(next(results).name, 'a')
+        self.assertEqual(read, ['a'])
+
+        read = []
+        results = pipeline.solve(self.counted(self.jobs, read), workers=2,
+                                 max_pending=2)
+        self.assertEqual(next(results).name, 'a')
+        self.assertEqual(read, ['a', 'b'])
+        self.assertEqual([result.name for result in results],
+                         ['b', 'c', 'd'])
+
+    def test_configs(self):
+        text = ''.join(json.dumps(job) + '\n' for job in self.jobs)
+        names = [result.name for result in pipeline.solve(
+            pipeline.configs([io.StringIO(text)], 'jsonl'))]
+        self.assertEqual(names, ['a', 'b', 'c', 'd'])
+
+    def test_transforms(self):
+        results = list(pipeline.downsample(pipeline.solve(self.jobs), 10))
+        self.assertIsNone(results[2].solution)
+        self.assertIn('CL should be at least 0', results[2].error)
+        y, t = results[1].solution.get_solution
+        expected = Protocol(parameters=self.jobs[1]).generate_model().solve()
+        y_full, t_full = expected.get_solution
+        self.assertEqual(len(t), 10)
+        self.assertEqual((t[0], t[-1]), (t_full[0], t_full[-1]))
+        np.testing.assert_allclose(y[:, -1], y_full[:, -1])
+
+        results = list(pipeline.keep_metrics(pipeline.solve(self.jobs)))
+        self.assertTrue(results[0].solution.trajectory_discarded)
+        np.testing.assert_allclose(results[1].solution.metrics()['AUC'],
+                                   expected.metrics()['AUC'])
+
+    def test_sinks(self):
+        files = os.path.join(self.tmp_dir, 'files')
+        table = os.path.join(self.tmp_dir, 'metrics.csv')
+        count, failed = pipeline.run(
+            pipeline.solve(self.jobs),
+            [pipeline.SolutionFiles(files), pipeline.MetricsTable(table)])
+        self.assertEqual(count, 4)
+        self.assertEqual([result.name for result in failed], ['c'])
+        self.assertEqual(sorted(os.listdir(files)),
+                         ['a_solution.csv', 'b_solution.csv',
+                          'd_solution.csv'])
+        with open(table, newline='') as file:
+            rows = list(csv.DictReader(file))
+        self.assertEqual([(row['name'], row['compartment']) for row in rows],
+                         [('a', '0'), ('a', '1'), ('b', '0'), ('b', '1'),
+                          ('b', '2'), ('d', '0'), ('d', '1')])
+        expected = Protocol(parameters=self.jobs[1]).generate_model().solve()
+        np.testing.assert_allclose([float(row['AUC']) for row in rows[2:5]],
+                                   expected.metrics()['AUC'])
+
+        # the table reuses the threshold the trajectories were discarded with
+        count, failed = pipeline.run(
+            pipeline.keep_metrics(pipeline.solve(self.jobs), threshold=0.1),
+            [pipeline.MetricsTable(table)])
+        self.assertEqual((count, len(failed)), (4, 1))
+        with open(table, newline='') as file:
+            rows = list(csv.DictReader(file))
+        np.testing.assert_allclose(
+            [float(row['time_above']) for row in rows[2:5]],
+            expected.metrics(0.1)['time_above'])
+        with self.assertRaises(ValueError):
+            pipeline.run(
+                pipeline.keep_metrics(pipeline.solve(self.jobs), 0.1),
+                [pipeline.MetricsTable(table, threshold=0.2)])
+
+    def test_nameless(self):
+        jobs = [collections.UserDict({'CL': 2.0}), {'CL': -1.0},
+                self.jobs[0], {'X': 3.0}]
+        for workers in 1, 2:
+            results = list(pipeline.solve(jobs, workers=workers))
+            self.assertEqual([result.name for result in results],
+                             ['model1_0', 'model1_1', 'a', 'model1_3'])
+            self.assertEqual([result.error is None for result in results],
+                             [True, False, True, True])
+        files = os.path.join(self.tmp_dir, 'files')
+        count, failed = pipeline.run(iter(results),
+                                     [pipeline.SolutionFiles(files)])
+        self.assertEqual((count, len(failed)), (4, 1))
+        self.assertEqual(sorted(os.listdir(files)),
+                         ['a_solution.csv', 'model1_0_solution.csv',
+                          'model1_3_solution.csv'])
+
+    @unittest.skipUnless(importlib.util.find_spec('h5py'),
+                         'h5py is not installed')
+    def test_store(self):
+        path = os.path.join(self.tmp_dir, 'solutions.h5')
+        jobs = [job for job in self.jobs if job['name'] != 'b']
+        count, failed = pipeline.run(pipeline.solve(jobs),
+                                     [pipeline.StoreSink(path)])
+        self.assertEqual((count, len(failed)), (3, 1))
+        with store.SolutionStore(path, 'r') as solutions:
+            self.assertEqual(solutions.names, ['a', 'd'])
+            self.assertEqual(solutions.y.shape, (2, 2, 50))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import os
+import shutil
+import tempfile
+import unittest
+import matplotlib.pyplot as plt
+import numpy as np
+import pkmodel as pk
+from pkmodel import plotting
+
+
+class PlottingTest(unittest.TestCase):
+    """
+    Tests the off-screen and deferred plots in :mod:`plotting`.
+    """
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.protocol = pk.Protocol('pkmodel/tests/test_config_file.txt')
+        self.tmp_dir = tempfile.mkdtemp()
+        os.chdir(self.tmp_dir)
+        self.plot_path = os.path.join('Output', 'solutions_unittest_plot.png')
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmp_dir)
+
+    def test_save_plot(self):
+        plt.close('all')
+        path = os.path.join(self.tmp_dir, 'a.png')
+        plotting.save_plot(path, np.ones((2, 5)), np.linspace(0, 1, 5))
+        self.assertTrue(os.path.isfile(path))
+        self.assertEqual(plt.get_fignums(), [])
+
+    def test_skip_plot(self):
+        self.protocol.params['plot'] = False
+        self.protocol.generate_model().solve().output()
+        self.assertTrue(os.path.isfile(
+            os.path.join('Output', 'solutions_unittest_solution.csv')))
+        self.assertFalse(os.path.isfile(self.plot_path))
+        self.assertEqual(plotting.pending_plots(), [])
+        self.assertEqual(plotting.render_pending(), [])
+        self.assertFalse(os.path.isfile(self.plot_path))
+
+    def test_unknown_plot(self):
+        for plot in 'later', 1:
+            self.protocol.params['plot'] = plot
+            with self.assertRaises(ValueError):
+                self.protocol.generate_model().solve().output()
+        self.assertFalse(os.path.isfile(self.plot_path))
+
+    def test_deferred_plot(self):
+        for output_format in 'csv', 'npz':
+            protocol = pk.Protocol(parameters={
+                'name': output_format, 'plot': 'deferred',
+                'output_format': output_format, 'run_mode': 'save'})
+            protocol.generate_model().solve().output()
+        self.assertEqual(len(plotting.pending_plots()), 2)
+        y, t = plotting.load_saved_solution('./Output/csv_solution.csv')
+        self.assertEqual(y.shape, (2, t.shape[0]))
+        rendered = plotting.render_pending()
+        self.assertEqual(sorted(rendered), ['./Output/csv_plot.png',
+                                            './Output/npz_plot.png'])
+        for path in rendered:
+            self.assertTrue(os.path.isfile(path))
+        self.assertEqual(plotting.pending_plots(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -141,6 +141,31 @@ class ProtocolTest(unittest.TestCase):
                         either intravenous or \
                             subcutaneous' in context.exception)
 
+    def test_graph(self):
+        """
+        Tests loading a graph model and the checks of its parameters.
+        """
+        from pkmodel import Protocol
+        from pkmodel.models import GraphModel
+        protocol = Protocol('pkmodel/tests/test_graph_config_file.txt')
+        model = protocol.generate_model()
+        self.assertIsInstance(model, GraphModel)
+        self.assertEqual(model.compartments,
+                         ['depot', 'central', 'liver', 'muscle'])
+        bad_params = [
+            ({'compartments': []}, TypeError),
+            ({'compartments': {'central': 1}}, TypeError),
+            ({'compartments': {'central': 0.}}, ValueError),
+            ({'flows': {'type': 'clearance'}}, TypeError),
+            ({'flows': [{'type': 'clearance', 'from': 'central',
+                         'value': 1}]}, TypeError),
+            ({'flows': [{'type': 'clearance', 'from': 'central',
+                         'value': -1.}]}, ValueError),
+        ]
+        for params, error in bad_params:
+            with self.assertRaises(error):
+                Protocol(parameters=dict(protocol.params, **params))
+
 
 if __name__ == '__main__':
     unittest.main()
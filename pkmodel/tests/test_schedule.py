@@ -0,0 +1,86 @@
+import unittest
+import numpy as np
+import scipy.linalg
+import pkmodel as pk
+from pkmodel import schedule
+
+
+class ScheduleTest(unittest.TestCase):
+    """
+    Tests the dose schedules and steady states in :mod:`schedule`.
+    """
+    def setUp(self):
+        self.parameters = {'name': 'schedule',
+                           'V_c': 2.0,
+                           'nr_compartments': 1,
+                           'periph_1': (1.0, 1.5),
+                           'CL': 0.5,
+                           'X': 3.0,
+                           'k_a': 2.0,
+                           'run_mode': 'test',
+                           'dose_mode': 'pulse',
+                           'time': 1
+                           }
+        self.models = [pk.models.IntravenousModels(self.parameters),
+                       pk.models.SubcutaneousModels(self.parameters)]
+
+    def test_dose_functions(self):
+        # the dose functions of the models are schedules of infusions
+        for model in self.models:
+            for dose_mode in 'normal', 'pulse':
+                model.dose_mode = dose_mode
+                bounds, inputs = model.dose_segments()
+                on = inputs > 0
+                durations = np.diff(bounds)[on]
+                solution = schedule.solve_schedule(
+                    model, bounds[:-1][on], inputs[on] * durations,
+                    durations, time=1, output_grid=101)
+                expected = model.solve(solver='analytic', output_grid=101)
+                np.testing.assert_allclose(solution.get_solution[0],
+                                           expected.get_solution[0],
+                                           atol=1e-12)
+
+    def test_bolus(self):
+        model = self.models[1]
+        t_eval = np.linspace(0, 10, 11)
+        solution = schedule.solve_schedule(model, [0., 2.5], [1., 2.],
+                                           time=10, output_grid=t_eval)
+        y, t = solution.get_solution
+        self.assertEqual(solution.get_parameters['time'], 10)
+        expected = [scipy.linalg.expm(model.rate_matrix * tau)
+                    @ model.dose_vector
+                    + (2 * scipy.linalg.expm(model.rate_matrix * (tau - 2.5))
+                       @ model.dose_vector if tau >= 2.5 else 0.)
+                    for tau in t]
+        np.testing.assert_allclose(y, np.transpose(expected), atol=1e-12)
+
+    def test_steady_state(self):
+        for model in self.models:
+            for duration in 0., 2.:
+                t_eval = np.linspace(0, 12, 49)
+                steady = schedule.solve_steady_state(
+                    model, 12., duration=duration, output_grid=t_eval)
+                y = steady.get_solution[0]
+                # the last of many repeated doses is at steady state
+                times, amounts, durations = schedule.repeated_doses(
+                    12., 100, model.X, duration)
+                repeated = schedule.solve_schedule(
+                    model, times, amounts, durations, time=1200.,
+                    output_grid=times[-1] + t_eval)
+                np.testing.assert_allclose(repeated.get_solution[0], y,
+                                           atol=1e-9)
+                if duration == 0:
+                    np.testing.assert_allclose(y[:, 0] - y[:, -1],
+                                               model.X * model.dose_vector,
+                                               atol=1e-12)
+        no_clearance = pk.models.GraphModel(dict(
+            self.parameters, compartments={'a': 1.0, 'b': 1.0}, flows=[
+                {'type': 'exchange', 'from': 'a', 'to': 'b', 'value': 1.0}]))
+        with self.assertRaises(ValueError):
+            schedule.solve_steady_state(no_clearance, 12.)
+        with self.assertRaises(ValueError):
+            schedule.solve_steady_state(self.models[0], 12., duration=13.)
+
+
+if __name__ == '__main__':
+    unittest.main()
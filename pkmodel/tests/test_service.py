@@ -0,0 +1,141 @@
+import asyncio
+import concurrent.futures
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from pkmodel import service, Protocol
+
+
+class ServiceTest(unittest.TestCase):
+    """
+    Tests the local job service in :mod:`service`.
+    """
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp_dir = tempfile.mkdtemp()
+        os.chdir(self.tmp_dir)
+        self.jobs = [{'id': 'a', 'parameters': {'name': 'a', 'CL': 2.0}},
+                     {'name': 'b', 'nr_compartments': 2,
+                      'periph_2': [2.0, 1.0]},
+                     {'id': 'c', 'parameters': {'name': 'c', 'CL': -1.0}},
+                     {'id': 'd', 'output': 'files',
+                      'parameters': {'name': 'd', 'plot': False}},
+                     {'id': 'e', 'output': 'files',
+                      'parameters': {'name': 'd_e', 'plot': False}},
+                     {'id': 'f', 'output': 'files',
+                      'parameters': {'name': '../f'}}]
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmp_dir)
+
+    def check_replies(self, replies):
+        replies = {reply['id']: reply for reply in replies}
+        self.assertEqual(set(replies), {'a', 1, 'c', 'd', 'e', 'f'})
+        protocol = Protocol(parameters={'name': 'b', 'nr_compartments': 2,
+                                        'periph_2': (2.0, 1.0)})
+        expected = protocol.generate_model().solve().metrics()
+        np.testing.assert_allclose(replies[1]['metrics']['AUC'],
+                                   expected['AUC'])
+        self.assertTrue(replies['a']['ok'])
+        self.assertFalse(replies['c']['ok'])
+        self.assertIn('CL should be at least 0', replies['c']['error'])
+        self.assertEqual(replies['d']['files'],
+                         [os.path.join('Output', 'd_params.txt'),
+                          os.path.join('Output', 'd_solution.csv')])
+        self.assertEqual(replies['e']['files'],
+                         [os.path.join('Output', 'd_e_params.txt'),
+                          os.path.join('Output', 'd_e_solution.csv')])
+        self.assertIn('path separator', replies['f']['error'])
+        self.assertFalse(os.path.exists('f_params.txt'))
+
+    def test_socket(self):
+        async def main():
+            with service.JobService(workers=2) as job_service:
+                server = await job_service.serve()
+                port = server.sockets[0].getsockname()[1]
+                async with server:
+                    return await service.request(self.jobs, port=port)
+
+        self.check_replies(asyncio.run(main()))
+
+    def test_stdio(self):
+        stdin = io.BytesIO(b''.join(json.dumps(job).encode() + b'\n'
+                                    for job in self.jobs + ['bad']))
+        stdout = io.StringIO()
+
+        async def main():
+            executor = concurrent.futures.ThreadPoolExecutor(2)
+            job_service = service.JobService(executor=executor)
+            with executor, job_service:
+                return await job_service.serve_stdio(stdin, stdout)
+
+        self.assertEqual(asyncio.run(main()), 7)
+        replies = [json.loads(line) for line in stdout.getvalue().splitlines()]
+        bad = [reply for reply in replies if reply['id'] == 6]
+        self.assertIn('JSON object', bad[0]['error'])
+        self.check_replies([reply for reply in replies if reply['id'] != 6])
+
+    def test_backpressure(self):
+        lines = [json.dumps({'name': f'm{i}'}) for i in range(12)]
+        in_flight = []
+        replies = []
+
+        async def main():
+            executor = concurrent.futures.ThreadPoolExecutor(4)
+            with executor, service.JobService(
+                    max_pending=3, executor=executor) as job_service:
+                async def readline():
+                    in_flight.append(12 - len(lines) - len(replies))
+                    return lines.pop() if lines else ''
+
+                async def write(line):
+                    replies.append(json.loads(line))
+
+                return await job_service.process(readline, write)
+
+        self.assertEqual(asyncio.run(main()), 12)
+        self.assertTrue(all(reply['ok'] for reply in replies))
+        self.assertLessEqual(max(in_flight), 3)
+
+    def test_run_failure(self):
+        lines = [json.dumps({'id': i, 'parameters': {'name': f'm{i}'}})
+                 for i in range(4)]
+        replies = []
+
+        async def main():
+            executor = concurrent.futures.ThreadPoolExecutor(2)
+            with executor, service.JobService(
+                    max_pending=2, executor=executor) as job_service:
+                run = job_service.run
+
+                async def failing_run(parameters, output='metrics'):
+                    if parameters['name'] == 'm1':
+                        raise concurrent.futures.BrokenExecutor(
+                            'worker died')
+                    return await run(parameters, output)
+
+                async def readline():
+                    return lines.pop(0) if lines else ''
+
+                async def write(line):
+                    replies.append(json.loads(line))
+
+                job_service.run = failing_run
+                return await job_service.process(readline, write)
+
+        self.assertEqual(asyncio.run(main()), 4)
+        replies = {reply['id']: reply for reply in replies}
+        self.assertEqual(set(replies), {0, 1, 2, 3})
+        self.assertEqual([replies[i]['ok'] for i in range(4)],
+                         [True, False, True, True])
+        self.assertEqual(replies[1]['error'],
+                         'BrokenExecutor: worker died')
+
+
+if __name__ == '__main__':
+    unittest.main()
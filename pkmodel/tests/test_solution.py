@@ -1,4 +1,8 @@
+import contextlib
+import io
+import json
 import unittest
+import numpy as np
 import pkmodel as pk
 import os
 
@@ -36,3 +40,48 @@ class SolutionTest(unittest.TestCase):
         #test if parameter file exists in output directory
         # <--(with correct naming)
         assert os.path.isfile('./Output/solutions_unittest_solution.csv'), True
+
+    def test_metrics(self):
+        parameters = {'name': 'metrics_unittest',
+                      'V_c': 2.0,
+                      'nr_compartments': 1,
+                      'periph_1': (5.0, 3.0),
+                      'CL': 0.5,
+                      'X': 6.0,
+                      'dose_mode': 'pulse',
+                      'run_mode': 'save',
+                      'threshold': 0.5,
+                      'time': 1
+                      }
+        model = pk.models.IntravenousModels(parameters)
+        solution = model.solve()
+        metrics = solution.metrics()
+        self.assertEqual(metrics['AUC'].shape, (2,))
+        self.assertFalse(np.isnan(metrics['time_above'][0]))
+
+        solution = model.solve(metrics_only=True)
+        self.assertTrue(solution.trajectory_discarded)
+        with self.assertRaises(ValueError):
+            solution.get_solution
+        with self.assertRaises(ValueError):
+            solution.metrics(threshold=1.)
+        for key, value in solution.metrics().items():
+            np.testing.assert_allclose(value, metrics[key], rtol=1e-3)
+        solution.output()
+        with open('./Output/metrics_unittest_metrics.json') as file:
+            saved = json.load(file)
+        np.testing.assert_allclose(saved['Cmax'], metrics['Cmax'], rtol=1e-3)
+        self.assertFalse(
+            os.path.isfile('./Output/metrics_unittest_solution.csv'))
+        # saving the parameters leaves those of the model unchanged
+        self.assertEqual(model.parameters['dose_mode'], 'pulse')
+        with open('./Output/metrics_unittest_params.txt') as file:
+            self.assertNotIn('dose_mode', json.load(file))
+
+        model = pk.models.IntravenousModels(dict(parameters, run_mode='test'))
+        stdout = io.StringIO()
+        with self.assertLogs('pkmodel', 'INFO') as logs, \
+                contextlib.redirect_stdout(stdout):
+            self.assertEqual(model.solve(metrics_only=True).output(), [])
+        self.assertIn('metrics of metrics_unittest', logs.output[-1])
+        self.assertEqual(stdout.getvalue(), '')
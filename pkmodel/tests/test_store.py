@@ -0,0 +1,103 @@
+import glob
+import importlib.util
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import pkmodel as pk
+from pkmodel import store, sweep
+
+HAS_PYARROW = importlib.util.find_spec('pyarrow') is not None
+HAS_H5PY = importlib.util.find_spec('h5py') is not None
+
+
+class StoreTest(unittest.TestCase):
+    """
+    Tests the binary output formats in :mod:`store`.
+    """
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.t = np.linspace(0, 1, 5)
+        self.y = np.random.uniform(0, 1, (3, 5))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_npz(self):
+        path = os.path.join(self.tmp_dir, 'a.npz')
+        store.save_npz(path, self.y, self.t)
+        loaded = store.load_solution(path)
+        np.testing.assert_array_equal(loaded['t'], self.t)
+        np.testing.assert_array_equal(loaded['y'], self.y)
+        with self.assertRaises(ValueError):
+            store.load_solution(os.path.join(self.tmp_dir, 'a.csv'))
+
+    @unittest.skipUnless(HAS_PYARROW, 'pyarrow is not installed')
+    def test_parquet(self):
+        path = os.path.join(self.tmp_dir, 'a.parquet')
+        store.save_parquet(path, self.y, self.t)
+        loaded = store.load_solution(path)
+        np.testing.assert_array_equal(loaded['t'], self.t)
+        np.testing.assert_array_equal(loaded['y'], self.y)
+
+    @unittest.skipUnless(HAS_H5PY, 'h5py is not installed')
+    def test_hdf5(self):
+        path = os.path.join(self.tmp_dir, 'a.h5')
+        store.save_hdf5(path, 'first', self.y, self.t)
+        store.save_hdf5(path, 'second', 2 * self.y, self.t)
+        with self.assertRaises(ValueError):
+            store.save_hdf5(path, 'third', self.y[1:], self.t)
+        with store.SolutionStore(path, mode='r') as solutions:
+            self.assertEqual(len(solutions), 2)
+            self.assertEqual(solutions.names, ['first', 'second'])
+            np.testing.assert_array_equal(solutions.t[:], self.t)
+            np.testing.assert_array_equal(solutions.y[1], 2 * self.y)
+
+    @unittest.skipUnless(HAS_PYARROW and HAS_H5PY,
+                         'pyarrow or h5py is not installed')
+    def test_output_formats(self):
+        protocol = pk.Protocol('pkmodel/tests/test_config_file.txt')
+        protocol.params['output_format'] = ['npz', 'parquet', 'hdf5']
+        solution = protocol.generate_model().solve()
+        cwd = os.getcwd()
+        os.chdir(self.tmp_dir)
+        try:
+            solution.output()
+        finally:
+            os.chdir(cwd)
+        y, t = solution.get_solution
+        for extension in 'npz', 'parquet':
+            loaded = store.load_solution(os.path.join(
+                self.tmp_dir, 'Output', f'solutions_unittest_solution.'
+                                        f'{extension}'))
+            np.testing.assert_array_equal(loaded['y'], y)
+        with store.SolutionStore(os.path.join(
+                self.tmp_dir, 'Output', store.STORE_NAME), 'r') as solutions:
+            self.assertEqual(solutions.names, ['solutions_unittest'])
+            np.testing.assert_array_equal(solutions.y[0], y)
+        with self.assertRaises(ValueError):
+            solution.save_solution(self.tmp_dir, 'a', 'random')
+
+    @unittest.skipUnless(HAS_H5PY, 'h5py is not installed')
+    def test_hdf5_sweep(self):
+        jobs = [{'name': f'm{i}', 'CL': 1.0 + i, 'output_format': 'hdf5',
+                 'plot': False} for i in range(8)]
+        cwd = os.getcwd()
+        os.chdir(self.tmp_dir)
+        try:
+            results = list(sweep.run_sweep(jobs, workers=2))
+        finally:
+            os.chdir(cwd)
+        self.assertEqual([result.error for result in results], [None] * 8)
+        paths = glob.glob(os.path.join(self.tmp_dir, 'Output', '*.h5'))
+        self.assertNotIn(store.STORE_NAME, map(os.path.basename, paths))
+        names = []
+        for path in paths:
+            with store.SolutionStore(path, 'r') as solutions:
+                names += solutions.names
+        self.assertEqual(sorted(names), [f'm{i}' for i in range(8)])
+
+
+if __name__ == '__main__':
+    unittest.main()
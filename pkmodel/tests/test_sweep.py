@@ -0,0 +1,73 @@
+import os
+import shutil
+import tempfile
+import unittest
+from pkmodel import sweep
+
+
+class SweepTest(unittest.TestCase):
+    """
+    Tests the sweep runner in :mod:`sweep`.
+    """
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmp_dir = tempfile.mkdtemp()
+        shutil.copy('pkmodel/tests/test_config_file.txt',
+                    os.path.join(self.tmp_dir, 'a.txt'))
+        shutil.copy('pkmodel/tests/testarray2.txt',
+                    os.path.join(self.tmp_dir, 'b.txt'))
+        with open(os.path.join(self.tmp_dir, 'c.txt'), 'w') as file:
+            file.write("{'name': 'bad', 'CL': -1.0}")
+        os.chdir(self.tmp_dir)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmp_dir)
+
+    def test_config_paths(self):
+        self.assertEqual(sweep.config_paths('.'),
+                         ['./a.txt', './b.txt', './c.txt'])
+        self.assertEqual(sweep.config_paths('[ab].txt'), ['a.txt', 'b.txt'])
+
+    def test_config_jobs(self):
+        # config files without a name, holding one or several protocols
+        with open('d.json', 'w') as file:
+            file.write('{"CL": 2.0}')
+        with open('e.json', 'w') as file:
+            file.write('[{"X": 2.0}, {"name": "e1"}]')
+        paths = ['c.txt', 'd.json', 'e.json', 'missing.txt']
+        jobs = list(sweep.config_jobs(paths))
+        self.assertEqual([sweep.job_label(job) for job in jobs],
+                         ['bad (c.txt)', 'd.json', 'e.json[0]',
+                          'e1 (e.json[1])', 'missing.txt'])
+        self.assertEqual(jobs[1], sweep.ConfigJob('d.json', None,
+                                                  {'CL': 2.0}))
+        results = list(sweep.run_sweep(jobs, workers=1))
+        self.assertEqual([result.error is None for result in results],
+                         [False, True, True, True, False])
+        self.assertEqual(sweep.job_label({'CL': 1.0}), 'model1')
+
+    def test_parameter_grid(self):
+        jobs = list(sweep.parameter_grid({'name': 'm', 'X': 1.0},
+                                         {'CL': [1.0, 2.0], 'V_c': [3.0]}))
+        self.assertEqual(jobs, [{'name': 'm_0', 'X': 1.0, 'CL': 1.0,
+                                 'V_c': 3.0},
+                                {'name': 'm_1', 'X': 1.0, 'CL': 2.0,
+                                 'V_c': 3.0}])
+
+    def test_run_sweep(self):
+        jobs = sweep.config_paths('.') + [{'name': 'grid_0', 'CL': 2.0}]
+        for workers in 1, 2:
+            results = list(sweep.run_sweep(jobs, workers=workers))
+            self.assertEqual([result.job for result in results], jobs)
+            total, failed, elapsed = sweep.summarise(results)
+            self.assertEqual(total, 4)
+            self.assertEqual([result.job for result in failed], ['./c.txt'])
+            self.assertTrue('CL should be at least 0' in failed[0].error)
+            self.assertGreater(elapsed, 0.)
+        for name in 'solutions_unittest', 'model_test_2', 'grid_0':
+            self.assertTrue(os.path.isfile(f'./Output/{name}_solution.csv'))
+
+
+if __name__ == '__main__':
+    unittest.main()
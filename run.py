@@ -2,17 +2,47 @@
 Authors: SABS R3 Group 2
 20.10.2021
 
-usage: python run.py $PATH_TO_CONFIG$
+usage: python run.py $PATH_TO_CONFIG$ [--stats] [--log]
+                     [--trace $PATH_TO_JSONL$] [--profile $PATH_TO_PROF$]
 """
 
+import argparse
+import logging
+
 import pkmodel as pk
-import sys
+from pkmodel import instrumentation
 
-arg = sys.argv
-protocol = pk.Protocol(arg[1])
-model = protocol.generate_model()
-x = model.solve()
+parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+parser.add_argument('config', help='path of the config file')
+parser.add_argument('--stats', action='store_true',
+                    help='print the time of each stage and the solver '
+                         'counters')
+parser.add_argument('--log', action='store_true',
+                    help='log each stage and the solver counters')
+parser.add_argument('--trace',
+                    help='append each stage and the solver counters to a '
+                         'JSON lines file')
+parser.add_argument('--profile',
+                    help='dump the cProfile statistics of the run to a file')
+args = parser.parse_args()
 
-x.output()
+sinks = []
+if args.log:
+    logging.basicConfig(level=logging.INFO)
+    sinks.append(instrumentation.LogSink())
+if args.trace:
+    sinks.append(instrumentation.JsonLinesSink(args.trace))
+if args.profile:
+    sinks.append(instrumentation.ProfileSink(args.profile))
 
+with instrumentation.Recorder(sinks) as recorder:
+    with instrumentation.span('protocol'):
+        protocol = pk.Protocol(args.config)
+    with instrumentation.span('generate_model'):
+        model = protocol.generate_model()
+    x = model.solve()
+    with instrumentation.span('output'):
+        x.output()
 
+if args.stats:
+    print(instrumentation.format_summary(recorder.summary()))
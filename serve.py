@@ -0,0 +1,56 @@
+"""Serve file for running 1st order linear ODE pharmokinetic models as a
+local job service.
+
+usage: python serve.py [--port P] [--workers N] [--max-pending M]
+       (listens on localhost for JSON lines of protocol parameters, and
+       replies with a JSON line of metrics for each job as it completes)
+       python serve.py --stdio
+       (reads the requests from stdin and writes the replies to stdout)
+"""
+
+import argparse
+import asyncio
+import sys
+
+from pkmodel import service
+
+
+async def serve(args, job_service):
+    """Serves requests until the end of stdin, or until interrupted"""
+    if args.stdio:
+        await job_service.serve_stdio()
+        return
+    server = await job_service.serve(args.host, args.port)
+    host, port = server.sockets[0].getsockname()[:2]
+    print('listening on {0}:{1}'.format(host, port), file=sys.stderr,
+          flush=True)
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    """Runs the job service given on the command line"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--stdio', action='store_true',
+                        help='read requests from stdin instead of a socket')
+    parser.add_argument('--host', default=service.HOST,
+                        help='host to listen on (default: localhost only)')
+    parser.add_argument('--port', type=int, default=0,
+                        help='port to listen on (default: any free port)')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='number of worker processes (default: CPU count)')
+    parser.add_argument('--max-pending', type=int, default=None,
+                        help='number of jobs in flight above which requests '
+                             'are held back (default: twice the workers)')
+    args = parser.parse_args()
+
+    with service.JobService(args.workers, args.max_pending) as job_service:
+        try:
+            asyncio.run(serve(args, job_service))
+        except KeyboardInterrupt:
+            pass
+
+
+# worker processes may import this file, so only serve when executed
+if __name__ == '__main__':
+    main()
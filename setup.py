@@ -80,6 +80,20 @@ setup(
             # Flake8 for code style checking
             'flake8>=3',
         ],
+        'io': [
+            # Parquet and HDF5 solution output formats
+            'pyarrow',
+            'h5py',
+        ],
+        'jit': [
+            # Compiled numeric solver
+            'numba',
+        ],
+        'config': [
+            # YAML config files, and TOML before Python 3.11
+            'pyyaml',
+            'tomli; python_version < "3.11"',
+        ],
     },
 
 )
@@ -0,0 +1,71 @@
+"""Sweep file for running many 1st order linear ODE pharmokinetic models
+across a pool of worker processes.
+
+usage: python sweep.py $CONFIG_DIR_OR_GLOB$ [--workers N] [--chunksize C]
+       (config files may be JSON, TOML, YAML or Python dictionaries, and
+       hold many protocols each)
+       python sweep.py $PATH_TO_BASE_CONFIG$ --grid $PATH_TO_GRID$
+       add --plots to render deferred plots once every job has finished
+       add --stats to print the time of each stage summed over all jobs
+"""
+
+import argparse
+import sys
+
+import pkmodel as pk
+from pkmodel import instrumentation, plotting, sweep
+
+
+def main():
+    """Runs the sweep given on the command line, printing the outcome of each
+    job as it completes. Exits with status 1 if any job failed.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('source',
+                        help='directory or glob of config files, or the base '
+                             'config file of a parameter grid')
+    parser.add_argument('--grid',
+                        help='file mapping parameter names to lists of values')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='number of worker processes (default: CPU count)')
+    parser.add_argument('--chunksize', type=int, default=1,
+                        help='number of jobs sent to a worker at once')
+    parser.add_argument('--stats', action='store_true',
+                        help='print the time of each stage and the solver '
+                             'counters, summed over all jobs')
+    parser.add_argument('--plots', action='store_true',
+                        help='render the plots of models run with '
+                             'plot: deferred that were not rendered yet')
+    args = parser.parse_args()
+
+    if args.grid:
+        base = pk.Protocol(args.source).params
+        jobs = sweep.parameter_grid(base, sweep.read_grid(args.grid))
+    else:
+        jobs = sweep.config_jobs(sweep.config_paths(args.source))
+
+    results = []
+    for result in sweep.run_sweep(jobs, args.workers, args.chunksize,
+                                  args.stats):
+        job = sweep.job_label(result.job)
+        if result.error is None:
+            print('ok      {0:8.3f}s  {1}'.format(result.elapsed, job))
+        else:
+            print('FAILED  {0:8.3f}s  {1}: {2}'.format(result.elapsed, job,
+                                                       result.error))
+        results.append(result)
+
+    total, failed, elapsed = sweep.summarise(results)
+    print('{0} jobs, {1} failed, {2:.3f}s total job time'.format(
+        total, len(failed), elapsed))
+    if args.stats:
+        print(instrumentation.format_summary(sweep.aggregate_stats(results)))
+    if args.plots:
+        rendered = plotting.render_pending(workers=args.workers)
+        print('{0} plots rendered'.format(len(rendered)))
+    sys.exit(1 if failed else 0)
+
+
+# worker processes may import this file, so only run the sweep when executed
+if __name__ == '__main__':
+    main()